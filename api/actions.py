@@ -0,0 +1,169 @@
+"""
+Declared output shapes for Gemini.
+
+Chat: the five intents are function declarations (ACTION_TOOLS). Gemini
+answers either with plain text (questions, clarifications, chit-chat) or with
+a function call whose arguments already follow the declared schema, so there
+is no fenced JSON to detect or regex away. action_from_call() turns a call
+into the intent dict apply_ai_actions takes, checking required fields, enums
+and the YYYY-MM-DDTHH:MM time format; a call that still doesn't fit raises
+ActionError (a 400 with the reason, instead of a 500 and a retry).
+
+Classification: CLASSIFICATION_CONFIG constrains the reply to
+{"results": [{"id", "isFlexible"}]} JSON (response_schema).
+"""
+from datetime import datetime
+
+from api import metrics
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M"
+TIME_FIELDS = ("startTime", "endTime", "dueDate")
+
+_TIME = {"type": "string", "description": "YYYY-MM-DDTHH:MM, 24-hour, user's local time"}
+_TIME_OR_NULL = {**_TIME, "nullable": True}
+_TASK_ID = {"type": "string", "description": "The task's id (i) from the task list"}
+
+ACTION_DECLARATIONS = [
+    {
+        "name": "reschedule",
+        "description": "Move an existing task to a new time.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "id": _TASK_ID,
+                "startTime": _TIME,
+                "endTime": _TIME,
+                "dueDate": _TIME,
+            },
+            "required": ["id", "startTime", "endTime"],
+        },
+    },
+    {
+        "name": "add",
+        "description": "Create a new task. Ask first if the title or timing is unclear.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "description": {"type": "string"},
+                "startTime": _TIME_OR_NULL,
+                "endTime": _TIME_OR_NULL,
+                "dueDate": _TIME_OR_NULL,
+                "estimatedMinutes": {"type": "integer"},
+                "isFlexible": {"type": "boolean"},
+                "priority": {"type": "string", "enum": ["low", "med", "high"]},
+            },
+            "required": ["title"],
+        },
+    },
+    {
+        "name": "remove",
+        "description": "Delete an existing task.",
+        "parameters": {
+            "type": "object",
+            "properties": {"id": _TASK_ID},
+            "required": ["id"],
+        },
+    },
+    {
+        "name": "summarize",
+        "description": "Summarize the user's recent task changes.",
+        "parameters": {
+            "type": "object",
+            "properties": {"summary": {"type": "string"}},
+            "required": ["summary"],
+        },
+    },
+    {
+        "name": "autoschedule",
+        "description": (
+            "Auto-schedule the user's flexible tasks. The server computes the time "
+            "slots; only give a one-line summary."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {"summary": {"type": "string"}},
+            "required": ["summary"],
+        },
+    },
+]
+
+ACTIONS = {d["name"]: d["parameters"] for d in ACTION_DECLARATIONS}
+ACTION_TOOLS = [{"function_declarations": ACTION_DECLARATIONS}]
+ACTION_TOOL_CONFIG = {"function_calling_config": {"mode": "AUTO"}}
+
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "isFlexible": {"type": "boolean"}},
+                "required": ["id", "isFlexible"],
+            },
+        }
+    },
+    "required": ["results"],
+}
+CLASSIFICATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": CLASSIFICATION_SCHEMA,
+}
+
+
+class ActionError(ValueError):
+    """A function call that doesn't match its declaration."""
+
+
+def normalize_time(value: str) -> str:
+    """Any ISO8601 date/datetime -> YYYY-MM-DDTHH:MM (offsets dropped, like stored times)."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime(TIME_FORMAT)
+    except (AttributeError, ValueError):
+        raise ActionError(f"invalid time {value!r}, expected YYYY-MM-DDTHH:MM")
+
+
+@metrics.timed("parse")
+def action_from_call(name: str, args) -> dict:
+    """Function call (name, args mapping) -> validated {"intent": name, ...}."""
+    schema = ACTIONS.get(name)
+    if schema is None:
+        raise ActionError(f"unknown action {name!r}")
+    args = dict(args or {})
+    properties = schema["properties"]
+
+    missing = [key for key in schema["required"] if args.get(key) in (None, "")]
+    if missing:
+        raise ActionError(f"{name}: missing {', '.join(missing)}")
+
+    action = {"intent": name}
+    for key, value in args.items():
+        spec = properties.get(key)
+        if spec is None:
+            continue  # undeclared extras are dropped
+        if value is None:
+            if not spec.get("nullable"):
+                continue
+        elif key in TIME_FIELDS:
+            value = normalize_time(value)
+        elif spec["type"] == "integer":
+            value = int(value)  # proto Struct numbers arrive as floats
+        elif spec["type"] == "boolean":
+            value = bool(value)
+        elif "enum" in spec and value not in spec["enum"]:
+            raise ActionError(f"{name}: {key} must be one of {', '.join(spec['enum'])}")
+        action[key] = value
+    return action
+
+
+def reply_parts(parts):
+    """Content parts of a (chunk of a) reply -> (text, [function call, ...])."""
+    text = []
+    calls = []
+    for part in parts:
+        if "function_call" in part:
+            calls.append(part.function_call)
+        elif part.text:
+            text.append(part.text)
+    return "".join(text), calls
@@ -0,0 +1,407 @@
+"""
+ASGI serving mode.
+
+    hypercorn api.asgi:app --bind 0.0.0.0:5000
+    python -m api.asgi
+
+The routes that spend their time waiting on the network run as async Quart
+handlers on one event loop:
+
+  /chat, /chatStream  Gemini via send_message_async, tasks via AsyncMongoClient
+  /getTasks           AsyncMongoClient
+  /calendarToken      Google token exchange via httpx.AsyncClient
+
+so a single process holds hundreds of in-flight chats instead of one per
+worker thread. Every other route (and every CORS preflight) is passed to the
+unchanged Flask app from api/backend.py, which stays the compatibility mode
+(`python -m api.backend`, Vercel). Both apps share validation, response
+helpers and apply_ai_actions; action writes go through TaskStore in a worker
+thread so versioning/tombstones keep a single implementation. Canvas/Google
+ingestion stays on the background job pool, off the request path.
+"""
+import asyncio
+import functools
+import os
+import time
+
+import flask
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+from quart import Quart, Response, g, request
+
+from api import backend, metrics
+from api.backend import (
+    RETURNS,
+    apply_ai_actions,
+    google_token_fields,
+    google_token_request,
+    read_task_query,
+    sse,
+    tasks_response,
+)
+from api.actions import ActionError
+from api.context import CONTEXT_TOKEN_BUDGET, build_context, context_window
+from api.functions import ask_gemini_async, ask_gemini_stream_async
+from api.logs import get_logger
+from api.recurrence import (
+    SERIES_KEY_PROJECTION,
+    SERIES_PROJECTION,
+    SERIES_QUERY,
+    expand,
+    occurrences,
+    series_docs_query,
+    series_keys,
+)
+from api.serialize import compress, make_json_provider, pick_encoding, COMPRESS_MIN_BYTES, COMPRESSIBLE
+from api.storage import CLIENT_PROJECTION, AsyncTaskStore, delta_query, etag_matches, tasks_etag
+
+load_dotenv()
+
+ASYNC_ROUTES = {"/chat", "/chatStream", "/getTasks", "/calendarToken"}
+HTTP_TIMEOUT = 10
+
+log = get_logger("api.asgi")
+
+quart_app = Quart(__name__)
+quart_app.json = make_json_provider(quart_app)
+
+mongo = None
+users_col = None
+task_store = None
+http = None
+
+
+@quart_app.before_serving
+async def open_clients():
+    # created on the serving loop; AsyncMongoClient binds to it on first use
+    global mongo, users_col, task_store, http
+    mongo = AsyncMongoClient(os.getenv("MONGODB_URI"), event_listeners=[metrics.mongo_listener])
+    db = mongo[os.getenv("MONGODB_DB")]
+    users_col = db["users"]
+    task_store = AsyncTaskStore(db)
+    http = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+
+
+@quart_app.after_serving
+async def close_clients():
+    await http.aclose()
+    await mongo.close()
+
+
+def flask_compat(handler):
+    """
+    Runs an async handler inside a Flask app context, so the shared RETURNS
+    helpers (flask.jsonify) work unchanged, and converts the Flask response
+    they return. Pushing an app context does no I/O.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with backend.app.app_context():
+            result = await handler(*args, **kwargs)
+            first = result[0] if isinstance(result, tuple) else result
+            if isinstance(first, flask.Response):
+                resp = backend.app.make_response(result)
+                return Response(
+                    resp.get_data(), status=resp.status_code, headers=dict(resp.headers)
+                )
+        return result
+
+    return wrapper
+
+
+def run_actions(uoid, actions, raw_tasks):
+    """apply_ai_actions (sync TaskStore writes) for asyncio.to_thread."""
+    with backend.app.app_context():
+        resp, status = apply_ai_actions(uoid, actions, raw_tasks)
+        return resp.get_json(), status
+
+
+async def load_chat_context(uoid, conversation):
+    raw_tasks = expand(await task_store.find(uoid), *context_window())
+    budget = await asyncio.to_thread(
+        backend.llm_usage.context_budget, uoid, CONTEXT_TOKEN_BUDGET
+    )
+    with metrics.stage("context"):
+        context, usage = build_context(raw_tasks, conversation, budget=budget)
+    g.context_tokens = usage["tokens"]
+    log.info("chat context", extra=usage)
+    return raw_tasks, context
+
+
+async def read_chat_request():
+    """-> (uoid, conversation, None) or (None, None, RETURNS error)."""
+    payload = await request.get_json()
+    conversation = payload["convo"]
+    try:
+        uoid = ObjectId(payload["userID"])
+    except Exception:
+        return None, None, RETURNS.ERRORS.bad_userID()
+    if not await users_col.find_one({"_id": uoid}, {"_id": 1}):
+        return None, None, RETURNS.ERRORS.bad_login()
+    backend.sync_scheduler.touch(uoid)
+    return uoid, conversation, None
+
+
+# ---------- CORS / compression (the Flask app does this via flask-cors / serialize) ----------
+@quart_app.after_request
+async def add_headers(response):
+    origin = request.headers.get("Origin")
+    if origin in backend.CORS_ORIGINS:
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        response.headers["Access-Control-Expose-Headers"] = ", ".join(backend.CORS_EXPOSE_HEADERS)
+        response.vary.add("Origin")
+    if "context_tokens" in g:
+        response.headers["X-Context-Tokens"] = str(g.context_tokens)
+
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE:
+        return response
+    if "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = pick_encoding(request.headers.get("Accept-Encoding"))
+    data = await response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(await asyncio.to_thread(compress, data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag")
+    if etag and etag.endswith('"'):
+        response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+    return response
+
+
+async def load_occurrences(uoid, params):
+    """backend.load_occurrences on the async store."""
+    if params["since"] is None:
+        docs = await task_store.find(uoid, SERIES_QUERY, SERIES_PROJECTION)
+        return occurrences(docs, *params["window"]), None
+    changed = await task_store.find(
+        uoid, {**SERIES_QUERY, **delta_query(params["since"])}, SERIES_KEY_PROJECTION
+    )
+    keys = series_keys(changed)
+    if not keys:
+        return [], []
+    docs = await task_store.find(uoid, series_docs_query(keys), SERIES_PROJECTION)
+    return occurrences(docs, *params["window"]), [t["_id"] for t in docs if t.get("recurrence")]
+
+
+# ---------- Routes ----------
+@quart_app.post("/getTasks")
+@flask_compat
+async def getTasks():
+    try:
+        params, error = read_task_query(await request.get_json(force=True))
+        if error:
+            return error
+        uoid = params["uoid"]
+
+        version, settled = await task_store.versions(uoid)
+        if version is None:
+            return RETURNS.ERRORS.bad_login()
+        backend.sync_scheduler.touch(uoid)
+
+        etag = tasks_etag(version, *params["key"])
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return RETURNS.SUCCESS.not_modified(etag)
+
+        docs, next_cursor = await task_store.page(
+            uoid, params["query"], CLIENT_PROJECTION, after=params["after"], limit=params["limit"]
+        )
+        removed = series = None
+        if params["after"] is None:
+            rows, series = await load_occurrences(uoid, params)
+            docs = docs + rows
+            if params["since"] is not None:
+                removed = await task_store.removed_since(uoid, params["since"])
+        return tasks_response(params, settled, etag, docs, next_cursor, removed, series)
+
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+@quart_app.post("/calendarToken")
+@flask_compat
+async def auth_google():
+    try:
+        payload = await request.get_json(force=True)
+        code = payload["code"]
+        userID = payload["userID"]
+
+        with metrics.stage("google.token"):
+            tr = await http.post(backend.TOKEN_URL, data=google_token_request(code))
+        tr.raise_for_status()
+        update_fields = google_token_fields(tr.json())
+
+        try:
+            oid = ObjectId(userID)
+        except Exception:
+            return {"status": "ERROR", "message": "invalid userID"}, 400
+
+        res = await users_col.update_one({"_id": oid}, {"$set": update_fields})
+        if res.matched_count == 0:
+            return RETURNS.ERRORS.bad_login()
+
+        jobID = await asyncio.to_thread(
+            backend.job_runner.enqueue, "google_sync", oid, {"userID": userID}
+        )
+        return {
+            "status": "SUCCESS",
+            "message": "GOOGLE TOKENS SAVED",
+            "jobID": jobID,
+            "expiresAt": update_fields["google.expires_at"],
+            "hasRefreshToken": "google.refresh_token" in update_fields,
+        }, 202
+
+    except httpx.HTTPStatusError as e:
+        log.warning("google token exchange failed", extra={"error": e.response.text})
+        return {"status": "ERROR", "message": "GOOGLE TOKEN EXCHANGE FAILED"}, 400
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+@quart_app.post("/chat")
+@flask_compat
+async def chat():
+    try:
+        uoid, conversation, error = await read_chat_request()
+        if error:
+            return error
+
+        raw_tasks, context = await load_chat_context(uoid, conversation)
+        meter = backend.llm_usage.meter(uoid)
+        try:
+            text, actions = await ask_gemini_async(conversation, context, meter)
+
+            log.debug("gemini reply", extra={"reply": text, "actions": actions})
+            if actions:
+                return await asyncio.to_thread(run_actions, uoid, actions, raw_tasks)
+            metrics.set_intent("reply")
+            return RETURNS.SUCCESS.return_chat_message(text)
+        except ActionError as e:
+            return RETURNS.ERRORS.bad_request(str(e))
+        finally:
+            meter.commit()
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+@quart_app.post("/chatStream")
+@flask_compat
+async def chatStream():
+    """Same SSE contract as the Flask /chatStream."""
+    try:
+        uoid, conversation, error = await read_chat_request()
+        if error:
+            return error
+        raw_tasks, context = await load_chat_context(uoid, conversation)
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+    async def events():
+        parts, actions = [], []
+        meter = backend.llm_usage.meter(uoid)
+        try:
+            async for kind, value in ask_gemini_stream_async(conversation, context, meter):
+                if kind == "text":
+                    parts.append(value)
+                    yield sse("chunk", {"text": value})
+                else:
+                    actions.append(value)
+
+            if actions:
+                body, status = await asyncio.to_thread(run_actions, uoid, actions, raw_tasks)
+                yield sse("action", {**body, "httpStatus": status})
+            else:
+                metrics.set_intent("reply")
+                yield sse("done", {"chatMessage": "".join(parts)})
+        except ActionError as e:
+            body = {"status": "ERROR", "message": str(e), "ERROR": "bad_request"}
+            yield sse("action", {**body, "httpStatus": 400})
+        except Exception:
+            log.exception("chatStream failed")
+            yield sse("error", {"message": "INTERNAL SERVER ERROR"})
+        finally:
+            meter.commit()
+
+    response = Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.timeout = None  # streams for as long as Gemini takes
+    return response
+
+
+# ---------- ASGI entry point ----------
+def closing(wsgi_app):
+    """
+    WsgiToAsgi never calls close() on the WSGI response iterable; Flask runs
+    call_on_close callbacks (request metrics) from it, so close it here.
+    """
+
+    def run(environ, start_response):
+        body = wsgi_app(environ, start_response)
+        try:
+            for chunk in body:  # not `yield from`, which would close body itself
+                yield chunk
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+    return run
+
+
+flask_asgi = WsgiToAsgi(closing(backend.app))  # runs each request in a worker thread
+
+
+async def timed_quart(scope, receive, send):
+    """
+    Quart request with horai_request_seconds recorded here rather than in a
+    hook, so /chatStream counts until its last event. (Flask records its own.)
+    """
+    labels = metrics.begin(scope["path"])
+    started = time.perf_counter()
+    status = 500
+
+    async def send_status(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        await send(message)
+
+    try:
+        await quart_app(scope, receive, send_status)
+    finally:
+        metrics.observe_request(labels, status, time.perf_counter() - started)
+
+
+async def app(scope, receive, send):
+    """Async routes to Quart, everything else (incl. OPTIONS preflights) to Flask."""
+    if scope["type"] == "lifespan":
+        await quart_app(scope, receive, send)
+    elif (
+        scope["type"] == "http"
+        and scope["path"] in ASYNC_ROUTES
+        and scope["method"] != "OPTIONS"
+    ):
+        await timed_quart(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
+
+
+if __name__ == "__main__":
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.getenv("BIND", "0.0.0.0:5000")]
+    asyncio.run(serve(app, config))
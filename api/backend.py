@@ -1,8 +1,9 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from uuid import uuid4
 from dotenv import load_dotenv
 import hashlib
 import os
+import time
 from datetime import datetime, timezone, timedelta
 import datetime as DATE
 import requests
@@ -18,36 +19,79 @@ from api.functions import (
     now_iso,
     hashStr,
     as_object_id,
-    upsert_google_events_embedded,
-    list_events_with_google_client,
+    sync_google_calendar,
     getAllCanvasTasks,
-    upsert_canvas_tasks_embedded,
+    merge_canvas_tasks,
     ask_gemini,
-    parse_ai_response,
+    ask_gemini_stream,
     run_batch_classification
 )
+from api import metrics
+from api.actions import ActionError
+from api.logs import get_logger
+from api.scheduler import plan_autoschedule, format_time
+from api.canvas import due_window
+from api.jobs import JobRunner
+from api.classifier import FlexibilityClassifier
+from api.context import CONTEXT_TOKEN_BUDGET, build_context, context_window
+from api.intervals import IntervalIndexCache, find_conflicts
+from api.recurrence import (
+    PLAIN_TASKS,
+    SERIES_KEY_PROJECTION,
+    SERIES_PROJECTION,
+    SERIES_QUERY,
+    default_range,
+    expand,
+    occurrences,
+    parse_occurrence_id,
+    series_docs_query,
+    series_keys,
+)
+from api.serialize import make_json_provider, compress_response
+from api.storage import (
+    TaskStore,
+    CLIENT_PROJECTION,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    normalize_bound,
+    window_query,
+    task_to_client,
+    tasks_etag,
+    etag_matches,
+    encode_sync_cursor,
+    decode_sync_cursor,
+    delta_query,
+    tasks_to_columns,
+)
+from api.google_push import PushChannels
+from api.sync_scheduler import SyncScheduler, job_stage
+from api.sync_scheduler import ENABLED as SYNC_SCHEDULER_ENABLED
+from api.usage import UsageLedger
 # from bson import
 
 # import geminiChat  # NOTE: THIS IS THE PYTHON FILE THAT HANDLES GEMINI COMMUNICATION
 
 load_dotenv()
 
+log = get_logger("api.backend")
+
 app = Flask(__name__)
+app.json = make_json_provider(app)
+app.after_request(compress_response)
+
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "https://horai-dun.vercel.app",  # if you also call from this origin
+]
+CORS_EXPOSE_HEADERS = ["Content-Type", "X-Context-Tokens", "ETag"]
 
 CORS(
     app,
-    resources={
-        r"/*": {
-            "origins": [
-                "http://localhost:3000",
-                "https://horai-dun.vercel.app",  # if you also call from this origin
-            ]
-        }
-    },
+    resources={r"/*": {"origins": CORS_ORIGINS}},
     supports_credentials=True,  # needed if you use cookies or credentials: 'include'
     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
-    expose_headers=["Content-Type"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match"],
+    expose_headers=CORS_EXPOSE_HEADERS,
     max_age=86400,
 )
 
@@ -56,9 +100,27 @@ DB_NAME = os.getenv("MONGODB_DB")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
-mongo = MongoClient(MONGODB_URI)
+
+def stored_google_tokens(google: dict) -> dict:
+    """Token dict for the Google client calls from a users.google doc."""
+    return {
+        "access_token": google["access_token"],
+        "refresh_token": google.get("refresh_token"),
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+    }
+
+
+mongo = MongoClient(MONGODB_URI, event_listeners=[metrics.mongo_listener])
 db = mongo[DB_NAME]
 users_col = db["users"]
+task_store = TaskStore(db)
+job_runner = JobRunner(db)
+llm_usage = UsageLedger(db)
+classifier = FlexibilityClassifier(db, usage=llm_usage)
+fixed_intervals = IntervalIndexCache(task_store)
+sync_scheduler = SyncScheduler(users_col)
+push_channels = PushChannels(users_col, stored_google_tokens)
 """
 users {
   _id: ObjectId,
@@ -66,37 +128,26 @@ users {
   hashedPass: string,
   google: {...},
   canvas: {...},
+  taskVersion: int,   // bumped by every task write (TaskStore), feeds /getTasks ETags
   createdAt: ISO8601,
-  updatedAt: ISO8601,
-
-  tasks: [  // embedded array
-    {
-      _id: ObjectId,            // per-task id you return to the client
-      source: "manual|google|canvas|ai",
-      externalId: "string|null",// e.g., Google event id for de-dupe
-      title: string,
-      description: string,
-      startTime: ISO8601|null,
-      endTime: ISO8601|null,
-      dueDate: ISO8601|null,
-      estimatedMinutes: number,
-      minutesTaken: number,
-      isFlexible: bool,
-      status: "todo|in_progress|done",
-      priority: "low|med|high",
-      createdAt: ISO8601,
-      updatedAt: ISO8601
-    }
-  ]
+  updatedAt: ISO8601
 }
 
+Tasks live in their own collection, see api/storage.py.
+(python -m api.migrate_tasks moves legacy embedded users.tasks arrays over.)
 """
 
-# Ensure email uniqueness
+# Ensure email uniqueness + task indexes
 try:
     users_col.create_index([("email", ASCENDING)], unique=True)
+    task_store.ensure_indexes()
+    job_runner.ensure_indexes()
+    classifier.ensure_indexes()
+    llm_usage.ensure_indexes()
+    sync_scheduler.ensure_indexes()
+    push_channels.ensure_indexes()
 except Exception as e:
-    print("Index creation warning:", e)
+    log.warning("index creation failed", extra={"error": str(e)})
 
 
 # ---------- Response helpers ----------
@@ -152,6 +203,27 @@ class RETURNS:
                 }
             ), 500
 
+        @staticmethod
+        def sync_expired():
+            return jsonify(
+                {
+                    "status": "ERROR",
+                    "message": "SYNC CURSOR EXPIRED, FETCH ALL TASKS",
+                    "ERROR": "sync_cursor_expired",
+                }
+            ), 410
+
+        @staticmethod
+        def schedule_conflict(conflicts: list):
+            return jsonify(
+                {
+                    "status": "ERROR",
+                    "message": "SCHEDULE CONFLICT",
+                    "ERROR": "schedule_conflict",
+                    "conflicts": conflicts,
+                }
+            ), 409
+
         @staticmethod
         def bad_request(msg="BAD REQUEST"):
             return jsonify(
@@ -202,6 +274,17 @@ class RETURNS:
                 }
             ), 201
 
+        @staticmethod
+        def return_job_id(jobID: str, **extra):
+            return jsonify(
+                {
+                    "status": "ACCEPTED",
+                    "jobID": jobID,
+                    "message": "JOB QUEUED",
+                    **extra,
+                }
+            ), 202
+
         @staticmethod
         def return_user_id(userID: str):
             return jsonify(
@@ -209,14 +292,130 @@ class RETURNS:
             ), 201
 
         @staticmethod
-        def return_tasks(tasks: list):
+        def return_tasks(tasks: list, nextCursor: str = None, etag: str = None, **extra):
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"} if etag else {}
             return jsonify(
                 {
                     "status": "SUCCES",
                     "tasks": tasks,
+                    "nextCursor": nextCursor,
                     "message": "RETURNED ALL USER TASKS",
+                    **extra,
                 }
-            ), 200
+            ), 200, headers
+
+        @staticmethod
+        def not_modified(etag: str):
+            return Response(
+                status=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+            )
+
+
+@app.after_request
+def add_context_usage(response):
+    # set by /chat so clients and logs can see the prompt cost of each request
+    if "context_tokens" in g:
+        response.headers["X-Context-Tokens"] = str(g.context_tokens)
+    return response
+
+
+# ---------- Metrics ----------
+@app.before_request
+def start_request_metrics():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics = metrics.begin(rule)
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # on close, so streamed responses (/chatStream) count until the last event
+    scope, started, status = g.metrics, g.started, response.status_code
+    response.call_on_close(
+        lambda: metrics.observe_request(scope, status, time.perf_counter() - started)
+    )
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+# ---------- Background jobs ----------
+def canvas_sync(oid, stage):
+    """Canvas fetch + merge + classify for one user; stage: Job.stage or job_stage."""
+    user = users_col.find_one({"_id": oid}, {"canvas.access_token": 1}) or {}
+    canvasToken = (user.get("canvas") or {}).get("access_token")
+    if not canvasToken:
+        raise ValueError("user has no canvas token")
+
+    with stage("canvas_fetch"):
+        lo, hi = due_window(weeks=2)
+        canvasTasks = getAllCanvasTasks(canvasToken)
+    if canvasTasks is None:
+        raise RuntimeError("canvas fetch failed")
+    with stage("mongo_upsert"):
+        counts = merge_canvas_tasks(
+            task_store, oid, canvasTasks, window=(format_time(lo), format_time(hi))
+        )
+    with stage("classify"):
+        run_batch_classification(task_store, str(oid), classifier)
+    return {"canvasTasks": len(canvasTasks), **counts}
+
+
+def google_sync(oid, stage):
+    """Incremental Google sync + classify for one user, from the stored tokens."""
+    user = users_col.find_one({"_id": oid}, {"google": 1}) or {}
+    google = user.get("google") or {}
+    if not google.get("access_token"):
+        raise ValueError("user has no google token")
+    tokens = stored_google_tokens(google)
+
+    push_channels.started(oid)  # notifications from here on queue the next sync
+    with stage("google_sync"):
+        result = sync_google_calendar(task_store, users_col, oid, tokens)
+    if tokens["access_token"] != google["access_token"]:
+        # google-auth refreshed it from the refresh token; keep it for the next sync
+        users_col.update_one(
+            {"_id": oid},
+            {"$set": {"google.access_token": tokens["access_token"], "google.expires_at": tokens["expiry"]}},
+        )
+        google = {**google, "access_token": tokens["access_token"]}
+    if push_channels.enabled:
+        with stage("google_watch"):
+            push_channels.ensure(oid, google)  # first sync after connecting, or a lapsed channel
+    with stage("classify"):
+        run_batch_classification(task_store, str(oid), classifier)
+    return result
+
+
+@job_runner.handler("canvas_sync")
+def canvas_sync_job(job, payload):
+    return sync_scheduler.run_now("canvas", ObjectId(payload["userID"]), canvas_sync, job.stage)
+
+
+@job_runner.handler("google_sync")
+def google_sync_job(job, payload):
+    return sync_scheduler.run_now("google", ObjectId(payload["userID"]), google_sync, job.stage)
+
+
+# periodic refresh for every connected user, see api/sync_scheduler.py
+@sync_scheduler.provider("canvas", "canvas.access_token")
+def scheduled_canvas_sync(oid):
+    return canvas_sync(oid, job_stage)
+
+
+@sync_scheduler.provider("google", "google.refresh_token", live_field="google.channel.expiresAt")
+def scheduled_google_sync(oid):
+    return google_sync(oid, job_stage)
+
+
+if SYNC_SCHEDULER_ENABLED:
+    sync_scheduler.start()
+if push_channels.enabled:
+    push_channels.start()  # channel renewal, see api/google_push.py
 
 
 # ---------- Routes ----------
@@ -252,8 +451,8 @@ def register():
         res = users_col.insert_one(doc)
         return RETURNS.SUCCESS.return_user_id(str(res.inserted_id))
 
-    except BaseException as error:
-        print(error)
+    except BaseException:
+        log.exception("request failed")
         return RETURNS.ERRORS.internal_error()
 
 
@@ -279,8 +478,8 @@ def login():
         userID = str(user["_id"])
         return RETURNS.SUCCESS.return_user_id(userID)
 
-    except BaseException as error:
-        print(error)
+    except BaseException:
+        log.exception("request failed")
         return RETURNS.ERRORS.internal_error()
 
 
@@ -310,13 +509,11 @@ def pushCanvasToken():
         if res.matched_count == 0:
             return RETURNS.ERRORS.bad_login()  # user not found
 
-        canvasTasks = getAllCanvasTasks(canvasToken)
-        # for each task in canvasTasks push to the tasks inside users document
-        upsert_canvas_tasks_embedded(users_col, oid, canvasTasks)
-        run_batch_classification(users_col, userID)
-        return RETURNS.SUCCESS.return_user_id(userID)
-    except BaseException as error:
-        print(error)
+        # fetch + upsert + classify run in the background; poll /jobStatus
+        jobID = job_runner.enqueue("canvas_sync", oid, {"userID": userID})
+        return RETURNS.SUCCESS.return_job_id(jobID, userID=userID)
+    except BaseException:
+        log.exception("request failed")
         return RETURNS.ERRORS.internal_error()
 
 
@@ -352,43 +549,189 @@ def pushCanvasToken():
 #         return RETURNS.ERRORS.internal_error()
 
 
-@app.route("/getTasks", methods=["POST"])
-def getTasks():
+def read_task_query(payload):
+    """
+    Validates a /getTasks payload (shared with api/asgi.py).
+    Returns (params, None) or (None, RETURNS error).
+    """
+    # optional payload: "from"/"to" (ISO8601) window, "cursor" (nextCursor of the
+    # previous page), "limit" (page size, capped at MAX_PAGE_SIZE),
+    # "since" (syncCursor of an earlier fetch): delta mode, only tasks written
+    # since then (any date, the client filters) plus "removed" task ids.
+    # The first page of every fetch carries a new "syncCursor".
+    # "shape": "columns" returns tasks as {field: [values]} instead of rows.
+    # Recurring Google events come as occurrences (id "<seriesId>_<YYYYMMDDTHHMM>")
+    # on the first page only, for from/to or recurrence.default_range() (which
+    # moves daily, so the resolved range is part of the ETag). In
+    # delta mode "series" lists the series whose occurrences were re-sent in
+    # full (drop the old ones first); a removed series id removes them all.
+    userID = payload.get("userID")
+    if not userID:
+        return None, RETURNS.ERRORS.bad_request("userID is required")
     try:
-        payload = request.get_json(force=True)
-        userID = payload.get("userID")
-        if not userID:
-            return RETURNS.ERRORS.bad_request("userID is required")
+        uoid = ObjectId(userID)
+    except Exception:
+        return None, RETURNS.ERRORS.bad_userID()
+
+    try:
+        start = normalize_bound(payload.get("from"))
+        end = normalize_bound(payload.get("to"))
+        limit = min(int(payload.get("limit") or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return None, RETURNS.ERRORS.bad_request("invalid from/to/limit")
+    if limit <= 0:
+        return None, RETURNS.ERRORS.bad_request("limit must be positive")
+    shape = payload.get("shape") or "rows"
+    if shape not in ("rows", "columns"):
+        return None, RETURNS.ERRORS.bad_request("shape must be rows or columns")
+
+    after = None
+    if payload.get("cursor"):
+        after = as_object_id(payload.get("cursor"))
+        if not after:
+            return None, RETURNS.ERRORS.bad_request("invalid cursor")
+
+    since = None
+    if payload.get("since"):
         try:
-            uoid = ObjectId(userID)
-        except Exception:
-            return RETURNS.ERRORS.bad_userID()
+            since = decode_sync_cursor(payload["since"])
+        except ValueError:
+            return None, RETURNS.ERRORS.bad_request("invalid since")
+        if since is None:
+            return None, RETURNS.ERRORS.sync_expired()
+
+    window = (start, end)
+    if start is None or end is None:
+        lo, hi = default_range()
+        window = (start or format_time(lo), end or format_time(hi))
+
+    return {
+        "uoid": uoid,
+        "query": {
+            **(window_query(start, end) if since is None else delta_query(since)),
+            **PLAIN_TASKS,
+        },
+        "window": window,
+        "after": after,
+        "limit": limit,
+        "since": since,
+        "shape": shape,
+        "key": (userID, start, end, str(after), limit, since, shape, window),
+    }, None
+
+
+def tasks_response(params, settled, etag, docs, next_cursor, removed=None, series=None):
+    tasks = [task_to_client(t) for t in docs]
+    if params["shape"] == "columns":
+        tasks = tasks_to_columns(tasks)
+
+    extra = {}
+    if params["after"] is None:
+        extra["syncCursor"] = encode_sync_cursor(settled)
+        if removed is not None:
+            extra["removed"] = [str(i) for i in removed]
+        if series is not None:
+            extra["series"] = [str(i) for i in series]
+
+    return RETURNS.SUCCESS.return_tasks(
+        tasks, str(next_cursor) if next_cursor else None, etag, **extra
+    )
+
+
+def load_occurrences(uoid, params):
+    """
+    Occurrences of the user's recurring series for the first /getTasks page.
+    -> (rows, series) where series is None for a window fetch, and in delta
+    mode the master ids of the series that changed (only those are re-sent).
+    """
+    if params["since"] is None:
+        docs = list(task_store.find(uoid, SERIES_QUERY, SERIES_PROJECTION))
+        return occurrences(docs, *params["window"]), None
+    changed = task_store.find(
+        uoid, {**SERIES_QUERY, **delta_query(params["since"])}, SERIES_KEY_PROJECTION
+    )
+    keys = series_keys(changed)
+    if not keys:
+        return [], []
+    docs = list(task_store.find(uoid, series_docs_query(keys), SERIES_PROJECTION))
+    return occurrences(docs, *params["window"]), [t["_id"] for t in docs if t.get("recurrence")]
 
-        doc = users_col.find_one({"_id": uoid}, {"tasks": 1})
-        if not doc:
-            return RETURNS.ERRORS.bad_login()
 
-        tasks = []
-        for t in doc.get("tasks", []):
-            tasks.append(
-                {
-                    "id": str(t["_id"]),
-                    "title": t.get("title"),
-                    "desc": t.get("description"),
-                    "startTime": t.get("startTime"),
-                    "endTime": t.get("endTime"),
-                    "dueDate": t.get("dueDate"),
-                    "priority": t.get("priority", "med"),
-                }
-            )
+@app.route("/getTasks", methods=["POST"])
+def getTasks():
+    try:
+        params, error = read_task_query(request.get_json(force=True))
+        if error:
+            return error
+        uoid = params["uoid"]
+
+        # read the versions before the tasks: a write landing in between only
+        # makes this ETag stale early, never lets it cover newer data, and the
+        # settled version is below any write that hasn't landed yet
+        version, settled = task_store.versions(uoid)
+        if version is None:
+            return RETURNS.ERRORS.bad_login()
+        sync_scheduler.touch(uoid)
 
-        return RETURNS.SUCCESS.return_tasks(tasks)
+        etag = tasks_etag(version, *params["key"])
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return RETURNS.SUCCESS.not_modified(etag)
 
-    except Exception as e:
-        print(e)
+        docs, next_cursor = task_store.page(
+            uoid, params["query"], CLIENT_PROJECTION, after=params["after"], limit=params["limit"]
+        )
+        removed = series = None
+        if params["after"] is None:
+            rows, series = load_occurrences(uoid, params)
+            docs = docs + rows
+            if params["since"] is not None:
+                removed = task_store.removed_since(uoid, params["since"])
+        return tasks_response(params, settled, etag, docs, next_cursor, removed, series)
+
+    except Exception:
+        log.exception("request failed")
         return RETURNS.ERRORS.internal_error()
 
 
+def google_token_request(code: str) -> dict:
+    # Exchange code for tokens (redirect_uri MUST be 'postmessage' for JS code flow)
+    return {
+        "code": code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": "postmessage",
+        "grant_type": "authorization_code",
+    }
+
+
+def google_token_fields(tokens: dict) -> dict:
+    """users.$set fields for a token exchange response."""
+    # tokens: access_token, expires_in, scope, token_type, id_token, (maybe) refresh_token
+    refresh_token = tokens.get("refresh_token")  # may be None if not granted this time
+    expires_in = tokens.get("expires_in")
+
+    # Compute absolute expiry (ISO8601) if present
+    expires_at = (
+        (datetime.now(timezone.utc) + timedelta(seconds=int(expires_in))).isoformat()
+        if expires_in
+        else None
+    )
+
+    # Build update (skip None so we don’t overwrite an existing refresh_token with null)
+    update_fields = {
+        "google.access_token": tokens.get("access_token"),
+        "google.expires_at": expires_at,
+        "google.scope": tokens.get("scope"),
+        "google.token_type": tokens.get("token_type"),
+        "google.id_token": tokens.get("id_token"),
+        "google.channelRetryAt": None,  # new tokens: retry a failed watch right away
+        "updatedAt": now_iso(),
+    }
+    if refresh_token:  # only set if provided
+        update_fields["google.refresh_token"] = refresh_token
+    return update_fields
+
+
 @app.route("/calendarToken", methods=["POST"])
 def auth_google():
     try:
@@ -396,48 +739,12 @@ def auth_google():
         code = payload["code"]
         userID = payload["userID"]
 
-        # Exchange code for tokens (redirect_uri MUST be 'postmessage' for JS code flow)
-        token_req = {
-            "code": code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": "postmessage",
-            "grant_type": "authorization_code",
-        }
-        tr = requests.post(TOKEN_URL, data=token_req, timeout=10)
+        with metrics.stage("google.token"):
+            tr = requests.post(TOKEN_URL, data=google_token_request(code), timeout=10)
         tr.raise_for_status()
-        tokens = tr.json()
-        # tokens: access_token, expires_in, scope, token_type, id_token, (maybe) refresh_token
-
-        access_token = tokens.get("access_token")
-        refresh_token = tokens.get(
-            "refresh_token"
-        )  # may be None if not granted this time
-        expires_in = tokens.get("expires_in")
-        scope = tokens.get("scope")
-        token_type = tokens.get("token_type")
-        id_token = tokens.get("id_token")
-
-        # Compute absolute expiry (ISO8601) if present
-        expires_at = (
-            (
-                datetime.now(timezone.utc) + timedelta(seconds=int(expires_in))
-            ).isoformat()
-            if expires_in
-            else None
-        )
-
-        # Build update (skip None so we don’t overwrite an existing refresh_token with null)
-        update_fields = {
-            "google.access_token": access_token,
-            "google.expires_at": expires_at,
-            "google.scope": scope,
-            "google.token_type": token_type,
-            "google.id_token": id_token,
-            "updatedAt": now_iso(),
-        }
-        if refresh_token:  # only set if provided
-            update_fields["google.refresh_token"] = refresh_token
+        update_fields = google_token_fields(tr.json())
+        expires_at = update_fields["google.expires_at"]
+        refresh_token = update_fields.get("google.refresh_token")
 
         # Persist to the matching user
         try:
@@ -449,30 +756,313 @@ def auth_google():
         if res.matched_count == 0:
             return RETURNS.ERRORS.bad_login()  # user not found
 
-        googleTasks = list_events_with_google_client(tokens)
-        upsert_google_events_embedded(users_col, oid, googleTasks)
-        run_batch_classification(users_col, userID)
+        jobID = job_runner.enqueue("google_sync", oid, {"userID": userID})
         return jsonify(
             {
                 "status": "SUCCESS",
                 "message": "GOOGLE TOKENS SAVED",
+                "jobID": jobID,
                 "expiresAt": expires_at,
                 "hasRefreshToken": bool(refresh_token),
             }
-        ), 200
+        ), 202
 
     except requests.HTTPError as e:
-        # Helpful debugging during hackathon
-        print(
-            "Google token exchange failed:", e.response.text if e.response else str(e)
+        log.warning(
+            "google token exchange failed",
+            extra={"error": e.response.text if e.response is not None else str(e)},
         )
         return jsonify(
             {"status": "ERROR", "message": "GOOGLE TOKEN EXCHANGE FAILED"}
         ), 400
-    except Exception as e:
-        print(e)
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+@app.route("/googleNotify", methods=["POST"])
+def googleNotify():
+    """
+    Google Calendar push notification (api/google_push.py). The body is
+    empty; the X-Goog-* headers name the channel. Answers fast: the sync
+    itself runs as a google_sync job. A 5xx makes Google retry.
+    """
+    try:
+        status, uoid = push_channels.notify(request.headers)
+        if uoid is not None:
+            job_runner.enqueue("google_sync", uoid, {"userID": str(uoid)})
+        return "", status
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+@app.route("/jobStatus", methods=["POST"])
+def jobStatus():
+    try:
+        payload = request.get_json(force=True)
+        userID = payload.get("userID")
+        jobID = payload.get("jobID")
+        if not userID or not jobID:
+            return RETURNS.ERRORS.bad_request("userID and jobID are required")
+        uoid = as_object_id(userID)
+        if not uoid:
+            return RETURNS.ERRORS.bad_userID()
+
+        job = job_runner.get(jobID, uoid)
+        if not job:
+            return jsonify({"status": "ERROR", "message": "Job not found"}), 404
+
+        job["jobID"] = job.pop("_id")
+        return jsonify({"status": "SUCCESS", "job": job}), 200
+
+    except Exception:
+        log.exception("request failed")
+        return RETURNS.ERRORS.internal_error()
+
+
+def load_chat_context(uoid, conversation):
+    """Returns (raw_tasks, context) and records the context size for this request."""
+    raw_tasks = expand(task_store.find(uoid), *context_window())
+    budget = llm_usage.context_budget(uoid, CONTEXT_TOKEN_BUDGET)
+    with metrics.stage("context"):
+        context, usage = build_context(raw_tasks, conversation, budget=budget)
+    g.context_tokens = usage["tokens"]
+    log.info("chat context", extra=usage)
+    return raw_tasks, context
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+
+def new_ai_task(action: dict, now: str) -> dict:
+    """Task document for an `add` intent."""
+    priority = (action.get("priority") or "med").lower()
+    if priority not in {"low", "med", "high"}:
+        priority = "med"
+    return {
+        "_id": ObjectId(),
+        "source": "ai",
+        "externalId": None,
+        "title": action.get("title") or "(Untitled)",
+        "description": action.get("desc") or action.get("description") or "",
+        "startTime": action.get("startTime"),
+        "endTime": action.get("endTime"),
+        "dueDate": action.get("dueDate") or action.get("endTime"),
+        "estimatedMinutes": int(action.get("estimatedMinutes") or 60),
+        "minutesTaken": 0,
+        "isFlexible": bool(action["isFlexible"]) if "isFlexible" in action else True,
+        "status": action.get("status") or "todo",
+        "priority": priority,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+# fields an override copies from the occurrence it replaces
+OVERRIDE_FIELDS = ("source", "title", "description", "estimatedMinutes", "minutesTaken", "status", "priority")
+
+
+def new_override(occurrence: dict, series_id: str, fields: dict, now: str) -> dict:
+    """Override document moving one occurrence of a recurring series (see api/recurrence.py)."""
+    task = {k: occurrence[k] for k in OVERRIDE_FIELDS if k in occurrence}
+    task.update(
+        {
+            "_id": ObjectId(),
+            "externalId": None,  # local edit, not a Google event
+            "recurringEventId": series_id,
+            "originalStartTime": occurrence["startTime"],
+            "startTime": fields.get("startTime", occurrence.get("startTime")),
+            "endTime": fields.get("endTime", occurrence.get("endTime")),
+            "createdAt": now,
+            "updatedAt": now,
+        }
+    )
+    task["dueDate"] = fields.get("dueDate") or task["endTime"]
+    return task
+
+
+def apply_ai_actions(uoid, actions: list, raw_tasks: list):
+    """
+    Apply the intents of one Gemini reply ("move A, delete B, add C") for the
+    user as a single ordered TaskStore.apply. Shared by /chat and /chatStream.
+
+    The ops are first played against raw_tasks (the tasks the reply was
+    based on), so every id is checked and a later op sees the earlier ones
+    (autoschedule plans around a task added in the same reply) before
+    anything is written. A bad id rejects the whole reply rather than
+    applying half of it, and so does a timed task that would overlap a fixed
+    one (409 with the conflicts, see api/intervals.py). Nothing is re-read
+    afterwards. The response carries only the delta:
+      {"status": "SUCCESS", "changed": [task], "removed": [id],
+       "scheduled"?, "unscheduled"?, "chatMessage"?}
+    with 201 if a task was added, else 200.
+
+    Occurrences of recurring series ('<seriesId>_<stamp>' ids) have no
+    document: removing one adds an exdate to its master, rescheduling one
+    inserts an override in its place. Removing an override also exdates its
+    original slot, so the occurrence doesn't come back. Their ids are
+    reported in "removed" either way.
+    """
+    intents = [a.get("intent") for a in actions]
+    metrics.set_intent(intents[0] if len(set(intents)) == 1 else "multi")
+
+    view = {t["_id"]: t for t in raw_tasks}  # the user's tasks as of the ops so far
+    inserted = {}  # oid -> new task doc
+    updates = {}  # oid -> $set fields, merged per task
+    deletes = []
+    dropped = []  # occurrence ids no longer shown
+    masters = {}  # series master oid -> {"_id", "externalId", "exdates"} as of the ops so far
+    series_updates = {}  # master oid -> $set fields
+    extra = {}
+    now = now_iso()
+
+    def series_master(query):
+        for doc in task_store.find(uoid, {**query, "recurrence": {"$ne": None}}, {"externalId": 1, "exdates": 1}):
+            return masters.setdefault(doc["_id"], doc)
+        return None
+
+    def skip_occurrence(master, stamp):
+        exdates = list(master.get("exdates") or [])
+        if stamp not in exdates:
+            master["exdates"] = sorted([*exdates, stamp])
+            series_updates[master["_id"]] = {"exdates": master["exdates"], "updatedAt": now}
+
+    def planning_view():
+        # raw_tasks only expands series over the chat window; the planner
+        # must see the occurrences the overlap check indexes (default_range())
+        series = [
+            {**doc, **masters.get(doc["_id"], {})}
+            for doc in task_store.find(uoid, {"recurrence": {"$ne": None}}, SERIES_PROJECTION)
+        ]
+        overrides = [t for t in view.values() if t.get("recurringEventId")]
+        later = [
+            o
+            for o in occurrences([*series, *overrides], *default_range())
+            if o["_id"] not in view and o["_id"] not in dropped
+        ]
+        return [*view.values(), *later]
+
+    def change(tid, fields):
+        fields = {**fields, "updatedAt": now}
+        view[tid] = {**view[tid], **fields}
+        if tid in inserted:
+            inserted[tid] = view[tid]
+        else:
+            updates.setdefault(tid, {}).update(fields)
+
+    for action in actions:
+        intent = action.get("intent")
+        tid = occurrence = master = None
+        if intent in ("reschedule", "remove"):
+            occurrence = parse_occurrence_id(action.get("id"))
+            tid = action["id"] if occurrence else as_object_id(action.get("id"))
+            if not tid:
+                return RETURNS.ERRORS.bad_request("invalid task id")
+            if occurrence:
+                master = series_master({"_id": occurrence[0]})
+            if tid not in view or (occurrence and master is None):
+                return jsonify(
+                    {"status": "ERROR", "message": "Task not found", "id": str(tid)}
+                ), 404
+
+        # ---------- INTENT: RESCHEDULE ----------
+        if intent == "reschedule":
+            fields = {k: action[k] for k in ("startTime", "endTime", "dueDate") if k in action}
+            if not fields:
+                return RETURNS.ERRORS.bad_request("no schedule fields provided")
+            if occurrence:
+                task = new_override(view.pop(tid), master["externalId"], fields, now)
+                inserted[task["_id"]] = view[task["_id"]] = task
+                dropped.append(tid)
+            else:
+                change(tid, fields)
+
+        # ---------- INTENT: ADD ----------
+        elif intent == "add":
+            task = new_ai_task(action, now)
+            inserted[task["_id"]] = view[task["_id"]] = task
+
+        # ---------- INTENT: REMOVE ----------
+        elif intent == "remove":
+            task = view.pop(tid)
+            if occurrence:
+                skip_occurrence(master, occurrence[1])
+                dropped.append(tid)
+                continue
+            if task.get("recurringEventId") and task.get("originalStartTime"):
+                override_of = series_master({"source": "google", "externalId": task["recurringEventId"]})
+                if override_of is not None:
+                    skip_occurrence(override_of, task["originalStartTime"])
+            updates.pop(tid, None)
+            if inserted.pop(tid, None) is None:
+                deletes.append(tid)
+
+        # ---------- INTENT: AUTOSCHEDULE ----------
+        elif intent == "autoschedule":
+            # Gemini only detects the intent; the slots are computed locally
+            # so they respect the 08:00-22:00 window, dueDates and fixed tasks.
+            plan = plan_autoschedule(planning_view())
+            scheduled = 0
+            for ch in plan["changes"]:
+                ctid = as_object_id(ch.get("id"))
+                if ctid in view:
+                    change(ctid, {"startTime": ch["startTime"], "endTime": ch["endTime"]})
+                    scheduled += 1
+            extra["scheduled"] = extra.get("scheduled", 0) + scheduled
+            extra["unscheduled"] = plan["unscheduled"]
+
+        # ---------- INTENT: SUMMARIZE (or anything unrecognized) ----------
+        else:
+            extra["chatMessage"] = action.get("summary") or "Done"
+
+    if not (inserted or updates or deletes or series_updates):
+        if "scheduled" in extra:
+            return jsonify({"status": "SUCCESS", "message": "NOTHING TO SCHEDULE", **extra}), 200
+        return RETURNS.SUCCESS.return_chat_message(extra.get("chatMessage") or "Done")
+
+    # the prompt asks Gemini to keep clear of fixed tasks; enforce it before
+    # writing and tell the client exactly what collides instead
+    proposed = {tid: view[tid] for tid in (*inserted, *updates)}
+    if any(t.get("startTime") for t in proposed.values()):
+        with metrics.stage("overlap"):
+            conflicts = find_conflicts(fixed_intervals.get(uoid), proposed, [*deletes, *dropped])
+        if conflicts:
+            log.info("chat actions conflict", extra={"intents": intents, "conflicts": len(conflicts)})
+            return RETURNS.ERRORS.schedule_conflict(conflicts)
+
+    try:
+        result = task_store.apply(
+            uoid,
+            list(inserted.values()),
+            [*updates.items(), *series_updates.items()],
+            deletes,
+            ordered=True,
+        )
+        log.info(
+            "chat actions",
+            extra={
+                "intents": intents,
+                "inserted": result.inserted_count,
+                "modified": result.modified_count,
+                "deleted": result.deleted_count,
+            },
+        )
+    except Exception:
+        log.exception("chat actions write failed")
         return RETURNS.ERRORS.internal_error()
 
+    changed = [task_to_client(view[tid]) for tid in (*inserted, *updates)]
+    return jsonify(
+        {
+            "status": "SUCCESS",
+            "changed": changed,
+            "removed": [str(tid) for tid in (*deletes, *dropped)],
+            **extra,
+        }
+    ), 201 if inserted else 200
+
 
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -486,211 +1076,97 @@ def chat():
         except Exception:
             return RETURNS.ERRORS.bad_userID()
 
-        doc = users_col.find_one({"_id": uoid}, {"tasks": 1})
-        if not doc:
+        if not users_col.find_one({"_id": uoid}, {"_id": 1}):
             return RETURNS.ERRORS.bad_login()
+        sync_scheduler.touch(uoid)
 
-        tasks = []
-        for t in doc.get("tasks", []):
-            tasks.append(
-                {
-                    "id": str(t["_id"]),
-                    "title": t.get("title"),
-                    "desc": t.get("description"),
-                    "startTime": t.get("startTime"),
-                    "endTime": t.get("endTime"),
-                    "dueDate": t.get("dueDate"),
-                    "priority": t.get("priority", "med"),
-                    "isFlexible": t.get("isFlexible")
-                }
-            )
+        raw_tasks, context = load_chat_context(uoid, conversation)
 
-        response = ask_gemini(conversation, tasks)
-
-        print(response)
-        if response.strip().startswith("```json"):
-            aiResponse = parse_ai_response(response)
-            intent = aiResponse["intent"]
-            # ---------- INTENT: RESCHEDULE ----------
-            if intent == "reschedule":
-                # expects: {"intent":"reschedule","id":"<taskId>","startTime":"ISO","endTime":"ISO"}
-                tid = as_object_id(aiResponse.get("id"))
-                if not tid:
-                    return RETURNS.ERRORS.bad_request("invalid task id")
-
-                updates = {}
-                if "startTime" in aiResponse:
-                    updates["tasks.$.startTime"] = aiResponse["startTime"]
-                if "endTime" in aiResponse:
-                    updates["tasks.$.endTime"] = aiResponse["endTime"]
-                if "dueDate" in aiResponse:
-                    updates["tasks.$.dueDate"] = aiResponse["dueDate"]
-                if not updates:
-                    return RETURNS.ERRORS.bad_request("no schedule fields provided")
-
-                updates["tasks.$.updatedAt"] = now_iso()
-
-                res = users_col.update_one(
-                    {"_id": uoid, "tasks._id": tid}, {"$set": updates}
-                )
-                if res.matched_count == 0:
-                    return jsonify(
-                        {"status": "ERROR", "message": "Task not found"}
-                    ), 404
-
-                # return updated list
-                doc = users_col.find_one({"_id": uoid}, {"tasks": 1})
-                return jsonify(
-                    {"status": "SUCCESS"}
-                ), 200
-
-            # ---------- INTENT: ADD ----------
-            elif intent == "add":
-                # expects: {"intent":"add","title": "...", "desc":"...", "startTime":"ISO|null",
-                #           "endTime":"ISO|null","dueDate":"ISO|null","priority":"low|med|high"}
-                title = aiResponse.get("title") or "(Untitled)"
-                desc = aiResponse.get("desc") or aiResponse.get("description") or ""
-                start = aiResponse.get("startTime")
-                end = aiResponse.get("endTime")
-                due = aiResponse.get("dueDate") or end
-                priority = (aiResponse.get("priority") or "med").lower()
-                if priority not in {"low", "med", "high"}:
-                    priority = "med"
-
-                new_task = {
-                    "_id": ObjectId(),
-                    "source": "ai",
-                    "externalId": None,
-                    "title": title,
-                    "description": desc,
-                    "startTime": start,
-                    "endTime": end,
-                    "dueDate": due,
-                    "estimatedMinutes": int(aiResponse.get("estimatedMinutes") or 60),
-                    "minutesTaken": 0,
-                    "isFlexible": bool(aiResponse.get("isFlexible"))
-                    if "isFlexible" in aiResponse
-                    else True,
-                    "status": aiResponse.get("status") or "todo",
-                    "priority": priority,
-                    "createdAt": now_iso(),
-                    "updatedAt": now_iso(),
-                }
+        meter = llm_usage.meter(uoid)
+        try:
+            text, actions = ask_gemini(conversation, context, meter)
+
+            log.debug("gemini reply", extra={"reply": text, "actions": actions})
+            if actions:
+                return apply_ai_actions(uoid, actions, raw_tasks)
+            else:
+                metrics.set_intent("reply")
+                return RETURNS.SUCCESS.return_chat_message(text)
+        except ActionError as e:
+            return RETURNS.ERRORS.bad_request(str(e))
+        finally:
+            meter.commit()  # under the intent the reply turned out to be
+    except Exception:
+        log.exception("chat failed")
+        return RETURNS.ERRORS.internal_error()
 
-                users_col.update_one(
-                    {"_id": uoid},
-                    {"$push": {"tasks": new_task}, "$set": {"updatedAt": now_iso()}},
-                )
+    except BaseException:
+        log.exception("chat failed")
+        return RETURNS.ERRORS.internal_error()
 
-                # return updated list (including the new task id)
-                doc = users_col.find_one({"_id": uoid}, {"tasks": 1})
-                return jsonify(
-                    {"status": "SUCCESS"}
-                ), 201
-
-            # ---------- INTENT: REMOVE ----------
-            elif intent == "remove":
-                # expects: {"intent":"remove","id":"<taskId>"}
-                tid = as_object_id(aiResponse.get("id"))
-                if not tid:
-                    return RETURNS.ERRORS.bad_request("invalid task id")
-
-                res = users_col.update_one(
-                    {"_id": uoid},
-                    {
-                        "$pull": {"tasks": {"_id": tid}},
-                        "$set": {"updatedAt": now_iso()},
-                    },
-                )
-                if res.modified_count == 0:
-                    return jsonify(
-                        {"status": "ERROR", "message": "Task not found"}
-                    ), 404
-
-                doc = users_col.find_one({"_id": uoid}, {"tasks": 1})
-                return jsonify(
-                    {"status": "SUCCESS"}
-                ), 200
-            elif intent == "autoschedule":
-                # expects:
-                # {
-                #   "intent": "autoschedule",
-                #   "changes": [
-                #     {
-                #       "id": "<embedded task _id string>",
-                #       "title": "...", "description": "...",
-                #       "startTime": "ISO", "endTime": "ISO", "dueDate": "ISO",
-                #       "estimatedMinutes": 120, "minutesTaken": 0,
-                #       "isFlexible": true, "status": "todo", "priority": "med",
-                #       "source": "...", "externalId": "..."
-                #     },
-                #     ...
-                #   ]
-                # }
-
-                changes = aiResponse.get("changes") or []
-                if not isinstance(changes, list) or not changes:
-                    return RETURNS.ERRORS.bad_request("changes must be a non-empty list")
-
-                from pymongo import UpdateOne
-                ops = []
-                now = now_iso()
-
-                # Only allow updating these fields on embedded tasks
-                updatable = {
-                    "title", "description",
-                    "startTime", "endTime", "dueDate",
-                    "estimatedMinutes", "minutesTaken",
-                    "isFlexible", "status", "priority",
-                    # you can allow these if your AI legitimately edits them:
-                    "source", "externalId",
-                }
 
-                for ch in changes:
-                    tid_str = ch.get("id")
-                    try:
-                        tid = ObjectId(tid_str)
-                    except Exception:
-                        return RETURNS.ERRORS.bad_request(f"invalid task id: {tid_str}")
-
-                    # Build per-task $set payload for the positional element
-                    set_fields = {}
-                    for k, v in ch.items():
-                        if k in updatable:
-                            set_fields[f"tasks.$.{k}"] = v
-                    if not set_fields:
-                        # nothing to update for this change
-                        continue
-                    set_fields["tasks.$.updatedAt"] = now
-
-                    ops.append(UpdateOne(
-                        {"_id": uoid, "tasks._id": tid},
-                        {"$set": set_fields}
-                    ))
-
-                if not ops:
-                    return RETURNS.ERRORS.bad_request("no valid changes to apply")
-
-                try:
-                    result = users_col.bulk_write(ops, ordered=False)
-                    # Optional: print summary
-                    print(f"autoschedule: matched {result.matched_count}, modified {result.modified_count}")
-                except Exception as e:
-                    print("autoschedule bulk error:", e)
-                    return RETURNS.ERRORS.internal_error()
-
-                return jsonify({"status": "SUCCESS"}), 200
+@app.route("/chatStream", methods=["POST"])
+def chatStream():
+    """
+    Same contract as /chat, streamed as Server-Sent Events:
+      event: chunk   data: {"text": "..."}       plain reply text as it arrives
+      event: action  data: {<what /chat returns>, "httpStatus": n}
+      event: done    data: {"chatMessage": "..."} full plain reply
+      event: error   data: {"message": "..."}
+    Text streams as Gemini writes it; a function call (an intent) is applied
+    once the reply is complete and answered with the action event.
+    """
+    try:
+        payload = request.get_json()
+        conversation = payload["convo"]
+        userID = payload["userID"]
 
-        else:
-            return RETURNS.SUCCESS.return_chat_message(response)
-    except Exception as e:
-        print(e)
-        return RETURNS.ERRORS.internal_error()
+        try:
+            uoid = ObjectId(userID)
+        except Exception:
+            return RETURNS.ERRORS.bad_userID()
 
-    except BaseException as error:
-        print(error)
+        if not users_col.find_one({"_id": uoid}, {"_id": 1}):
+            return RETURNS.ERRORS.bad_login()
+        sync_scheduler.touch(uoid)
+
+        raw_tasks, context = load_chat_context(uoid, conversation)
+    except Exception:
+        log.exception("request failed")
         return RETURNS.ERRORS.internal_error()
 
+    def events():
+        parts, actions = [], []
+        meter = llm_usage.meter(uoid)
+        try:
+            for kind, value in ask_gemini_stream(conversation, context, meter):
+                if kind == "text":
+                    parts.append(value)
+                    yield sse("chunk", {"text": value})
+                else:
+                    actions.append(value)
+
+            if actions:
+                resp, status = apply_ai_actions(uoid, actions, raw_tasks)
+                yield sse("action", {**resp.get_json(), "httpStatus": status})
+            else:
+                metrics.set_intent("reply")
+                yield sse("done", {"chatMessage": "".join(parts)})
+        except ActionError as e:
+            resp, status = RETURNS.ERRORS.bad_request(str(e))
+            yield sse("action", {**resp.get_json(), "httpStatus": status})
+        except Exception:
+            log.exception("chatStream failed")
+            yield sse("error", {"message": "INTERNAL SERVER ERROR"})
+        finally:
+            meter.commit()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,235 @@
+"""
+Canvas REST client.
+
+All requests share one pooled keep-alive requests.Session, per-course fetches
+run on a bounded thread pool, and an adaptive throttle slows down as Canvas's
+X-Rate-Limit-Remaining bucket drains instead of waiting for a 403.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api import metrics
+from api.scheduler import local_now, to_local
+
+MAX_WORKERS = 8
+PER_PAGE = 100
+REQUEST_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+# Canvas hands every token a leaky bucket (~700 units). Above RATE_LIMIT_LOW we
+# go full speed; below it we add a delay that grows as the bucket empties.
+RATE_LIMIT_LOW = 300.0
+MAX_THROTTLE_DELAY = 2.0
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide Session so TLS connections are reused across calls."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=MAX_WORKERS,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.5,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=("GET",),
+                ),
+            )
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+class RateLimitThrottle:
+    """Shared across the workers of one ingestion run."""
+
+    def __init__(self):
+        self.remaining = None
+        self._lock = threading.Lock()
+
+    def observe(self, resp):
+        value = resp.headers.get("X-Rate-Limit-Remaining")
+        if value is None:
+            return
+        try:
+            remaining = float(value)
+        except ValueError:
+            return
+        with self._lock:
+            self.remaining = remaining
+
+    def delay(self) -> float:
+        remaining = self.remaining
+        if remaining is None or remaining >= RATE_LIMIT_LOW:
+            return 0.0
+        return MAX_THROTTLE_DELAY * (1 - max(remaining, 0.0) / RATE_LIMIT_LOW)
+
+    def wait(self):
+        d = self.delay()
+        if d:
+            time.sleep(d)
+
+
+def _get(url, token, params, throttle):
+    session = get_session()
+    headers = {"Authorization": f"Bearer {token}"}
+    for attempt in range(3):
+        throttle.wait()
+        with metrics.stage("canvas.http"):
+            resp = session.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        throttle.observe(resp)
+        # Canvas signals an empty bucket with 403 "Rate Limit Exceeded"
+        if resp.status_code == 403 and "Rate Limit Exceeded" in resp.text:
+            time.sleep(MAX_THROTTLE_DELAY * (attempt + 1))
+            continue
+        resp.raise_for_status()
+        return resp
+    resp.raise_for_status()
+    return resp
+
+
+def _remaining_page_urls(resp):
+    """
+    If Canvas exposes numbered pages (rel="last" with ?page=N) return URLs for
+    pages 2..N so they can be fetched in parallel; None means follow rel="next".
+    """
+    last = resp.links.get("last", {}).get("url")
+    nxt = resp.links.get("next", {}).get("url")
+    if not nxt:
+        return []
+    if not last:
+        return None
+    parsed = urlparse(last)
+    query = parse_qs(parsed.query)
+    try:
+        last_page = int(query.get("page", [""])[0])
+    except ValueError:
+        return None
+    urls = []
+    for page in range(2, last_page + 1):
+        query["page"] = [str(page)]
+        urls.append(parsed._replace(query=urlencode(query, doseq=True)).geturl())
+    return urls
+
+
+def _get_all_sequential(url, token, params, throttle):
+    items = []
+    while url:
+        resp = _get(url, token, params, throttle)
+        items.extend(resp.json())
+        params = None
+        url = resp.links.get("next", {}).get("url")
+    return items
+
+
+def fetch_courses(token: str, base_url: str, throttle: RateLimitThrottle = None):
+    """
+    Fetch all Canvas courses with term info.
+    """
+    throttle = throttle or RateLimitThrottle()
+    return _get_all_sequential(
+        f"{base_url}/api/v1/courses",
+        token,
+        {"include[]": "term", "per_page": PER_PAGE},
+        throttle,
+    )
+
+
+def fetch_assignments(token: str, base_url: str, course_ids, max_workers: int = MAX_WORKERS):
+    """
+    Fetch every assignment page for every course concurrently.
+    Returns {course_id: [raw assignment, ...]}.
+
+    First pages for all courses go out together; any further numbered pages are
+    then fetched together as well, so wall time is ~2 round trips regardless of
+    the number of courses. Courses without numbered pages follow rel="next".
+    """
+    throttle = RateLimitThrottle()
+    params = {"per_page": PER_PAGE}
+    results = {cid: [] for cid in course_ids}
+    if not course_ids:
+        return results
+
+    def url_for(cid):
+        return f"{base_url}/api/v1/courses/{cid}/assignments"
+
+    get = metrics.carry(_get)  # pool threads keep the caller's route label
+    get_all = metrics.carry(_get_all_sequential)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(course_ids))) as pool:
+        first = dict(
+            zip(
+                course_ids,
+                pool.map(lambda cid: get(url_for(cid), token, params, throttle), course_ids),
+            )
+        )
+
+        futures = []
+        for cid, resp in first.items():
+            results[cid].extend(resp.json())
+            rest = _remaining_page_urls(resp)
+            if rest is None:
+                nxt = resp.links["next"]["url"]
+                futures.append((cid, pool.submit(get_all, nxt, token, None, throttle)))
+            else:
+                for url in rest:
+                    futures.append((cid, pool.submit(lambda u: get(u, token, None, throttle).json(), url)))
+
+        for cid, fut in futures:
+            results[cid].extend(fut.result())
+
+    return results
+
+
+def due_window(weeks: int = 2):
+    """(now, now + weeks) in wall time (scheduler.TIME_ZONE), as naive datetimes."""
+    now = local_now()
+    return now, now + timedelta(weeks=weeks)
+
+
+def assignments_to_tasks(assignments, weeks: int = 2):
+    """Keep assignments due within the next `weeks` and shape them as raw tasks."""
+    now, end_window = due_window(weeks)
+
+    tasks = []
+    for a in assignments:
+        due_str = a.get("due_at")
+        if not due_str:
+            continue
+
+        # Canvas returns UTC with trailing Z; stored times are wall time
+        due_dt = to_local(datetime.strptime(due_str, "%Y-%m-%dT%H:%M:%SZ"))
+        if not (now <= due_dt <= end_window):
+            continue
+
+        task = {
+            "userId": None,
+            "externalId": str(a["id"]),
+            "title": a["name"],
+            "description": a.get("description", ""),
+            "startTime": None,
+            "endTime": None,
+            "dueDate": due_dt.strftime("%Y-%m-%dT%H:%M"),
+            "estimatedMinutes": 60,
+            "minutesTaken": 0,
+            "source": "canvas",
+            "status": "todo",
+            "priority": "med",
+        }
+        tasks.append(task)
+
+    return tasks
+
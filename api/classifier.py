@@ -0,0 +1,198 @@
+"""
+Tiered flexibility classifier (isFlexible) that runs ahead of Gemini.
+
+  1. rules      - obvious titles ("Exam", "Lecture", "Homework", "Read chapter")
+  2. memory     - LRU/TTL cache keyed by a normalized hash of title + description
+  3. mongo      - the same cache persisted in `classifications`, shared by every
+                  user and process (classmates share the same Canvas assignments)
+  4. gemini     - whatever is left, de-duplicated, in bounded chunks run concurrently;
+                  metered per user and skipped while the user or the fleet is out
+                  of LLM budget (api/usage.py), leaving those tasks for a later sync
+
+classifications {
+  _id: string,        // sha256 of normalized title + description
+  isFlexible: bool,
+  createdAt: ISO8601,
+  expiresAt: Date     // TTL
+}
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+from cachetools import TTLCache
+from pymongo import UpdateOne
+
+from api import metrics
+from api.functions import classify_tasks_batch, now_iso
+from api.logs import get_logger
+
+CACHE_SIZE = int(os.getenv("CLASSIFIER_CACHE_SIZE", "50000"))
+CACHE_TTL_SECONDS = 24 * 3600
+PERSIST_TTL_DAYS = 120
+GEMINI_CHUNK_SIZE = 40
+GEMINI_WORKERS = 4
+DESCRIPTION_CHARS = 500  # enough to tell assignments apart, cheap to hash
+
+log = get_logger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+# Title patterns only; descriptions are too noisy for rules.
+FIXED_RE = re.compile(
+    r"\b(exam|midterm|final exam|lecture|class meeting|meeting|recitation|"
+    r"lab section|seminar|office hours|interview)\b"
+)
+FLEXIBLE_RE = re.compile(
+    r"\b(homework|hw ?\d*|problem set|pset|read(ing)? (ch(apter)?|pages?)|"
+    r"essay|worksheet|study|review notes|practice problems|project)\b"
+)
+
+
+def normalize_text(text: str) -> str:
+    text = _TAG_RE.sub(" ", text or "")
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def classification_key(task: dict) -> str:
+    title = normalize_text(task.get("title"))
+    desc = normalize_text(task.get("description"))[:DESCRIPTION_CHARS]
+    return hashlib.sha256(f"{title}\x00{desc}".encode("utf-8")).hexdigest()
+
+
+def rule_based(task: dict):
+    """True/False for obvious titles, None when unsure (both or neither match)."""
+    title = normalize_text(task.get("title"))
+    fixed = bool(FIXED_RE.search(title))
+    flexible = bool(FLEXIBLE_RE.search(title))
+    if fixed == flexible:
+        return None
+    return flexible
+
+
+class FlexibilityClassifier:
+    def __init__(self, db, usage=None):
+        self.col = db["classifications"]
+        self.usage = usage  # api.usage.UsageLedger, optional
+        self.cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=GEMINI_WORKERS, thread_name_prefix="classify")
+
+    def ensure_indexes(self):
+        self.col.create_index("expiresAt", expireAfterSeconds=0)
+
+    def _remember(self, results: dict):
+        """results: {key: isFlexible}"""
+        if not results:
+            return
+        with self.lock:
+            self.cache.update(results)
+        expires = datetime.now(timezone.utc) + timedelta(days=PERSIST_TTL_DAYS)
+        now = now_iso()
+        self.col.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": key},
+                    {
+                        "$set": {"isFlexible": is_flex, "expiresAt": expires},
+                        "$setOnInsert": {"createdAt": now},
+                    },
+                    upsert=True,
+                )
+                for key, is_flex in results.items()
+            ],
+            ordered=False,
+        )
+
+    def _ask_gemini(self, by_key: dict, meter=None) -> dict:
+        """by_key: {key: representative task}. Returns {key: isFlexible}."""
+        items = list(by_key.items())
+        chunks = [
+            items[i : i + GEMINI_CHUNK_SIZE]
+            for i in range(0, len(items), GEMINI_CHUNK_SIZE)
+        ]
+
+        def run(chunk):
+            answers = classify_tasks_batch([t for _, t in chunk], meter=meter)
+            return {
+                key: bool(answers[str(t["_id"])])
+                for key, t in chunk
+                if str(t["_id"]) in answers
+            }
+
+        results = {}
+        for fut in [self.pool.submit(metrics.carry(run), c) for c in chunks]:
+            try:
+                results.update(fut.result())
+            except Exception:
+                # one bad chunk shouldn't lose the others; it is retried next sync
+                log.exception("classification chunk failed")
+        return results
+
+    @metrics.timed("classify")
+    def classify(self, tasks, user_oid=None) -> dict:
+        """
+        tasks need _id, title, description. Returns {task_id_str: isFlexible}
+        (tasks left out when Gemini was skipped or failed).
+        """
+        keys = {str(t["_id"]): classification_key(t) for t in tasks}
+        known = {}
+        missing = {}  # key -> representative task
+
+        # 1) in-memory cache, then rules (cheap enough to never persist)
+        rule_hits = {}
+        for t in tasks:
+            key = keys[str(t["_id"])]
+            if key in known or key in missing:
+                continue
+            with self.lock:
+                cached = self.cache.get(key)
+            if cached is not None:
+                known[key] = cached
+                continue
+            verdict = rule_based(t)
+            if verdict is not None:
+                known[key] = rule_hits[key] = verdict
+            else:
+                missing[key] = t
+
+        # 2) shared Mongo cache
+        if missing:
+            found = {
+                d["_id"]: d["isFlexible"]
+                for d in self.col.find({"_id": {"$in": list(missing)}}, {"isFlexible": 1})
+            }
+            with self.lock:
+                self.cache.update(found)
+            known.update(found)
+            for key in found:
+                missing.pop(key, None)
+
+        # 3) Gemini for the rest, budget permitting
+        deferred = 0
+        if missing and self.usage is not None and not self.usage.allow_background(user_oid):
+            deferred, missing = len(missing), {}
+        if missing:
+            meter = self.usage.meter(user_oid) if self.usage is not None else None
+            try:
+                fresh = self._ask_gemini(missing, meter)
+            finally:
+                if meter is not None:
+                    meter.commit("classify")
+            self._remember(fresh)
+            known.update(fresh)
+
+        log.info(
+            "classified tasks",
+            extra={
+                "tasks": len(tasks),
+                "byRule": len(rule_hits),
+                "toGemini": len(missing),
+                "deferred": deferred,
+            },
+        )
+        return {tid: known[key] for tid, key in keys.items() if key in known}
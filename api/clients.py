@@ -0,0 +1,69 @@
+"""
+Process-wide registry of API clients, so nothing is constructed per request.
+
+- Gemini: one GenerativeModel per (model name, config), built on first use.
+- Google Calendar: the service object is built once per thread from the
+  discovery document bundled with google-api-python-client (no discovery
+  fetch/parse on the hot path) on top of a keep-alive httplib2.Http. Per-user
+  credentials are attached per call with AuthorizedHttp, which is just a thin
+  wrapper around that same pooled connection.
+
+httplib2.Http is not thread-safe, hence one connection/service per thread.
+"""
+import os
+import threading
+
+import google.generativeai as genai
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build
+
+GEMINI_MODEL = "gemini-2.0-flash"
+HTTP_TIMEOUT = 30
+# e.g. http://127.0.0.1:8090/calendar/v3/ for bench.local.GoogleStub; unset in production
+GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+_models = {}
+_models_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_model(name: str = GEMINI_MODEL, **config) -> genai.GenerativeModel:
+    """Shared GenerativeModel for this name + kwargs (generation_config, tools, ...)."""
+    key = (name, repr(sorted(config.items())))
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = genai.GenerativeModel(name, **config)
+    return model
+
+
+def _thread_http() -> httplib2.Http:
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = _local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    return http
+
+
+def calendar_service():
+    """Calendar v3 service for this thread (credential-less; see authorized_http)."""
+    service, endpoint = getattr(_local, "calendar", (None, None))
+    if service is None or endpoint != GOOGLE_API_ENDPOINT:
+        endpoint = GOOGLE_API_ENDPOINT
+        service = build(
+            "calendar",
+            "v3",
+            http=_thread_http(),
+            static_discovery=True,
+            cache_discovery=False,
+            client_options={"api_endpoint": endpoint} if endpoint else None,
+        )
+        _local.calendar = service, endpoint
+    return service
+
+
+def authorized_http(creds):
+    """Per-user auth over this thread's pooled connection: pass to .execute(http=...)."""
+    return google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http())
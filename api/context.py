@@ -0,0 +1,137 @@
+"""
+Token-budgeted task context for ask_gemini.
+
+Instead of str(tasks) (a Python repr of every task, full Canvas HTML included)
+Gemini gets one compact JSON line per task with short keys, tag-stripped and
+truncated descriptions, and only the tasks that matter for this conversation:
+
+  1. everything in the current/upcoming window (always, descriptions dropped
+     before tasks are dropped if the budget is tight),
+  2. then tasks whose titles share words with the recent user messages,
+until CONTEXT_TOKEN_BUDGET is spent.
+"""
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from api.scheduler import local_now, parse_time
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+WINDOW_PAST_DAYS = 1
+WINDOW_AHEAD_DAYS = 14
+DESC_CHARS = 160
+RECENT_USER_MESSAGES = 4
+
+HEADER = (
+    "USER TASKS, one JSON per line "
+    "(i=id t=title s=startTime e=endTime d=dueDate f=isFlexible p=priority x=notes):\n"
+)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z0-9]{3,}")
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "my", "can", "you", "please",
+    "move", "add", "remove", "delete", "schedule", "reschedule", "task", "tasks",
+    "today", "tomorrow", "week", "next", "what", "when", "have", "from", "into",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token for English/JSON; close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def compact_task(t: dict, with_desc: bool = True) -> str:
+    c = {
+        "i": str(t["_id"]),
+        "t": t.get("title"),
+        "s": t.get("startTime"),
+        "e": t.get("endTime"),
+        "d": t.get("dueDate"),
+    }
+    if "isFlexible" in t:
+        c["f"] = 1 if t["isFlexible"] else 0
+    if t.get("priority") and t["priority"] != "med":
+        c["p"] = t["priority"]
+    if with_desc and t.get("description"):
+        desc = _SPACE_RE.sub(" ", _TAG_RE.sub(" ", t["description"])).strip()
+        if desc:
+            c["x"] = desc[:DESC_CHARS] + ("…" if len(desc) > DESC_CHARS else "")
+    return json.dumps(
+        {k: v for k, v in c.items() if v is not None},
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def _terms(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower())) - _STOPWORDS
+
+
+def _task_time(t: dict):
+    return parse_time(t.get("startTime")) or parse_time(t.get("dueDate"))
+
+
+def context_window(now: datetime = None):
+    """(lo, hi) of the always-included window; tasks outside it need a title match."""
+    if now is None:
+        now = local_now()
+    return now - timedelta(days=WINDOW_PAST_DAYS), now + timedelta(days=WINDOW_AHEAD_DAYS)
+
+
+def build_context(tasks, convo, now: datetime = None, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Returns (context_text, stats) where stats reports
+    {"tasks": total, "included": n, "tokens": estimated tokens used, "budget": budget}.
+    """
+    if now is None:
+        now = local_now()
+    lo, hi = context_window(now)
+
+    user_text = " ".join(
+        " ".join(str(p) for p in m.get("parts", []))
+        for m in [m for m in convo if m.get("role") == "user"][-RECENT_USER_MESSAGES:]
+    )
+    wanted = _terms(user_text)
+
+    window, relevant = [], []
+    for t in tasks:
+        when = _task_time(t)
+        if when is not None and lo <= when <= hi:
+            window.append((abs((when - now).total_seconds()), t))
+        elif wanted:
+            score = len(wanted & _terms(t.get("title")))
+            if score:
+                relevant.append((-score, t))
+    window.sort(key=lambda p: p[0])
+    relevant.sort(key=lambda p: p[0])
+
+    used = estimate_tokens(HEADER)
+    lines = []
+
+    # 1) window: with descriptions if they fit, otherwise without
+    for with_desc in (True, False):
+        candidate = [compact_task(t, with_desc) for _, t in window]
+        cost = sum(estimate_tokens(line) + 1 for line in candidate)
+        if used + cost <= budget or not with_desc:
+            break
+    for line in candidate:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break  # nearest-to-now first, so what's cut is the farthest out
+        lines.append(line)
+        used += cost
+
+    # 2) conversation-relevant tasks outside the window
+    for _, t in relevant:
+        line = compact_task(t)
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+
+    stats = {"tasks": len(tasks), "included": len(lines), "tokens": used, "budget": budget}
+    return HEADER + "\n".join(lines), stats
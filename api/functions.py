@@ -10,6 +10,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as grequests
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from pymongo import MongoClient, ASCENDING, errors, UpdateOne
 from bson import ObjectId
@@ -17,11 +18,31 @@ from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-import re
 import json
+import time
+
+from api import metrics
+from api.actions import (
+    ACTION_TOOL_CONFIG,
+    ACTION_TOOLS,
+    CLASSIFICATION_CONFIG,
+    action_from_call,
+    reply_parts,
+)
+from api.clients import get_model, calendar_service, authorized_http
+from api.logs import get_logger
+from api.recurrence import SERIES_FIELDS, series_fields, wall_time
+from api.scheduler import TIME_ZONE
+from api.canvas import (
+    fetch_courses,
+    fetch_assignments,
+    assignments_to_tasks,
+)
 
 CANVAS_URL = "https://njit.instructure.com"
 
+log = get_logger(__name__)
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -39,81 +60,19 @@ def now_iso():
 SYSTEM_PROMPT = """You are an advanced task management assistant.
 
 Your job:
-- Detect the user’s intent: **add | remove | reschedule | summarize | autoschedule**.
-- Return ONLY a JSON object in the exact format shown below.
+- Detect the user’s intent: **add | remove | reschedule | summarize | autoschedule**
+  and act on it by calling the matching function.
+- Answer in plain text (no function call) to ask for clarification or to reply to anything else.
 - Dates must always be in strict **YYYY-MM-DDTHH:MM** 24-hour ISO8601 format.
-- **If you do not have enough information to fill all required fields (e.g., startTime, endTime, title, description, dueDate), ASK the user for clarification BEFORE returning JSON.**
+- **If you do not have enough information to fill all required fields (e.g., startTime, endTime, title, description, dueDate), ASK the user for clarification BEFORE calling a function.**
 - Never guess times or details; always confirm missing info.
 - Flexible tasks CANNOT overlap with fixed tasks.
 - A flexible task's scheduled time (startTime and endTime) MUST never be after its dueDate
 - Use the current time to resolve relative days (e.g. today, tomorrow, this week)
-
----
-
-### ALLOWED OUTPUT FORMATS
-
-#### 1️⃣ RESCHEDULE
-User wants to move an existing task:
-{
-  "intent": "reschedule",
-  "id": "abc-123",
-  "startTime": "2025-09-29T09:00",
-  "endTime": "2025-09-29T10:00"
-}
-
-#### 2️⃣ ADD
-User wants to create a new task:
-{
-  "intent": "add",
-  "title": "Draft the presentation slides",
-  "description": "",
-  "startTime": null,
-  "endTime": null,
-  "dueDate": "2025-10-03T23:59"
-}
-
-#### 3️⃣ REMOVE
-User wants to delete a task:
-{
-  "intent": "remove",
-  "id": "xyz-789"
-}
-
-#### 4️⃣ SUMMARIZE
-User wants a summary of changes:
-{
-  "intent": "summarize",
-  "summary": "Plain English summary of recent task changes."
-}
-
-#### 5️⃣ AUTOSCHEDULE
-User wants to auto-schedule flexible tasks:
-{
-  "intent": "autoschedule",
-  "changes": [
-    {
-      "id": "existing-id",
-      "source": "manual|google|canvas|ai",
-      "externalId": "string|null",
-      "title": "Study for physics exam",
-      "description": "Chapter 3 & 4",
-      "startTime": "2025-09-29T14:00",
-      "endTime": "2025-09-29T16:00",
-      "dueDate": "2025-09-30T23:59",
-      "estimatedMinutes": 120,
-      "minutesTaken": 0,
-      "isFlexible": true,
-      "status": "todo",
-      "priority": "med"
-    }
-  ],
-  "summary": "Scheduled study blocks for upcoming physics exam."
-}
-
----
+- For autoschedule the server computes the time slots; do NOT list changes.
 
 ### RULES
-- DO NOT OUTPUT JSON IF YOU DONT HAVE ALL THE INFORMATION
+- DO NOT CALL A FUNCTION IF YOU DONT HAVE ALL THE INFORMATION
 - **Do NOT modify or delete immovable tasks** (exams, classes, deadlines).
 - **Flexible tasks only** may be auto-scheduled between **08:00–22:00**.
 - Avoid double-booking. Spread load across days if needed.
@@ -133,61 +92,125 @@ def hashStr(text: str):
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def ask_gemini(convo: list, tasks) -> str:
+def start_gemini_chat(convo: list, context: str):
     """
-    Send user input to Gemini and return response text.
+    Chat session primed with the system prompt, task context and earlier turns,
+    with the intents declared as functions (api/actions.py).
     """
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    model = get_model(tools=ACTION_TOOLS, tool_config=ACTION_TOOL_CONFIG)
 
     # Include system prompt in the first user message
-    chat = model.start_chat(
+    return model.start_chat(
         history=[
             {"role": "user", "parts": [SYSTEM_PROMPT]},
-            {"role": "user", "parts": [str(tasks)]},
+            {"role": "user", "parts": [context]},
             *convo[:-1],
         ]
     )
-    print(convo)
 
-    response = chat.send_message(convo[-1]["parts"])
-    return response.text
 
+def _chat_prompt(convo: list, context: str) -> str:
+    """What start_gemini_chat sends, for token estimates when usage_metadata is missing."""
+    turns = " ".join(str(part) for turn in convo for part in turn.get("parts", []))
+    return f"{SYSTEM_PROMPT}{context}{turns}"
 
-def ask_gemini1(prompt):
-    """
-    Send user input to Gemini and return response text.
-    """
-    model = genai.GenerativeModel("gemini-2.0-flash")
 
-    # Include system prompt in the first user message
-    chat = model.start_chat()
+def _meter_call(meter, chat, response, t0, prompt, reply):
+    # meter: api.usage.LLMMeter (None = not accounted, e.g. scripts)
+    if meter is not None:
+        meter.add(
+            chat.model.model_name,
+            getattr(response, "usage_metadata", None),
+            time.perf_counter() - t0,
+            prompt=prompt,
+            reply=reply,
+        )
 
-    response = chat.send_message(prompt)
-    return response.text
 
+def _chat_parts(response):
+    """Parts of a reply or stream chunk (none for a chunk that only carries metadata)."""
+    return response.parts if response.candidates else []
 
-def parse_ai_response(response: str):
+
+def ask_gemini(convo: list, context: str, meter=None):
     """
-    Parses Gemini response and converts times to datetime objects.
+    Send user input to Gemini.
+    context: compact task listing from api.context.build_context
+    Returns (text, actions): actions are validated intent dicts from the
+    function calls in the reply (api.actions.action_from_call), usually
+    none or one. Raises api.actions.ActionError for a malformed call.
     """
+    chat = start_gemini_chat(convo, context)
+    t0 = time.perf_counter()
+    with metrics.stage("gemini.chat"):
+        response = chat.send_message(convo[-1]["parts"])
+    text, calls = reply_parts(_chat_parts(response))
+    _meter_call(meter, chat, response, t0, _chat_prompt(convo, context), text)
+    return text, [action_from_call(c.name, c.args) for c in calls]
 
-    response_clean = re.sub(
-        r"```(?:json)?\n?(.*?)```", r"\1", response, flags=re.DOTALL
-    ).strip()
 
-    try:
-        data = json.loads(response_clean)
-    except json.JSONDecodeError:
-        raise ValueError("AI response is not valid JSON:\n" + response_clean)
+def ask_gemini_stream(convo: list, context: str, meter=None):
+    """
+    Streaming variant of ask_gemini: yields ("text", piece) as Gemini writes
+    the reply and ("action", intent dict) for each function call.
+    gemini.stream covers the whole reply, first to last chunk.
+    """
+    chat = start_gemini_chat(convo, context)
+    t0 = time.perf_counter()
+    parts = []
+    with metrics.stage("gemini.stream"):
+        response = chat.send_message(convo[-1]["parts"], stream=True)
+        for chunk in response:
+            text, calls = reply_parts(_chat_parts(chunk))
+            if text:
+                parts.append(text)
+                yield "text", text
+            for c in calls:
+                yield "action", action_from_call(c.name, c.args)
+    _meter_call(meter, chat, response, t0, _chat_prompt(convo, context), "".join(parts))
+
+
+async def ask_gemini_async(convo: list, context: str, meter=None):
+    """ask_gemini for the ASGI app (api/asgi.py): awaits Gemini instead of blocking."""
+    chat = start_gemini_chat(convo, context)
+    t0 = time.perf_counter()
+    with metrics.stage("gemini.chat"):
+        response = await chat.send_message_async(convo[-1]["parts"])
+    text, calls = reply_parts(_chat_parts(response))
+    _meter_call(meter, chat, response, t0, _chat_prompt(convo, context), text)
+    return text, [action_from_call(c.name, c.args) for c in calls]
+
+
+async def ask_gemini_stream_async(convo: list, context: str, meter=None):
+    """Async generator variant of ask_gemini_stream."""
+    chat = start_gemini_chat(convo, context)
+    t0 = time.perf_counter()
+    parts = []
+    with metrics.stage("gemini.stream"):
+        response = await chat.send_message_async(convo[-1]["parts"], stream=True)
+        async for chunk in response:
+            text, calls = reply_parts(_chat_parts(chunk))
+            if text:
+                parts.append(text)
+                yield "text", text
+            for c in calls:
+                yield "action", action_from_call(c.name, c.args)
+    _meter_call(meter, chat, response, t0, _chat_prompt(convo, context), "".join(parts))
+
+
+def ask_gemini1(prompt, meter=None, **config):
+    """
+    Send a one-off prompt to Gemini and return response text.
+    config: GenerativeModel kwargs, e.g. generation_config with a response_schema.
+    """
+    model = get_model(**config)
 
-    for change in data.get("changes", []):
-        for key in ["startTime", "endTime", "dueDate"]:
-            if change.get(key):
-                # Parse ISO8601 string
-                dt = datetime.strptime(change[key], "%Y-%m-%dT%H:%M")
-                change[key] = dt.strftime("%Y-%m-%dT%H:%M")  # ISO8601 string
+    chat = model.start_chat()
 
-    return data
+    t0 = time.perf_counter()
+    response = chat.send_message(prompt)
+    _meter_call(meter, chat, response, t0, prompt, response.text)
+    return response.text
 
 
 def as_object_id(maybe_id: str):
@@ -199,10 +222,10 @@ def as_object_id(maybe_id: str):
 
 def gcal_event_to_task(ev, user_oid):
     start_iso = ev.get("start", {}).get("dateTime") or (
-        ev.get("start", {}).get("date") and f"{ev['start']['date']}T00:00:00Z"
+        ev.get("start", {}).get("date") and f"{ev['start']['date']}T00:00:00"
     )
     end_iso = ev.get("end", {}).get("dateTime") or (
-        ev.get("end", {}).get("date") and f"{ev['end']['date']}T00:00:00Z"
+        ev.get("end", {}).get("date") and f"{ev['end']['date']}T00:00:00"
     )
     title = ev.get("summary") or "(No title)"
     desc = ev.get("description") or ""
@@ -219,15 +242,16 @@ def gcal_event_to_task(ev, user_oid):
         except:
             return 60
 
-    return {
+    task = {
         "_id": ObjectId(),  # new task id if we end up pushing
         "source": "google",
         "externalId": ev.get("id"),
         "title": title,
         "description": desc,
-        "startTime": start_iso[:-9],
-        "endTime": end_iso[:-9],
-        "dueDate": end_iso[:-9],
+        # local wall time, 'YYYY-MM-DDTHH:MM' (drops seconds and offset/Z)
+        "startTime": start_iso[:16],
+        "endTime": end_iso[:16],
+        "dueDate": end_iso[:16],
         "estimatedMinutes": mins(start_iso, end_iso),
         "minutesTaken": 0,
         "status": "todo",
@@ -235,58 +259,185 @@ def gcal_event_to_task(ev, user_oid):
         "createdAt": now_iso(),
         "updatedAt": now_iso(),
     }
+    # recurring series: the master keeps the rule, edited occurrences point at it
+    if ev.get("recurrence"):
+        task.update(series_fields(ev, task["startTime"], task["endTime"]))
+    elif ev.get("recurringEventId"):
+        task["recurringEventId"] = ev["recurringEventId"]
+        task["originalStartTime"] = wall_time(ev.get("originalStartTime"))
+    return task
+
+
+# Fields each provider owns; user-side fields (status, minutesTaken, isFlexible,
+# and the scheduled startTime/endTime of Canvas assignments) are never overwritten.
+SYNC_FIELDS = {
+    "google": ("title", "description", "startTime", "endTime", "dueDate", "estimatedMinutes"),
+    "canvas": ("title", "description", "dueDate"),
+}
 
 
-def upsert_google_events_embedded(users_col, user_oid, events):
-    ops = []
-    for ev in events:
-        doc = gcal_event_to_task(ev, user_oid)
-        # First: try to update existing element with same externalId
-        ops.append(
-            UpdateOne(
-                {
-                    "_id": user_oid,
-                    "tasks.externalId": doc["externalId"],
-                    "tasks.source": "google",
-                },
-                {
-                    "$set": {
-                        "tasks.$[e].title": doc["title"],
-                        "tasks.$[e].description": doc["description"],
-                        "tasks.$[e].startTime": doc["startTime"],
-                        "tasks.$[e].endTime": doc["endTime"],
-                        "tasks.$[e].dueDate": doc["dueDate"],
-                        "tasks.$[e].estimatedMinutes": doc["estimatedMinutes"],
-                        "tasks.$[e].updatedAt": now_iso(),
-                    }
-                },
-                array_filters=[
-                    {"e.externalId": doc["externalId"], "e.source": "google"}
-                ],
-            )
-        )
-        # Second op: if none matched, push a new one (won't hurt if first already matched)
-        ops.append(
-            UpdateOne(
-                {
-                    "_id": user_oid,
-                    "tasks": {
-                        "$not": {
-                            "$elemMatch": {
-                                "externalId": doc["externalId"],
-                                "source": "google",
-                            }
-                        }
-                    },
-                },
-                {"$push": {"tasks": doc}},
-            )
-        )
-    if ops:
-        users_col.bulk_write(ops, ordered=False)
+# Google series fields (api/recurrence.py) are also provider-owned, but only
+# hashed when set, so plain events keep the hashes they were stored with.
+OPTIONAL_SYNC_FIELDS = {"google": SERIES_FIELDS, "canvas": ()}
+
 
+def content_hash(doc: dict, source: str) -> str:
+    """Fingerprint of the provider-owned fields of a normalized task."""
+    values = [doc.get(f) for f in SYNC_FIELDS[source]]
+    values += [[f, doc[f]] for f in OPTIONAL_SYNC_FIELDS[source] if doc.get(f) is not None]
+    raw = json.dumps(values, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
-def list_events_with_google_client(tokens: dict, tz="America/New_York"):
+
+def merge_synced_tasks(store, user_oid, source, docs, removed_ids=(), prune=None, extra_updates=()):
+    """
+    Read-once diff-merge of normalized provider tasks into the user's tasks.
+
+    docs: normalized tasks (gcal_event_to_task / normalize_canvas_task) with externalId
+    removed_ids: externalIds the provider reports as deleted/cancelled
+    prune: filter - tasks of this source matching it that are not in docs
+           are stale and get removed (used on full syncs)
+    extra_updates: (task_oid, fields) pairs written in the same apply
+
+    Loads only the affected tasks in one query (externalId + contentHash),
+    skips every doc whose contentHash is unchanged, and sends the remaining
+    inserts/updates/deletes in a single TaskStore.apply (one bulk_write).
+    Returns {"added", "changed", "unchanged", "removed"} counts.
+    """
+    fields = SYNC_FIELDS[source] + OPTIONAL_SYNC_FIELDS[source]
+    ids = [d["externalId"] for d in docs] + list(removed_ids)
+    match = [{"externalId": {"$in": ids}}]
+    if prune:
+        match.append(prune)
+    if source == "canvas":
+        # tasks ingested before Canvas ids were stored: adopt them by title + dueDate
+        match.append({"externalId": None, "title": {"$in": [d["title"] for d in docs]}})
+    projection = {"externalId": 1, "contentHash": 1, "title": 1, "dueDate": 1}
+    existing = {}
+    legacy = {}
+    for t in store.find(user_oid, {"source": source, "$or": match}, projection):
+        if t.get("externalId"):
+            existing[t["externalId"]] = t
+        elif source == "canvas":
+            # prune also matches local docs (chat-made overrides); never adopt those
+            legacy[(t.get("title"), t.get("dueDate"))] = t
+
+    inserts, updates, deletes = [], [], []
+    counts = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+    now = now_iso()
+    seen = set()
+    for doc in docs:
+        ext = doc["externalId"]
+        seen.add(ext)
+        digest = content_hash(doc, source)
+        cur = existing.get(ext)
+        adopt = cur is None and legacy.pop((doc.get("title"), doc.get("dueDate")), None)
+
+        if cur is None and not adopt:
+            doc["contentHash"] = digest
+            inserts.append(doc)
+            existing[ext] = doc  # repeated ids in one batch become updates
+            counts["added"] += 1
+            continue
+
+        cur = cur or adopt
+        if cur.get("contentHash") == digest:
+            counts["unchanged"] += 1
+            continue
+        update = {f: doc.get(f) for f in fields}
+        update.update({"externalId": ext, "contentHash": digest, "updatedAt": now})
+        updates.append((cur["_id"], update))
+        cur["contentHash"] = digest
+        existing[ext] = cur
+        counts["changed"] += 1
+
+    for ext in removed_ids:
+        cur = existing.get(ext)
+        if cur and ext not in seen:
+            deletes.append(cur["_id"])
+            seen.add(ext)
+            counts["removed"] += 1
+
+    if prune:
+        for ext, cur in existing.items():
+            if ext not in seen:
+                deletes.append(cur["_id"])
+                counts["removed"] += 1
+
+    store.apply(user_oid, inserts, updates + list(extra_updates), deletes)
+    return counts
+
+
+def merge_google_events(store, user_oid, events, prune_after: str = None):
+    """
+    Diff-merge raw Google events (live and cancelled) into the user's tasks.
+
+    prune_after: set on a full sync. Google tasks ending after this
+    ('YYYY-MM-DDTHH:MM') that the sync didn't return are stale and get deleted,
+    and so are recurring masters whose series runs past it.
+
+    A cancelled occurrence of a recurring series becomes an exdate on its
+    master. An incremental sync only sees the new cancellations, so it adds them
+    to the stored exdates; a full sync returns them all and replaces them. A
+    cancelled master takes its edited occurrences with it.
+    """
+    docs = [gcal_event_to_task(ev, user_oid) for ev in events if ev.get("status") != "cancelled"]
+    cancelled = [ev for ev in events if ev.get("status") == "cancelled"]
+    removed = [ev.get("id") for ev in cancelled]
+
+    exdates = {}  # Google series id -> cancelled occurrence start times
+    gone_series = []
+    for ev in cancelled:
+        if ev.get("recurringEventId"):
+            exdates.setdefault(ev["recurringEventId"], set()).add(wall_time(ev.get("originalStartTime")))
+        else:
+            gone_series.append(ev.get("id"))
+
+    masters = {d["externalId"]: d for d in docs if d.get("recurrence")}
+    lookup = set(exdates) - set(masters)
+    if not prune_after:
+        lookup |= set(masters)
+    stored = {}
+    if lookup or gone_series:
+        query = {
+            "source": "google",
+            "$or": [
+                {"externalId": {"$in": list(lookup)}, "recurrence": {"$ne": None}},
+                {"recurringEventId": {"$in": gone_series}},
+            ],
+        }
+        for t in store.find(user_oid, query, {"externalId": 1, "exdates": 1, "recurringEventId": 1}):
+            if t.get("recurringEventId"):
+                removed.append(t["externalId"])  # edited occurrence of a cancelled series
+            else:
+                stored[t["externalId"]] = t
+
+    for ext, doc in masters.items():
+        dates = exdates.get(ext, set())
+        if not prune_after:
+            dates |= set(stored.get(ext, {}).get("exdates") or ())
+        doc["exdates"] = sorted(dates)
+    extra_updates = []
+    for ext, dates in exdates.items():
+        cur = stored.get(ext)
+        if ext not in masters and cur is not None:
+            dates = sorted(dates | set(cur.get("exdates") or ()))
+            if dates != cur.get("exdates"):
+                extra_updates.append((cur["_id"], {"exdates": dates, "updatedAt": now_iso()}))
+
+    prune = None
+    if prune_after:
+        prune = {
+            "$or": [
+                {"endTime": {"$gt": prune_after}},
+                {"seriesEnd": {"$gt": prune_after}},
+                {"recurrence": {"$ne": None}, "seriesEnd": None},
+            ]
+        }
+    return merge_synced_tasks(store, user_oid, "google", docs, removed, prune, extra_updates)
+
+
+def list_events_with_google_client(tokens: dict, sync_token: str = None, tz=TIME_ZONE):
     """
     tokens: {
       "access_token": "...",
@@ -297,9 +448,79 @@ def list_events_with_google_client(tokens: dict, tz="America/New_York"):
       "scopes": ["https://www.googleapis.com/auth/calendar.readonly"],
       "expiry": None              # optional ISO string; library updates this after refresh
     }
+    sync_token: nextSyncToken from the previous sync. With it only changed and
+    cancelled events come back; without it this is a full sync from now on.
+
+    Follows nextPageToken to the end and returns (events, next_sync_token).
+    Raises googleapiclient.errors.HttpError (status 410) if sync_token expired.
+    """
+    creds = google_credentials(tokens)
+
+    # shared per-thread service + connection; only the credentials are per user
+    service = calendar_service()
+    http = authorized_http(creds)
+
+    params = {
+        "calendarId": "primary",
+        # recurring events come back once, as a rule (api/recurrence.py)
+        "singleEvents": False,
+        "timeZone": tz,
+        "maxResults": 2500,
+    }
+    if sync_token:
+        # timeMin/timeMax/orderBy are not allowed together with syncToken
+        params["syncToken"] = sync_token
+    else:
+        params["timeMin"] = datetime.now(timezone.utc).isoformat()
+
+    events = []
+    page_token = None
+    while True:
+        with metrics.stage("google.http"):
+            resp = service.events().list(pageToken=page_token, **params).execute(http=http)
+        events.extend(resp.get("items", []))
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            refreshed_tokens(tokens, creds)
+            # nextSyncToken is only present on the last page
+            return events, resp.get("nextSyncToken")
+
+
+def watch_google_calendar(tokens: dict, channel_id: str, address: str, channel_token: str, ttl_seconds: int):
+    """
+    events.watch on the primary calendar: Google POSTs to `address` whenever
+    it changes (see api/google_push.py). Returns the channel resource
+    {"id", "resourceId", "expiration" (ms since epoch, string), ...}.
     """
-    # Build Credentials object directly from your token dict:
-    creds = Credentials(
+    creds = google_credentials(tokens)
+    body = {
+        "id": channel_id,
+        "type": "web_hook",
+        "address": address,
+        "token": channel_token,
+        "params": {"ttl": str(ttl_seconds)},
+    }
+    with metrics.stage("google.http"):
+        channel = calendar_service().events().watch(calendarId="primary", body=body).execute(
+            http=authorized_http(creds)
+        )
+    refreshed_tokens(tokens, creds)
+    return channel
+
+
+def stop_google_channel(tokens: dict, channel_id: str, resource_id: str):
+    """channels.stop: no more notifications on this channel."""
+    creds = google_credentials(tokens)
+    with metrics.stage("google.http"):
+        calendar_service().channels().stop(body={"id": channel_id, "resourceId": resource_id}).execute(
+            http=authorized_http(creds)
+        )
+    refreshed_tokens(tokens, creds)
+
+
+def google_credentials(tokens: dict) -> Credentials:
+    """Credentials from a token dict (see list_events_with_google_client)."""
+    return Credentials(
         tokens["access_token"],
         refresh_token=tokens.get("refresh_token"),
         token_uri=tokens.get("token_uri", "https://oauth2.googleapis.com/token"),
@@ -309,33 +530,62 @@ def list_events_with_google_client(tokens: dict, tz="America/New_York"):
         or ["https://www.googleapis.com/auth/calendar.readonly"],
     )
 
-    service = build("calendar", "v3", credentials=creds)
 
-    time_min = datetime.now(timezone.utc).isoformat()
-    time_max = (datetime.now(timezone.utc) + timedelta(days=14)).isoformat()
+def refreshed_tokens(tokens: dict, creds: Credentials):
+    """google-auth refreshes an expired access token in place; hand it back through `tokens`."""
+    tokens["access_token"] = creds.token
+    tokens["expiry"] = creds.expiry.replace(tzinfo=timezone.utc).isoformat() if creds.expiry else None
 
-    page_token = None
-    resp = (
-        service.events()
-        .list(
-            calendarId="primary",
-            singleEvents=True,
-            orderBy="startTime",
-            timeZone=tz,
-            timeMin=time_min,
-            timeMax=time_max,
-            pageToken=page_token,
-            maxResults=2500,
+
+GOOGLE_SYNC_MODE = "series"
+
+
+def sync_google_calendar(store, users_col, user_oid, tokens: dict):
+    """
+    Incremental Google Calendar sync for one user.
+
+    Uses the stored google.sync_token when there is one, falls back to a full
+    resync when Google answers 410 Gone, diff-merges the events into the
+    user's tasks and stores the new sync token.
+    """
+    user = users_col.find_one({"_id": user_oid}, {"google.sync_token": 1, "google.sync_mode": 1}) or {}
+    google = user.get("google") or {}
+    sync_token = google.get("sync_token")
+    if google.get("sync_mode") != GOOGLE_SYNC_MODE:
+        # a token from a singleEvents=True listing would keep returning
+        # per-occurrence copies; resync once to store series as rules
+        sync_token = None
+
+    try:
+        events, next_token = list_events_with_google_client(tokens, sync_token)
+    except HttpError as e:
+        if not sync_token or e.resp.status != 410:
+            raise
+        log.info("google sync token expired, running full resync")
+        sync_token = None
+        events, next_token = list_events_with_google_client(tokens)
+
+    # A full sync lists every event from now on, so anything ending after
+    # tomorrow (margin for time zones) that didn't come back is stale.
+    prune_after = None
+    if not sync_token:
+        prune_after = (datetime.now(timezone.utc) + timedelta(days=1)).strftime(
+            "%Y-%m-%dT%H:%M"
         )
-        .execute()
-    )
-    events = resp.get("items", [])
-    return events
+    counts = merge_google_events(store, user_oid, events, prune_after=prune_after)
+
+    if next_token:
+        users_col.update_one(
+            {"_id": user_oid},
+            {"$set": {"google.sync_token": next_token, "google.sync_mode": GOOGLE_SYNC_MODE}},
+        )
+    log.info("google sync", extra={"mode": "incremental" if sync_token else "full", **counts})
+    return {**counts, "full": not sync_token}
 
 
 def getAllCanvasTasks(token: str):
+    """Raw tasks for the Fall 2025 assignments due in the next two weeks ([] without such courses), None if the fetch failed."""
     try:
-        print("Fetching all courses...")
         all_courses = fetch_courses(token, CANVAS_URL)
 
         # Filter for Fall 2025
@@ -346,90 +596,29 @@ def getAllCanvasTasks(token: str):
         ]
 
         if not fall_courses:
-            print("No Fall 2025 courses found.")
-            return
+            log.info("no Fall 2025 courses found")
+            return []
+
+        # All courses (and all their assignment pages) are fetched concurrently
+        by_course = fetch_assignments(
+            token, CANVAS_URL, [course["id"] for course in fall_courses]
+        )
 
         allTasks = []
-        print(f"Found {len(fall_courses)} Fall 2025 courses:")
         for course in fall_courses:
-            name = course.get("name", "N/A")
-            print(f"- {name}")
-
-            tasks = fetch_assignments_for_course(
-                token, CANVAS_URL, course["id"], weeks=2
-            )
-            print(f"  -> Found {len(tasks)} tasks")
-
+            tasks = assignments_to_tasks(by_course[course["id"]], weeks=2)
             allTasks.extend(tasks)
+        log.info(
+            "canvas fetch",
+            extra={
+                "courses": [course.get("name", "N/A") for course in fall_courses],
+                "tasks": len(allTasks),
+            },
+        )
         return allTasks
 
-    except Exception as e:
-        print(f"Error: {e}")
-
-
-def fetch_courses(token: str, base_url: str):
-    """
-    Fetch all Canvas courses with term info.
-    """
-    headers = {"Authorization": f"Bearer {token}"}
-    courses_url = f"{base_url}/api/v1/courses"
-    params = {"include[]": "term", "per_page": 100}
-
-    all_courses = []
-    while courses_url:
-        resp = requests.get(courses_url, headers=headers, params=params)
-        resp.raise_for_status()
-        all_courses.extend(resp.json())
-        params = None
-        courses_url = resp.links.get("next", {}).get("url")
-
-    return all_courses
-
-
-def fetch_assignments_for_course(
-    token: str, base_url: str, course_id: int, weeks: int = 2
-):
-    """
-    Fetch assignments for a course within a given time window.
-    """
-    headers = {"Authorization": f"Bearer {token}"}
-    assignments_url = f"{base_url}/api/v1/courses/{course_id}/assignments"
-    params = {"per_page": 100}
-
-    resp = requests.get(assignments_url, headers=headers, params=params)
-    resp.raise_for_status()
-    assignments = resp.json()
-
-    now = datetime.utcnow()
-    end_window = now + timedelta(weeks=weeks)
-
-    tasks = []
-    for a in assignments:
-        due_str = a.get("due_at")
-        if not due_str:
-            continue
-
-        # Canvas returns UTC with trailing Z
-        due_dt = datetime.strptime(due_str, "%Y-%m-%dT%H:%M:%SZ")
-        if not (now <= due_dt <= end_window):
-            continue
-
-        task = {
-            "userId": None,
-            "title": a["name"],
-            "description": a.get("description", ""),
-            "startTime": None,
-            "endTime": None,
-            "dueDate": due_dt.strftime("%Y-%m-%dT%H:%M"),
-            "estimatedMinutes": 60,
-            "minutesTaken": 0,
-            "source": "canvas",
-            "status": "todo",
-            "priority": "med",
-        }
-        tasks.append(task)
-
-    return tasks
+    except Exception:
+        log.exception("canvas fetch failed")
 
 
 def normalize_canvas_task(raw: dict) -> dict:
@@ -438,8 +627,8 @@ def normalize_canvas_task(raw: dict) -> dict:
     #  'dueDate': '2025-10-08T03:59', 'estimatedMinutes': 60, 'minutesTaken': 0,
     #  'isFlexible': True, 'source': 'canvas', 'status': 'todo', 'priority': 'med'}
     t = dict(raw)  # shallow copy
-    t.pop("userId", None)  # userId is redundant in embedded array
-    t["_id"] = ObjectId()  # embedded task id for client round-trips
+    t.pop("userId", None)  # TaskStore stamps the owner's ObjectId
+    t["_id"] = ObjectId()  # task id for client round-trips
     t.setdefault("source", "canvas")
     t.setdefault("status", "todo")
     t.setdefault("priority", "med")
@@ -450,64 +639,19 @@ def normalize_canvas_task(raw: dict) -> dict:
     return t
 
 
-def upsert_canvas_tasks_embedded(users_col, oid, raw_tasks):
-    if not raw_tasks:
-        return
-    ops = []
-    now = now_iso()
-    for rt in raw_tasks:
-        t = normalize_canvas_task(rt)
-        title = t.get("title")
-        due = t.get("dueDate")
-        # Try to update an existing task with same title + dueDate from Canvas
-        ops.append(
-            UpdateOne(
-                {
-                    "_id": oid,
-                    "tasks": {
-                        "$elemMatch": {
-                            "source": "canvas",
-                            "title": title,
-                            "dueDate": due,
-                        }
-                    },
-                },
-                {
-                    "$set": {
-                        "tasks.$.description": t.get("description"),
-                        "tasks.$.startTime": t.get("startTime"),
-                        "tasks.$.endTime": t.get("endTime"),
-                        "tasks.$.estimatedMinutes": t.get("estimatedMinutes"),
-                        "tasks.$.minutesTaken": t.get("minutesTaken", 0),
-                        "tasks.$.status": t.get("status", "todo"),
-                        "tasks.$.priority": t.get("priority", "med"),
-                        "tasks.$.updatedAt": now,
-                    }
-                },
-            )
-        )
-        # If none matched, push a new one
-        ops.append(
-            UpdateOne(
-                {
-                    "_id": oid,
-                    "tasks": {
-                        "$not": {
-                            "$elemMatch": {
-                                "source": "canvas",
-                                "title": title,
-                                "dueDate": due,
-                            }
-                        }
-                    },
-                },
-                {"$push": {"tasks": t}, "$set": {"updatedAt": now}},
-            )
-        )
-    users_col.bulk_write(ops, ordered=False)
+def merge_canvas_tasks(store, oid, raw_tasks, window=None):
+    """
+    Diff-merge Canvas tasks (matched on the Canvas assignment id).
+
+    window: (start, end) 'YYYY-MM-DDTHH:MM' due-date range the fetch covered;
+    Canvas tasks due inside it that Canvas no longer returns are removed.
+    """
+    docs = [normalize_canvas_task(rt) for rt in raw_tasks or []]
+    prune = {"dueDate": {"$gte": window[0], "$lte": window[1]}} if window else None
+    return merge_synced_tasks(store, oid, "canvas", docs, prune=prune)
 
 
-def classify_tasks_batch(tasks):
+def classify_tasks_batch(tasks, meter=None):
     """
     Sends a batch of tasks to Gemini for classification.
     Returns a dict {task_id: isFlexible}
@@ -528,67 +672,59 @@ def classify_tasks_batch(tasks):
     Tasks:
     {task_list_str}
 
-    Return ONLY valid JSON in this format:
-    {{
-      "results": [
-        {{"id": "<task_id>", "isFlexible": true|false}}
-      ]
-    }}
+    Give one result per task ID.
     """
 
-    response = ask_gemini1(prompt)
+    # the reply is constrained to {"results": [{"id", "isFlexible"}]}
+    with metrics.stage("gemini.classify"):
+        response = ask_gemini1(prompt, meter, generation_config=CLASSIFICATION_CONFIG)
 
     try:
-        data = parse_ai_response(response)
-        return {item["id"]: item["isFlexible"] for item in data["results"]}
+        data = json.loads(response)
+        return {item["id"]: bool(item["isFlexible"]) for item in data["results"]}
     except Exception as e:
         raise ValueError(f"AI response not valid JSON:\n{response}") from e
 
 
-def run_batch_classification(users_col, userID):
+def run_batch_classification(store, userID, classifier=None):
+    """
+    classifier: api.classifier.FlexibilityClassifier (rules + shared cache in
+    front of Gemini, token accounting and budget). Without one every pending
+    task goes to Gemini.
+    """
     oid = ObjectId(userID)
 
-    # 1) Get the user's tasks array
-    doc = users_col.find_one({"_id": oid}, {"tasks": 1})
-    if not doc or "tasks" not in doc:
-        print("No tasks for user.")
-        return
-
-    # 2) Pick tasks missing isFlexible (optionally also source == 'canvas')
-    pending = [t for t in (doc.get("tasks") or []) if "isFlexible" not in t]
+    # 1) Pick the user's tasks missing isFlexible (filtered server-side)
+    pending = list(
+        store.find(
+            oid,
+            {"isFlexible": {"$exists": False}},
+            {"_id": 1, "title": 1, "description": 1},
+        )
+    )
     if not pending:
-        print("No unclassified tasks.")
+        log.info("no unclassified tasks")
         return
-    print(pending)
 
-    # 3) Classify (whatever your classifier needs; here we pass the raw items)
-    classification = classify_tasks_batch(
-        pending
-    )  # expected: { "<task_id_str>": True/False, ... }
+    # 2) Classify -> { "<task_id_str>": True/False, ... }
+    if classifier is not None:
+        classification = classifier.classify(pending, user_oid=oid)
+    else:
+        classification = classify_tasks_batch(pending)
 
-    # 4) Bulk update embedded elements using positional $
-    ops = []
+    # 3) Bulk update the task documents
+    updates = []
     ts = now_iso()
     for t in pending:
-        tid = t["_id"]  # ObjectId in embedded task
+        tid = t["_id"]
         key = str(tid)  # your classifier keyed by string
         is_flex = classification.get(key)
         if is_flex is None:
             continue
-        ops.append(
-            UpdateOne(
-                {"_id": oid, "tasks._id": tid},
-                {
-                    "$set": {
-                        "tasks.$.isFlexible": bool(is_flex),
-                        "tasks.$.updatedAt": ts,
-                    }
-                },
-            )
-        )
+        updates.append((tid, {"isFlexible": bool(is_flex), "updatedAt": ts}))
 
-    if ops:
-        res = users_col.bulk_write(ops, ordered=False)
-        print(f"updated: {res.modified_count}")
+    if updates:
+        res = store.apply(oid, updates=updates)
+        log.info("classification saved", extra={"updated": res.modified_count})
     else:
-        print("Nothing to update.")
+        log.info("classification: nothing to update")
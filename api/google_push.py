@@ -0,0 +1,270 @@
+"""
+Push-based Google Calendar sync through events.watch notification channels.
+
+Polling lists a user's calendar on a timer whether or not anything changed.
+With GOOGLE_NOTIFY_URL set (the public https address of /googleNotify),
+every Google-connected user gets a watch channel on their primary calendar,
+and Google POSTs an empty notification there when the calendar changes:
+
+    X-Goog-Channel-ID       our channel id -> the user
+    X-Goog-Channel-Token    per-channel secret, checked before anything else
+    X-Goog-Resource-ID      Google's id for the watched calendar
+    X-Goog-Resource-State   "sync" (channel created, nothing to fetch) | "exists"
+    X-Goog-Message-Number
+
+An "exists" notification queues the usual google_sync job for that user: an
+incremental events.list from the stored sync token, so only the changed
+events come back. One edit often arrives as a burst of notifications;
+google.push.queuedAt coalesces them into a single queued sync. It's set by a
+conditional update only while no sync is queued and cleared when the sync
+starts (started()), so a change landing during a sync still queues the next.
+
+Channels expire (Google caps the TTL, about a week for Calendar). The
+renewal loop re-watches users whose channel ends within RENEW_BEFORE and
+watches connected users without one; google_sync does the same right after
+a user connects. The new channel is stored before the old one is stopped,
+so no change falls in between. A failed watch (revoked refresh token, a 4xx
+from Google) backs the user off via google.channelRetryAt, doubling up to
+MAX_RETRY_SECONDS, so they don't crowd every renewal batch; the batch takes
+the soonest-expiring channels first. Reconnecting clears the backoff.
+
+users.google {
+  ...,
+  channel: {id, resourceId, token, expiresAt: Date},
+  channelLeaseUntil: Date,     // one process (re)creates a channel at a time
+  channelFailures: int,        // consecutive failed watches
+  channelRetryAt: Date|null,   // no watch attempt before this
+  push: {queuedAt: Date|null, notifiedAt: Date}
+}
+
+Polling stays on as a backstop: SyncScheduler syncs users with a live
+channel at the idle interval (provider(..., live_field=...)).
+"""
+import hmac
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from pymongo import ASCENDING
+
+from api import metrics
+from api.functions import stop_google_channel, watch_google_calendar
+from api.logs import get_logger
+
+NOTIFY_URL = os.getenv("GOOGLE_NOTIFY_URL")
+CHANNEL_TTL_SECONDS = 7 * 24 * 3600  # what we ask for; Google may shorten it
+RENEW_BEFORE = timedelta(days=1)
+RENEW_SCAN_SECONDS = 600
+RENEW_BATCH = 200
+LEASE_SECONDS = 120
+RETRY_SECONDS = 600  # after the first failed watch, doubling per failure
+MAX_RETRY_SECONDS = 24 * 3600
+QUEUED_SECONDS = 600  # a queued sync that never started (process died) stops coalescing
+
+log = get_logger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)  # pymongo returns naive UTC
+
+
+class PushChannels:
+    def __init__(self, users_col, tokens_for, address: str = None):
+        """tokens_for(users.google doc) -> token dict for the Google client calls."""
+        self.users = users_col
+        self.tokens_for = tokens_for
+        self.address = address or NOTIFY_URL
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.address)
+
+    def ensure_indexes(self):
+        self.users.create_index("google.channel.id", sparse=True)
+        self.users.create_index([("google.channel.expiresAt", ASCENDING)])
+
+    # ---------- channels ----------
+    def needs_channel(self, google: dict, now: datetime = None) -> bool:
+        channel = google.get("channel") or {}
+        expires = channel.get("expiresAt")
+        return not expires or expires <= (now or _utcnow()) + RENEW_BEFORE
+
+    def claim(self, user_oid, now: datetime):
+        """Take the channel lease; returns the user's google doc, None if another process holds it."""
+        user = self.users.find_one_and_update(
+            {
+                "_id": user_oid,
+                "google.refresh_token": {"$nin": [None, ""]},
+                "$or": [
+                    {"google.channelLeaseUntil": None},
+                    {"google.channelLeaseUntil": {"$lt": now}},
+                ],
+            },
+            {"$set": {"google.channelLeaseUntil": now + timedelta(seconds=LEASE_SECONDS)}},
+            projection={"google": 1},
+        )
+        return (user or {}).get("google")
+
+    def watch(self, user_oid, google: dict) -> dict:
+        """New channel for the user (replacing and stopping the stored one); returns it."""
+        tokens = self.tokens_for(google)
+        channel_id = uuid4().hex
+        token = secrets.token_urlsafe(24)
+        resource = watch_google_calendar(tokens, channel_id, self.address, token, CHANNEL_TTL_SECONDS)
+        expires = datetime.fromtimestamp(int(resource["expiration"]) / 1000, timezone.utc)
+        channel = {
+            "id": channel_id,
+            "resourceId": resource["resourceId"],
+            "token": token,
+            "expiresAt": expires.replace(tzinfo=None),
+        }
+        update = {
+            "google.channel": channel,
+            "google.channelLeaseUntil": None,
+            "google.channelFailures": 0,
+            "google.channelRetryAt": None,
+        }
+        if tokens["access_token"] != google.get("access_token"):
+            update["google.access_token"] = tokens["access_token"]
+            update["google.expires_at"] = tokens["expiry"]
+        self.users.update_one({"_id": user_oid}, {"$set": update})
+        metrics.GOOGLE_PUSH.labels("watch").inc()
+
+        old = google.get("channel")
+        if old:
+            try:
+                stop_google_channel(tokens, old["id"], old["resourceId"])
+            except Exception as e:
+                # it expires on its own; its notifications no longer match a user
+                log.warning("google channel stop failed", extra={"error": str(e)})
+        return channel
+
+    def ensure(self, user_oid, google: dict, now: datetime = None) -> bool:
+        """Watch/renew the user's channel if it's missing or expiring; True if one was made."""
+        now = now or _utcnow()
+        if not self.enabled or not self.needs_channel(google, now):
+            return False
+        retry_at = google.get("channelRetryAt")
+        if retry_at and retry_at > now:
+            return False
+        google = self.claim(user_oid, now)
+        if google is None:
+            return False
+        try:
+            self.watch(user_oid, google)
+        except Exception:
+            metrics.GOOGLE_PUSH.labels("watch_failed").inc()
+            log.exception("google watch failed", extra={"userId": str(user_oid)})
+            failures = (google.get("channelFailures") or 0) + 1
+            wait = min(RETRY_SECONDS * 2 ** (failures - 1), MAX_RETRY_SECONDS)
+            self.users.update_one(
+                {"_id": user_oid},
+                {
+                    "$set": {
+                        "google.channelLeaseUntil": None,
+                        "google.channelFailures": failures,
+                        "google.channelRetryAt": now + timedelta(seconds=wait),
+                    }
+                },
+            )
+            return False
+        return True
+
+    def renew(self, now: datetime = None) -> int:
+        """ensure() for connected users whose channel is missing or expiring, soonest first."""
+        now = now or _utcnow()
+        cursor = (
+            self.users.find(
+                {
+                    "google.refresh_token": {"$nin": [None, ""]},
+                    "$and": [
+                        {
+                            "$or": [
+                                {"google.channel": None},
+                                {"google.channel.expiresAt": {"$lte": now + RENEW_BEFORE}},
+                            ]
+                        },
+                        {
+                            "$or": [
+                                {"google.channelRetryAt": None},
+                                {"google.channelRetryAt": {"$lte": now}},
+                            ]
+                        },
+                    ],
+                },
+                {"google": 1},
+            )
+            .sort("google.channel.expiresAt", ASCENDING)
+            .limit(RENEW_BATCH)
+        )
+        return sum(self.ensure(user["_id"], user["google"], now) for user in list(cursor))
+
+    # ---------- notifications ----------
+    def notify(self, headers):
+        """
+        One webhook POST -> (http status, user_oid to sync or None).
+        Unknown channels and bad tokens get 404 (Google doesn't retry 4xx).
+        """
+        channel_id = headers.get("X-Goog-Channel-ID")
+        state = headers.get("X-Goog-Resource-State")
+        user = None
+        if channel_id:
+            user = self.users.find_one({"google.channel.id": channel_id}, {"google.channel": 1})
+        channel = ((user or {}).get("google") or {}).get("channel") or {}
+        token = headers.get("X-Goog-Channel-Token") or ""
+        if (
+            not channel
+            or not hmac.compare_digest(token, channel.get("token") or "")
+            or headers.get("X-Goog-Resource-ID") != channel.get("resourceId")
+        ):
+            metrics.GOOGLE_PUSH.labels("unknown").inc()
+            return 404, None
+        if state != "exists":
+            metrics.GOOGLE_PUSH.labels(state or "unknown").inc()  # "sync": channel confirmed
+            return 200, None
+
+        now = _utcnow()
+        queued = self.users.update_one(
+            {
+                "_id": user["_id"],
+                "$or": [
+                    {"google.push.queuedAt": None},
+                    {"google.push.queuedAt": {"$lt": now - timedelta(seconds=QUEUED_SECONDS)}},
+                ],
+            },
+            {"$set": {"google.push.queuedAt": now, "google.push.notifiedAt": now}},
+        )
+        if not queued.modified_count:
+            metrics.GOOGLE_PUSH.labels("coalesced").inc()
+            return 200, None
+        metrics.GOOGLE_PUSH.labels("queued").inc()
+        return 200, user["_id"]
+
+    def started(self, user_oid):
+        """A Google sync for the user is starting: later notifications queue another one."""
+        if not self.enabled:
+            return
+        self.users.update_one({"_id": user_oid}, {"$set": {"google.push.queuedAt": None}})
+
+    # ---------- loop ----------
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="google-push-renew", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            try:
+                renewed = self.renew()
+                if renewed:
+                    log.info("google channels renewed", extra={"count": renewed})
+            except Exception:
+                log.exception("google channel renewal failed")
+            self.stopped.wait(RENEW_SCAN_SECONDS)
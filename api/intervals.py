@@ -0,0 +1,141 @@
+"""
+Overlap checks for AI-proposed task times.
+
+The prompt asks Gemini to keep add/reschedule results clear of fixed tasks,
+and plan_autoschedule routes around them, but nothing enforced it before the
+write. FixedIndex holds one user's fixed tasks (scheduler.is_fixed: Google
+events and anything not isFlexible) with times, as start-sorted arrays:
+
+    starts[i], ends[i], ids[i]    sorted by start
+    max_span                      longest fixed interval
+
+An interval [s, e) can only overlap a task starting in (s - max_span, e), so
+an overlap query is two bisects plus a scan of that (usually tiny) range:
+O(log n + k), a few microseconds for a user with thousands of tasks.
+
+IntervalIndexCache keeps one FixedIndex per user, tagged with the user's
+taskVersion (bumped by every TaskStore write), and only reloads the fixed
+tasks from Mongo once that version moves. Recurring series are indexed as
+their occurrences over recurrence.default_range().
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from cachetools import LRUCache
+
+from api.recurrence import SERIES_FIELDS, expand
+from api.scheduler import format_time, is_fixed, parse_time
+
+# the fields is_fixed(), the conflict report and recurrence.expand() need
+FIXED_PROJECTION = {
+    "title": 1, "startTime": 1, "endTime": 1, "isFlexible": 1, "source": 1, "externalId": 1,
+    **{f: 1 for f in SERIES_FIELDS},
+}
+
+
+def task_span(task: dict):
+    """(start, end) naive datetimes of a timed task, else None."""
+    s, e = parse_time(task.get("startTime")), parse_time(task.get("endTime"))
+    if s and e and e > s:
+        return s, e
+    return None
+
+
+class FixedIndex:
+    def __init__(self, tasks):
+        rows = []
+        for t in tasks:
+            if not is_fixed(t):
+                continue
+            span = task_span(t)
+            if span:
+                rows.append((span[0], span[1], t["_id"], t.get("title")))
+        rows.sort(key=lambda r: r[0])
+        self.starts = [r[0] for r in rows]
+        self.ends = [r[1] for r in rows]
+        self.ids = [r[2] for r in rows]
+        self.titles = [r[3] for r in rows]
+        self.max_span = max((e - s for s, e, _, _ in rows), default=timedelta(0))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def overlapping(self, start, end, exclude=()):
+        """Indexes of fixed tasks overlapping [start, end), minus ids in `exclude`."""
+        lo = bisect_right(self.starts, start - self.max_span)
+        hi = bisect_left(self.starts, end)
+        return [
+            i
+            for i in range(lo, hi)
+            if self.ends[i] > start and self.ids[i] not in exclude
+        ]
+
+    def describe(self, i) -> dict:
+        return {
+            "id": str(self.ids[i]),
+            "title": self.titles[i],
+            "startTime": format_time(self.starts[i]),
+            "endTime": format_time(self.ends[i]),
+        }
+
+
+def find_conflicts(index: FixedIndex, proposed, removed=()):
+    """
+    proposed: {task_oid: task doc as it would be written} for every task a
+    reply adds or moves; removed: oids the same reply deletes.
+
+    Each proposed timed task is checked against the stored fixed tasks (other
+    than the proposed and removed ones, whose stored times no longer apply)
+    and against the proposed fixed tasks. Returns
+      [{"id", "title", "startTime", "endTime", "with": [{"id", "title", "startTime", "endTime"}]}]
+    (empty when the reply is clear).
+    """
+    skip = set(proposed) | set(removed)
+    pending = FixedIndex(proposed.values())  # the proposed tasks that will be fixed
+
+    conflicts = []
+    for tid, task in proposed.items():
+        span = task_span(task)
+        if not span:
+            continue
+        s, e = span
+        hits = [index.describe(i) for i in index.overlapping(s, e, skip)]
+        hits += [pending.describe(i) for i in pending.overlapping(s, e, (tid,))]
+        if hits:
+            conflicts.append(
+                {
+                    "id": str(tid),
+                    "title": task.get("title"),
+                    "startTime": task.get("startTime"),
+                    "endTime": task.get("endTime"),
+                    "with": hits,
+                }
+            )
+    return conflicts
+
+
+class IntervalIndexCache:
+    """FixedIndex per user, rebuilt only when users.taskVersion changes."""
+
+    def __init__(self, task_store, maxsize: int = 5000):
+        self.task_store = task_store
+        self.cache = LRUCache(maxsize=maxsize)  # user_oid -> (version, FixedIndex)
+        self.lock = threading.Lock()
+
+    def get(self, user_oid):
+        # version before the tasks (like getTasks' ETag): a write landing in
+        # between leaves the entry tagged older than its data, so it's rebuilt
+        # on the next call instead of being trusted past that write
+        version = self.task_store.version(user_oid)
+        with self.lock:
+            hit = self.cache.get(user_oid)
+        if hit is not None and version is not None and hit[0] == version:
+            return hit[1]
+        index = FixedIndex(
+            expand(self.task_store.find(user_oid, {"startTime": {"$ne": None}}, FIXED_PROJECTION))
+        )
+        if version is not None:
+            with self.lock:
+                self.cache[user_oid] = (version, index)
+        return index
@@ -0,0 +1,186 @@
+"""
+Background job pipeline for ingestion (Canvas / Google sync + classification).
+
+Endpoints enqueue a job and return 202 right away; a worker runs the job's
+stages in order and records each stage's wall time on the job document so
+/jobStatus shows whether the time went to Canvas, Google, Mongo or Gemini.
+
+jobs {
+  _id: string,                 // job id handed to the client
+  userId: ObjectId,
+  kind: "canvas_sync|google_sync",
+  status: "queued|running|done|failed",
+  stages: [{name, status, ms}],
+  result: {...}|null,
+  error: string|null,
+  createdAt, startedAt, finishedAt: ISO8601,
+  expiresAt: Date              // TTL
+}
+
+Messages put on the queue are plain JSON-able dicts ({jobId, kind, payload})
+and handlers are looked up by kind, so the in-process pool can be swapped for
+a broker (LocalBrokerQueue is the local stand-in) without touching callers.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from uuid import uuid4
+
+from pymongo import ASCENDING
+
+from api import metrics
+from api.functions import now_iso
+from api.logs import get_logger
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_DAYS = 7
+
+log = get_logger(__name__)
+
+
+# ---------- Queues ----------
+class ThreadPoolQueue:
+    """Default: run jobs on an in-process thread pool."""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.consumer = None
+
+    def start(self, consumer):
+        self.consumer = consumer
+
+    def put(self, message: dict):
+        self.pool.submit(self.consumer, message)
+
+
+class LocalBrokerQueue:
+    """
+    Broker stand-in: a FIFO of messages drained by dedicated consumer threads,
+    the same shape a Redis/SQS worker loop would have.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.q = queue.Queue()
+        self.workers = workers
+        self.threads = []
+
+    def start(self, consumer):
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._drain, args=(consumer,), name=f"broker-{i}", daemon=True
+            )
+            t.start()
+            self.threads.append(t)
+
+    def _drain(self, consumer):
+        while True:
+            message = self.q.get()
+            try:
+                consumer(message)
+            finally:
+                self.q.task_done()
+
+    def put(self, message: dict):
+        self.q.put(message)
+
+
+QUEUES = {"threads": ThreadPoolQueue, "broker": LocalBrokerQueue}
+
+
+def make_queue(name: str = None):
+    return QUEUES[name or os.getenv("JOB_QUEUE", "threads")]()
+
+
+# ---------- Jobs ----------
+class Job:
+    """Handed to handlers; records per-stage timings on the job document."""
+
+    def __init__(self, jobs_col, job_id: str):
+        self.col = jobs_col
+        self.id = job_id
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        status = "failed"
+        try:
+            yield
+            status = "done"
+        finally:
+            seconds = time.perf_counter() - t0
+            metrics.observe(f"job.{name}", seconds)
+            ms = round(seconds * 1000, 1)
+            self.col.update_one(
+                {"_id": self.id},
+                {"$push": {"stages": {"name": name, "status": status, "ms": ms}}},
+            )
+
+
+class JobRunner:
+    def __init__(self, db, job_queue=None):
+        self.col = db["jobs"]
+        self.handlers = {}
+        self.queue = job_queue or make_queue()
+        self.queue.start(self._run)
+
+    def ensure_indexes(self):
+        self.col.create_index([("userId", ASCENDING), ("createdAt", ASCENDING)])
+        self.col.create_index("expiresAt", expireAfterSeconds=0)
+
+    def handler(self, kind: str):
+        """Decorator: register fn(job, payload) -> result dict for `kind`."""
+
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+
+        return register
+
+    def enqueue(self, kind: str, user_oid, payload: dict) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"no job handler for {kind!r}")
+        job_id = uuid4().hex
+        self.col.insert_one(
+            {
+                "_id": job_id,
+                "userId": user_oid,
+                "kind": kind,
+                "status": "queued",
+                "stages": [],
+                "result": None,
+                "error": None,
+                "createdAt": now_iso(),
+                "startedAt": None,
+                "finishedAt": None,
+                "expiresAt": datetime.now(timezone.utc) + timedelta(days=JOB_TTL_DAYS),
+            }
+        )
+        # the job's metrics are labeled with the route that enqueued it
+        route = metrics.labels()["route"]
+        self.queue.put({"jobId": job_id, "kind": kind, "payload": payload, "route": route})
+        return job_id
+
+    def _run(self, message: dict):
+        route = message.get("route")
+        metrics.begin(route if route and route != metrics.NONE else f"job:{message['kind']}")
+        job = Job(self.col, message["jobId"])
+        self.col.update_one(
+            {"_id": job.id}, {"$set": {"status": "running", "startedAt": now_iso()}}
+        )
+        try:
+            result = self.handlers[message["kind"]](job, message["payload"])
+            update = {"status": "done", "result": result}
+        except Exception as e:
+            log.exception("job failed", extra={"jobId": job.id, "kind": message["kind"]})
+            update = {"status": "failed", "error": str(e)}
+        update["finishedAt"] = now_iso()
+        self.col.update_one({"_id": job.id}, {"$set": update})
+
+    def get(self, job_id: str, user_oid):
+        return self.col.find_one(
+            {"_id": job_id, "userId": user_oid}, {"userId": 0, "expiresAt": 0}
+        )
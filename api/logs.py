@@ -0,0 +1,68 @@
+"""
+Structured logging for the API.
+
+    from api.logs import get_logger
+    log = get_logger(__name__)
+    log.info("google sync", extra={"mode": "full", "inserted": 3})
+
+One JSON object per line on stderr with ts, level, logger, msg, the current
+route/intent from api.metrics, any `extra` fields and the traceback for
+log.exception(). LOG_FORMAT=text gives plain lines for local runs;
+LOG_LEVEL sets the level (default INFO).
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+from api import metrics
+
+# attributes every LogRecord has; anything else came in through `extra`
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        scope = metrics.labels()
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "route": scope["route"],
+            "intent": scope["intent"],
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+FORMATTERS = {
+    "json": JsonFormatter,
+    "text": lambda: logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"),
+}
+
+_configured = False
+
+
+def configure(fmt: str = None, level: str = None):
+    """Install the handler on the `api` logger (idempotent)."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(FORMATTERS[fmt or os.getenv("LOG_FORMAT", "json")]())
+    root = logging.getLogger("api")
+    root.addHandler(handler)
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+    _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure()
+    return logging.getLogger(name)
@@ -0,0 +1,209 @@
+"""
+Per-stage latency metrics, exposed at /metrics in Prometheus text format.
+
+    horai_request_seconds{route, intent, status}   whole request, as served
+    horai_stage_seconds{stage, route, intent}      one stage inside a request/job
+    horai_llm_tokens_total{direction, intent, model}  Gemini tokens (api/usage.py)
+    horai_sync_*{provider}                          fleet sync queue (api/sync_scheduler.py)
+    horai_google_push_total{outcome}                push notifications / channel watches (api/google_push.py)
+
+Stages: mongo.read / mongo.write / mongo.other (every command, via a pymongo
+CommandListener), gemini.chat / gemini.stream / gemini.classify,
+canvas.http, google.http / google.token, classify, parse, context, overlap,
+plus the job stages (job.canvas_fetch, ...).
+
+route and intent are request-scoped labels kept in a ContextVar: the web
+apps set the route when a request starts, apply_ai_actions sets the intent
+once the reply is parsed, and background jobs inherit the route of the
+request that enqueued them, so a slow /canvasToken sync shows up as
+stage="canvas.http", route="/canvasToken". Work handed to a thread pool
+keeps the labels when submitted through carry().
+
+With several worker processes each one keeps its own registry unless
+PROMETHEUS_MULTIPROC_DIR is set (see the prometheus_client docs), in which
+case /metrics aggregates all of them.
+"""
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+NONE = "none"
+
+# seconds; Mongo round trips are ms, Gemini calls are seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "horai_request_seconds",
+    "Request latency as served",
+    ["route", "intent", "status"],
+    buckets=BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "horai_stage_seconds",
+    "Latency of one stage of a request or background job",
+    ["stage", "route", "intent"],
+    buckets=BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "horai_llm_tokens",
+    "Gemini tokens by direction (input/output)",
+    ["direction", "intent", "model"],
+)
+
+# fleet sync scheduler (api/sync_scheduler.py); one process may run it
+SYNC_QUEUE_DEPTH = Gauge(
+    "horai_sync_queue_depth", "Users overdue for a sync", ["provider"], multiprocess_mode="livemax"
+)
+SYNC_LAG_SECONDS = Gauge(
+    "horai_sync_lag_seconds", "How overdue the oldest queued sync is", ["provider"],
+    multiprocess_mode="livemax",
+)
+SYNC_IN_FLIGHT = Gauge(
+    "horai_sync_in_flight", "Scheduled syncs running", ["provider"], multiprocess_mode="livesum"
+)
+SYNC_DISPATCH_LAG = Histogram(
+    "horai_sync_dispatch_lag_seconds",
+    "Time between a sync falling due and starting",
+    ["provider"],
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600),
+)
+GOOGLE_PUSH = Counter(
+    "horai_google_push",
+    "Google Calendar push notifications and channel watches by outcome",
+    ["outcome"],
+)
+
+# a dict (not a tuple) so set_intent() from a worker thread started with
+# asyncio.to_thread / carry() is seen by the request that owns it
+_labels = ContextVar("metrics_labels", default=None)
+
+
+def labels() -> dict:
+    return _labels.get() or {"route": NONE, "intent": NONE}
+
+
+def begin(route: str, intent: str = NONE) -> dict:
+    """Start a fresh label scope (a request or a job) in the current context."""
+    scope = {"route": route or NONE, "intent": intent or NONE}
+    _labels.set(scope)
+    return scope
+
+
+def set_intent(intent: str):
+    scope = _labels.get()
+    if scope is not None:
+        scope["intent"] = intent or NONE
+
+
+def observe(stage: str, seconds: float):
+    scope = labels()
+    STAGE_SECONDS.labels(stage, scope["route"], scope["intent"]).observe(seconds)
+
+
+def observe_request(scope: dict, status: int, seconds: float):
+    REQUEST_SECONDS.labels(scope["route"], scope["intent"], str(status)).observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as `name` (recorded whether or not it raises)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """Decorator form of stage() for plain and async functions."""
+
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return run
+
+    return wrap
+
+
+def carry(fn):
+    """Bind the caller's labels to fn, for ThreadPoolExecutor.submit/map."""
+    scope = _labels.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _labels.set(scope)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _labels.reset(token)
+
+    return run
+
+
+# ---------- Mongo ----------
+READS = {"find", "getMore", "aggregate", "count", "distinct"}
+WRITES = {"insert", "update", "delete", "findAndModify"}
+
+
+class MongoStageListener(monitoring.CommandListener):
+    """
+    Records every Mongo command as mongo.read / mongo.write / mongo.other.
+    pymongo calls this on the thread (or task) that ran the command, so the
+    request's labels apply. Covers MongoClient and AsyncMongoClient.
+    """
+
+    @staticmethod
+    def _stage(command_name: str) -> str:
+        if command_name in READS:
+            return "mongo.read"
+        if command_name in WRITES:
+            return "mongo.write"
+        return "mongo.other"
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe(self._stage(event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        observe(self._stage(event.command_name), event.duration_micros / 1e6)
+
+
+mongo_listener = MongoStageListener()
+
+
+# ---------- Exposition ----------
+def render():
+    """-> (body bytes, content type) for the /metrics route."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
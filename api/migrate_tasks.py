@@ -0,0 +1,83 @@
+"""
+One-off migration: embedded users.tasks arrays -> tasks collection.
+
+Streams tasks with $unwind so no user document (or the whole array) has to be
+held in memory, writes them in bounded batches with idempotent upserts keyed by
+the existing task _id (ids the client already holds keep working), then unsets
+the migrated arrays. Safe to re-run after an interruption.
+
+    python -m api.migrate_tasks [--batch-size 500] [--keep-embedded]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReplaceOne
+from bson import ObjectId
+
+from api.storage import TaskStore
+
+
+def migrate_embedded_tasks(db, batch_size: int = 500, unset_embedded: bool = True):
+    users_col = db["users"]
+    store = TaskStore(db)
+    store.ensure_indexes()
+
+    pipeline = [
+        {"$match": {"tasks.0": {"$exists": True}}},
+        {"$project": {"tasks": 1}},
+        {"$unwind": "$tasks"},
+        {"$replaceWith": {"$mergeObjects": ["$tasks", {"userId": "$_id"}]}},
+    ]
+    cursor = users_col.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+
+    migrated = 0
+    users = set()
+    ops = []
+    for t in cursor:
+        t.setdefault("_id", ObjectId())
+        users.add(t["userId"])
+        ops.append(ReplaceOne({"_id": t["_id"]}, t, upsert=True))
+        if len(ops) >= batch_size:
+            store.col.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+            print(f"migrated {migrated} tasks ({len(users)} users)")
+    if ops:
+        store.col.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+
+    # clients may hold an ETag from before the move; make it stale
+    user_ids = list(users)
+    for i in range(0, len(user_ids), batch_size):
+        store.bump_many(user_ids[i : i + batch_size])
+
+    # Only drop the arrays once every task of every user has been written.
+    if unset_embedded and users:
+        for i in range(0, len(user_ids), batch_size):
+            users_col.update_many(
+                {"_id": {"$in": user_ids[i : i + batch_size]}},
+                {"$unset": {"tasks": ""}},
+            )
+
+    print(f"done: {migrated} tasks from {len(users)} users")
+    return {"tasks": migrated, "users": len(users)}
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--keep-embedded",
+        action="store_true",
+        help="copy tasks but leave users.tasks in place",
+    )
+    args = parser.parse_args()
+
+    mongo = MongoClient(os.getenv("MONGODB_URI"))
+    migrate_embedded_tasks(
+        mongo[os.getenv("MONGODB_DB")],
+        batch_size=args.batch_size,
+        unset_embedded=not args.keep_embedded,
+    )
@@ -0,0 +1,221 @@
+"""
+Recurring Google events, stored as rules and expanded on read.
+
+Google is listed with singleEvents=False, so a weekly lecture arrives once,
+as a master event with its RRULE/EXDATE/RDATE lines, plus one event per
+occurrence that was moved/edited (recurringEventId + originalStartTime) or
+cancelled. They are stored as:
+
+  master    a google task for the first occurrence, plus
+              recurrence: [rule lines]  (UNTIL converted to local wall time)
+              exdates:    ['YYYY-MM-DDTHH:MM', ...]  cancelled occurrences
+              seriesEnd:  end of the last occurrence, null if open-ended
+  override  an ordinary google task for the edited occurrence, plus
+              recurringEventId: the master's Google id
+              originalStartTime: 'YYYY-MM-DDTHH:MM' of the occurrence it replaces
+
+Cancelled occurrences never become documents, only exdates.
+
+Readers expand the masters for the range they show: occurrences() yields
+task dicts shaped like stored tasks, minus the ones an override or exdate
+replaces. An occurrence's _id is '<master _id>_<YYYYMMDDTHHMM>', a string
+(it has no document of its own), and seriesId is the master's _id.
+Masters themselves are never listed; PLAIN_TASKS filters them out of
+queries.
+
+Chat actions on an occurrence (parse_occurrence_id) edit the series locally:
+a removal adds an exdate (kept by incremental syncs, replaced by a full
+resync), a reschedule writes an override with externalId null.
+"""
+import functools
+import re
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bson import ObjectId
+from dateutil.rrule import rrulestr
+
+from api.scheduler import format_time, local_now, parse_time
+from api.storage import CLIENT_PROJECTION
+
+# task fields only series documents have (see merge_synced_tasks)
+SERIES_FIELDS = ("recurrence", "exdates", "seriesEnd", "recurringEventId", "originalStartTime")
+
+# Ranges for callers without one (getTasks without from/to, delta syncs, the
+# overlap index): occurrences from PAST_DAYS ago to AHEAD_DAYS from today.
+PAST_DAYS = 31
+AHEAD_DAYS = 120
+MAX_OCCURRENCES = 1000  # per series and call
+
+PLAIN_TASKS = {"recurrence": None}
+SERIES_QUERY = {
+    "source": "google",
+    "$or": [{"recurrence": {"$ne": None}}, {"recurringEventId": {"$ne": None}}],
+}
+SERIES_KEY_PROJECTION = {"externalId": 1, "recurrence": 1, "recurringEventId": 1}
+# what occurrences() needs to build /getTasks rows
+SERIES_PROJECTION = {
+    **CLIENT_PROJECTION,
+    "externalId": 1,
+    "recurrence": 1,
+    "exdates": 1,
+    "recurringEventId": 1,
+    "originalStartTime": 1,
+}
+
+_UNTIL_RE = re.compile(r"UNTIL=(\d{8}T\d{6})Z")
+_OCCURRENCE_ID_RE = re.compile(r"^([0-9a-f]{24})_(\d{8}T\d{4})$")
+
+
+def wall_time(when) -> str:
+    """Google start/end/originalStartTime -> 'YYYY-MM-DDTHH:MM' (None if missing)."""
+    when = when or {}
+    if when.get("dateTime"):
+        return when["dateTime"][:16]
+    if when.get("date"):
+        return f"{when['date']}T00:00"
+    return None
+
+
+def _local_until(line: str, tz: str) -> str:
+    """UNTIL=...Z (UTC) -> the same instant in the event's wall time, like every stored time."""
+    match = _UNTIL_RE.search(line)
+    if not match:
+        return line
+    until = datetime.strptime(match.group(1), "%Y%m%dT%H%M%S")
+    try:
+        until = until.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(tz)).replace(tzinfo=None)
+    except (TypeError, ValueError, ZoneInfoNotFoundError):
+        pass  # no/unknown time zone: read it as wall time
+    return line[: match.start()] + f"UNTIL={until:%Y%m%dT%H%M%S}" + line[match.end():]
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_rules(lines: tuple, start: str):
+    # parsing dominates expansion and a user's series rarely change; rrulesets
+    # built without cache=True are read-only to iterate, so sharing them is fine
+    return rrulestr(
+        "\n".join(lines),
+        dtstart=parse_time(start),
+        forceset=True,
+        # TZID= on EXDATE/RDATE: the wall time is what we compare (ignoretz
+        # alone doesn't cover TZID, a None zone keeps those dates naive)
+        ignoretz=True,
+        tzids=lambda name: None,
+    )
+
+
+def rule_set(master: dict):
+    """dateutil rruleset of a stored master, in naive wall time."""
+    return _parse_rules(tuple(master["recurrence"]), master["startTime"])
+
+
+def series_fields(ev: dict, start: str, end: str) -> dict:
+    """Master fields for a raw recurring event whose first occurrence is [start, end)."""
+    tz = (ev.get("start") or {}).get("timeZone")
+    master = {
+        "startTime": start,
+        "recurrence": [_local_until(line, tz) for line in ev["recurrence"]],
+    }
+    series_end = None
+    rules = [line for line in master["recurrence"] if line.startswith("RRULE")]
+    if rules and all("COUNT=" in r or "UNTIL=" in r for r in rules):
+        last = None
+        for last in rule_set(master):
+            pass
+        length = parse_time(end) - parse_time(start)
+        series_end = format_time(last + length) if last else end
+    return {"recurrence": master["recurrence"], "exdates": [], "seriesEnd": series_end}
+
+
+def default_range(now: datetime = None):
+    """[today - PAST_DAYS, today + AHEAD_DAYS), whole days so it only moves at midnight."""
+    now = now or local_now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=PAST_DAYS), today + timedelta(days=AHEAD_DAYS)
+
+
+def series_keys(docs) -> list:
+    """Google series ids touched by these masters/overrides."""
+    return sorted({t.get("recurringEventId") or t["externalId"] for t in docs})
+
+
+def series_docs_query(keys) -> dict:
+    """Masters and overrides of the given Google series ids."""
+    keys = list(keys)
+    return {
+        "source": "google",
+        "$or": [
+            {"externalId": {"$in": keys}, "recurrence": {"$ne": None}},
+            {"recurringEventId": {"$in": keys}},
+        ],
+    }
+
+
+def parse_occurrence_id(value):
+    """'<master _id>_<YYYYMMDDTHHMM>' -> (master ObjectId, 'YYYY-MM-DDTHH:MM'), None if it isn't one."""
+    match = _OCCURRENCE_ID_RE.match(str(value or ""))
+    if not match:
+        return None
+    try:
+        stamp = datetime.strptime(match.group(2), "%Y%m%dT%H%M")
+    except ValueError:
+        return None
+    return ObjectId(match.group(1)), format_time(stamp)
+
+
+def occurrences(docs, start=None, end=None):
+    """
+    Occurrences of the masters in docs overlapping [start, end) (datetimes or
+    'YYYY-MM-DDTHH:MM'; default_range() where missing). Overrides in docs
+    replace the occurrence at their originalStartTime; other docs are ignored.
+    """
+    if isinstance(start, str):
+        start = parse_time(start)
+    if isinstance(end, str):
+        end = parse_time(end)
+    if start is None or end is None:
+        lo, hi = default_range()
+        start, end = start or lo, end or hi
+
+    masters = []
+    replaced = {}  # Google series id -> original start times with an override
+    for t in docs:
+        if t.get("recurrence"):
+            masters.append(t)
+        elif t.get("recurringEventId"):
+            replaced.setdefault(t["recurringEventId"], set()).add(t.get("originalStartTime"))
+
+    out = []
+    for master in masters:
+        first, last = parse_time(master.get("startTime")), parse_time(master.get("endTime"))
+        if first is None:
+            continue
+        length = last - first if last and last > first else timedelta(0)
+        skip = replaced.get(master.get("externalId"), set()) | set(master.get("exdates") or ())
+        base = {k: v for k, v in master.items() if k not in SERIES_FIELDS}
+        # an occurrence overlaps [start, end) iff it starts in (start - length, end)
+        for s in rule_set(master).xafter(start - length, count=MAX_OCCURRENCES):
+            if s >= end:
+                break
+            stamp = format_time(s)
+            if stamp in skip:
+                continue
+            e = format_time(s + length)
+            out.append(
+                {
+                    **base,
+                    "_id": f"{master['_id']}_{s:%Y%m%dT%H%M}",
+                    "seriesId": master["_id"],
+                    "startTime": stamp,
+                    "endTime": e,
+                    "dueDate": e,
+                }
+            )
+    return out
+
+
+def expand(docs, start=None, end=None):
+    """Stored tasks -> the same tasks with every master replaced by its occurrences in range."""
+    docs = list(docs)
+    return [t for t in docs if not t.get("recurrence")] + occurrences(docs, start, end)
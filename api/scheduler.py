@@ -0,0 +1,215 @@
+"""
+Deterministic autoscheduler for the "autoschedule" chat intent.
+
+Flexible tasks are placed into the free time around fixed tasks using the same
+rules SYSTEM_PROMPT gives Gemini:
+  - only between DAY_START and DAY_END,
+  - never finishing after the task's dueDate,
+  - never overlapping a fixed (isFlexible: false) task or a Google event.
+
+Free time is kept as a start-ordered list of slots with a max-segment tree over
+slot lengths, so "earliest slot that can hold N minutes" is O(log S) and a whole
+schedule is O(n log n) in the number of tasks.
+
+Task times are naive wall time in TIME_ZONE (Google events are listed in it,
+Canvas due dates are converted to it), so "now" is read on the same clock:
+local_now(), not UTC.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+TIME_ZONE = os.getenv("HORAI_TIME_ZONE", "America/New_York")
+TIME_FMT = "%Y-%m-%dT%H:%M"
+DAY_START = 8  # 08:00
+DAY_END = 22  # 22:00
+DEFAULT_HORIZON_DAYS = 14
+SLOT_ROUND_MINUTES = 15
+PRIORITY_RANK = {"high": 0, "med": 1, "low": 2}
+
+
+def parse_time(value):
+    """'YYYY-MM-DDTHH:MM[...]' -> naive datetime (None if missing/invalid)."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value[:16])
+    except ValueError:
+        return None
+
+
+def format_time(dt: datetime) -> str:
+    return dt.strftime(TIME_FMT)
+
+
+def to_local(utc: datetime, tz: str = TIME_ZONE) -> datetime:
+    """Naive UTC datetime -> naive wall time in tz, the clock task times are stored in."""
+    return utc.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(tz)).replace(tzinfo=None)
+
+
+def local_now(tz: str = TIME_ZONE) -> datetime:
+    return to_local(datetime.now(timezone.utc).replace(tzinfo=None), tz)
+
+
+def _minutes(a: datetime, b: datetime) -> int:
+    return int((b - a).total_seconds() // 60)
+
+
+def _round_up(dt: datetime, minutes: int = SLOT_ROUND_MINUTES) -> datetime:
+    dt = dt.replace(second=0, microsecond=0)
+    extra = dt.minute % minutes
+    return dt + timedelta(minutes=minutes - extra) if extra else dt
+
+
+def is_fixed(task: dict) -> bool:
+    """Tasks the scheduler must route around and never move."""
+    return task.get("source") == "google" or task.get("isFlexible") is not True
+
+
+def busy_intervals(tasks):
+    """Sorted, merged (start, end) intervals for every fixed task with times."""
+    spans = []
+    for t in tasks:
+        if not is_fixed(t):
+            continue
+        s, e = parse_time(t.get("startTime")), parse_time(t.get("endTime"))
+        if s and e and e > s:
+            spans.append((s, e))
+    spans.sort()
+
+    merged = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1][1] = e
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def free_slots(busy, start: datetime, end: datetime, day_start=DAY_START, day_end=DAY_END):
+    """
+    Subtract merged busy intervals from the daily [day_start, day_end) windows
+    between start and end. Returns start-ordered [slot_start, slot_end] pairs.
+    """
+    slots = []
+    i = 0
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        lo = max(day.replace(hour=day_start), start)
+        hi = min(day.replace(hour=day_end), end)
+        # busy intervals that finished before this window are never needed again
+        while i < len(busy) and busy[i][1] <= lo:
+            i += 1
+        j = i
+        cursor = lo
+        while cursor < hi and j < len(busy) and busy[j][0] < hi:
+            if busy[j][0] > cursor:
+                slots.append([cursor, busy[j][0]])
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < hi:
+            slots.append([cursor, hi])
+        day += timedelta(days=1)
+    return slots
+
+
+class SlotTree:
+    """Max-segment tree over slot lengths (minutes) for leftmost-fit queries."""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.size = 1
+        while self.size < max(1, len(slots)):
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        for i, (s, e) in enumerate(slots):
+            self.tree[self.size + i] = _minutes(s, e)
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def leftmost_fit(self, minutes: int):
+        """Index of the earliest slot with at least `minutes` free, else None."""
+        if self.tree[1] < minutes:
+            return None
+        i = 1
+        while i < self.size:
+            i = 2 * i if self.tree[2 * i] >= minutes else 2 * i + 1
+        return i - self.size
+
+    def take(self, idx: int, minutes: int):
+        """Consume `minutes` from the front of slot idx and return (start, end)."""
+        s, e = self.slots[idx]
+        placed_end = s + timedelta(minutes=minutes)
+        self.slots[idx][0] = placed_end
+        i = self.size + idx
+        self.tree[i] = _minutes(placed_end, e)
+        i //= 2
+        while i:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+        return s, placed_end
+
+
+def plan_autoschedule(
+    tasks,
+    now: datetime = None,
+    day_start: int = DAY_START,
+    day_end: int = DAY_END,
+    horizon_days: int = DEFAULT_HORIZON_DAYS,
+):
+    """
+    Compute a schedule for every open flexible task.
+
+    tasks: raw task documents (need _id, startTime, endTime, dueDate,
+           estimatedMinutes, minutesTaken, isFlexible, status, priority, source).
+    now: wall time in the tasks' time zone (local_now() by default).
+    Returns {"changes": [{"id", "startTime", "endTime"}, ...],
+             "unscheduled": [{"id", "title", "reason"}, ...]}
+    where changes only lists tasks whose times actually move.
+    """
+    if now is None:
+        now = local_now()
+    start = _round_up(now)
+    default_end = start + timedelta(days=horizon_days)
+
+    pending = []
+    unscheduled = []
+    for t in tasks:
+        if is_fixed(t) or t.get("status") == "done":
+            continue
+        need = int(t.get("estimatedMinutes") or 60) - int(t.get("minutesTaken") or 0)
+        if need <= 0:
+            continue
+        due = parse_time(t.get("dueDate"))
+        if due is not None and due <= start:
+            unscheduled.append(
+                {"id": str(t["_id"]), "title": t.get("title"), "reason": "past_due"}
+            )
+            continue
+        pending.append((due or default_end, PRIORITY_RANK.get(t.get("priority"), 1), -need, need, t))
+
+    if not pending:
+        return {"changes": [], "unscheduled": unscheduled}
+
+    # Earliest deadline first; higher priority, then longer blocks, break ties.
+    pending.sort(key=lambda p: (p[0], p[1], p[2], str(p[4]["_id"])))
+    horizon_end = max(p[0] for p in pending)
+
+    tree = SlotTree(free_slots(busy_intervals(tasks), start, horizon_end, day_start, day_end))
+
+    changes = []
+    for due, _, _, need, t in pending:
+        idx = tree.leftmost_fit(need)
+        # leftmost fit is the earliest possible placement; if it overruns the
+        # deadline then no other slot can satisfy it either.
+        if idx is None or tree.slots[idx][0] + timedelta(minutes=need) > due:
+            unscheduled.append({"id": str(t["_id"]), "title": t.get("title"), "reason": "no_free_slot"})
+            continue
+        s, e = tree.take(idx, need)
+        s_iso, e_iso = format_time(s), format_time(e)
+        if (t.get("startTime") or "")[:16] == s_iso and (t.get("endTime") or "")[:16] == e_iso:
+            continue
+        changes.append({"id": str(t["_id"]), "startTime": s_iso, "endTime": e_iso})
+
+    return {"changes": changes, "unscheduled": unscheduled}
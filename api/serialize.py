@@ -0,0 +1,128 @@
+"""
+JSON serialization and response compression for the API.
+
+- JSON providers are pluggable (JSON_PROVIDER=orjson|stdlib, like JOB_QUEUE).
+  The orjson one is the default when orjson is installed: it encodes datetimes
+  natively, ObjectId via `default`, and builds a 10k-task /getTasks body
+  several times faster than the stdlib encoder behind Flask's jsonify.
+- compress_response negotiates br/gzip from Accept-Encoding for JSON bodies of
+  at least COMPRESS_MIN_BYTES. Brotli is used only if the `brotli` package is
+  installed. SSE and other streamed responses are never buffered or compressed.
+"""
+import gzip
+import os
+
+from bson import ObjectId
+from flask import request
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib provider
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # about half the time of gzip -6 for a similar size
+COMPRESSIBLE = {"application/json", "text/plain", "text/html"}
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.get_json)."""
+
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=_default, option=self.option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self.option)
+        return self._app.response_class(body, mimetype="application/json")
+
+
+class StdlibProvider(DefaultJSONProvider):
+    """Flask's default provider, plus ObjectId."""
+
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        return DefaultJSONProvider.default(obj)
+
+
+PROVIDERS = {"orjson": OrjsonProvider, "stdlib": StdlibProvider}
+
+
+def make_json_provider(app, name: str = None):
+    name = name or os.getenv("JSON_PROVIDER") or ("orjson" if orjson else "stdlib")
+    if name == "orjson" and orjson is None:
+        name = "stdlib"
+    return PROVIDERS[name](app)
+
+
+def pick_encoding(accept_encoding: str):
+    """'br' or 'gzip', whichever the client weights higher (br on a tie); else None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    if brotli is None:
+        accepted.pop("br", None)
+    best = max(("br", "gzip"), key=lambda enc: accepted.get(enc, 0))
+    return best if accepted.get(best, 0) > 0 else None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request hook."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = pick_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    # a different byte representation needs its own strong ETag
+    etag = response.headers.get("ETag")
+    if etag and etag.endswith('"'):
+        response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+    return response
@@ -0,0 +1,381 @@
+"""
+Task storage.
+
+tasks {
+  _id: ObjectId,              // per-task id you return to the client
+  userId: ObjectId,           // owner (users._id)
+  source: "manual|google|canvas|ai",
+  externalId: "string|null",  // e.g., Google event id for de-dupe
+  title, description, startTime, endTime, dueDate,
+  estimatedMinutes, minutesTaken, isFlexible, status, priority,
+  version: int,               // users.taskVersion at the write that last touched it
+  createdAt: ISO8601,
+  updatedAt: ISO8601
+}
+
+task_tombstones {
+  _id: ObjectId,              // id of the deleted task
+  userId: ObjectId,
+  version: int,
+  expiresAt: Date             // TTL, TOMBSTONE_TTL_DAYS
+}
+
+Tasks used to be embedded in users.tasks; they now live one document per task
+so reads can be filtered/indexed and a heavy user can't hit the 16 MB document
+limit. Every route and sync helper goes through TaskStore so the indexes and
+the userId scoping live in one place.
+
+Every write goes through TaskStore.apply, which stamps the written tasks with
+a fresh users.taskVersion, leaves a tombstone per deleted task and bumps the
+counter again once the write is visible. /getTasks uses the counter for ETags
+(a 304 without reading any tasks) and for delta syncs: tasks and tombstones
+with a version above the client's sync cursor.
+
+A version is reserved before its write lands, so the counter alone can run
+ahead of what's readable. Reservations are listed in users.taskWrites
+({v, at}) until the write finishes, and the sync cursor is the settled
+version: just below the oldest write still in flight (settled_version).
+Both fields only change together with taskVersion, so a conditional update
+on taskVersion keeps them consistent without transactions.
+"""
+import hashlib
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+TOMBSTONE_TTL_DAYS = 30
+# a reservation older than this belongs to a write that died; readers skip it
+WRITE_TIMEOUT_SECONDS = 300
+
+# Only the fields the calendar renders (see task_to_client)
+CLIENT_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "startTime": 1,
+    "endTime": 1,
+    "dueDate": 1,
+    "priority": 1,
+}
+
+
+def normalize_bound(value):
+    """Accept 'YYYY-MM-DD' or any ISO8601 datetime -> 'YYYY-MM-DDTHH:MM' (None if blank)."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return dt.strftime("%Y-%m-%dT%H:%M")
+
+
+def window_query(start=None, end=None):
+    """
+    Tasks visible in [start, end): timed tasks overlapping the window, plus
+    untimed tasks (Canvas assignments) whose dueDate falls inside it.
+    Stored times are 'YYYY-MM-DDTHH:MM' strings, so string ranges sort correctly.
+    """
+    if not start and not end:
+        return {}
+    timed = {}
+    due = {}
+    if end:
+        timed["startTime"] = {"$lt": end}
+        due["$lt"] = end
+    if start:
+        timed["endTime"] = {"$gt": start}
+        due["$gte"] = start
+    return {"$or": [timed, {"startTime": None, "dueDate": due}]}
+
+
+def tasks_etag(version: int, *params) -> str:
+    """Strong ETag for one /getTasks response: task version + request params."""
+    digest = hashlib.sha1(repr(params).encode("utf-8")).hexdigest()[:12]
+    return f'"v{version}.{digest}"'
+
+
+# compress_response tags compressed bodies '"<etag>-gzip"' / '"<etag>-br"'
+_ENCODING_SUFFIX_RE = re.compile(r'-(?:gzip|br)"$')
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match check (comma-separated list or '*')."""
+    if not header:
+        return False
+    tags = [_ENCODING_SUFFIX_RE.sub('"', t.strip()) for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def encode_sync_cursor(version: int) -> str:
+    return f"{version}.{int(time.time())}"
+
+
+def decode_sync_cursor(cursor: str):
+    """
+    -> since version, or None if the cursor is older than the tombstones it
+    relies on (the client has to do a full fetch). ValueError if malformed.
+    """
+    version, issued = (int(p) for p in str(cursor).split("."))
+    if time.time() - issued > TOMBSTONE_TTL_DAYS * 86400:
+        return None
+    return version
+
+
+def delta_query(since: int):
+    return {"version": {"$gt": since}}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)  # pymongo returns naive UTC
+
+
+def _live_writes(user: dict) -> list:
+    cutoff = _utcnow() - timedelta(seconds=WRITE_TIMEOUT_SECONDS)
+    return [w for w in user.get("taskWrites") or () if w["at"] > cutoff]
+
+
+def settled_version(user: dict) -> int:
+    """Version every write at or below which has landed: the delta sync cursor."""
+    pending = [w["v"] for w in _live_writes(user)]
+    return min(pending) - 1 if pending else user.get("taskVersion", 0)
+
+
+CLIENT_FIELDS = ("id", "title", "desc", "startTime", "endTime", "dueDate", "priority")
+
+
+def task_to_client(t: dict) -> dict:
+    return {
+        "id": str(t["_id"]),
+        "title": t.get("title"),
+        "desc": t.get("description"),
+        "startTime": t.get("startTime"),
+        "endTime": t.get("endTime"),
+        "dueDate": t.get("dueDate"),
+        "priority": t.get("priority", "med"),
+    }
+
+
+def tasks_to_columns(tasks: list) -> dict:
+    """Columnar shape of task_to_client rows: {field: [value per task]}."""
+    return {field: [t[field] for t in tasks] for field in CLIENT_FIELDS}
+
+
+class TaskStore:
+    def __init__(self, db):
+        self.col = db["tasks"]
+        self.users = db["users"]
+        self.tombstones = db["task_tombstones"]
+
+    def ensure_indexes(self):
+        self.col.create_index([("userId", ASCENDING), ("startTime", ASCENDING)])
+        # unique only for real external ids (manual/ai tasks carry externalId: null)
+        self.col.create_index(
+            [("userId", ASCENDING), ("source", ASCENDING), ("externalId", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"externalId": {"$type": "string"}},
+        )
+        self.col.create_index([("userId", ASCENDING), ("updatedAt", ASCENDING)])
+        self.col.create_index([("userId", ASCENDING), ("version", ASCENDING)])
+        self.tombstones.create_index([("userId", ASCENDING), ("version", ASCENDING)])
+        self.tombstones.create_index("expiresAt", expireAfterSeconds=0)
+
+    # ---------- reads ----------
+    def find(self, user_oid, query=None, projection=None, sort=None, limit=0):
+        q = {"userId": user_oid}
+        if query:
+            q.update(query)
+        cursor = self.col.find(q, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    def page(self, user_oid, query=None, projection=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Keyset pagination on _id. Returns (docs, next_cursor) where next_cursor
+        is the last _id of a full page (None once the result set is exhausted).
+        """
+        q = dict(query or {})
+        if after is not None:
+            q["_id"] = {"$gt": after}
+        docs = list(self.find(user_oid, q, projection, sort=[("_id", ASCENDING)], limit=limit))
+        next_cursor = docs[-1]["_id"] if len(docs) == limit else None
+        return docs, next_cursor
+
+    def find_one(self, user_oid, task_oid, projection=None):
+        return self.col.find_one({"_id": task_oid, "userId": user_oid}, projection)
+
+    def removed_since(self, user_oid, since: int):
+        """Ids of tasks deleted after `since`."""
+        return [
+            d["_id"]
+            for d in self.tombstones.find(
+                {"userId": user_oid, **delta_query(since)}, {"_id": 1}
+            )
+        ]
+
+    def version(self, user_oid):
+        """users.taskVersion (0 if never written), or None if there is no such user."""
+        user = self.users.find_one({"_id": user_oid}, {"taskVersion": 1})
+        if user is None:
+            return None
+        return user.get("taskVersion", 0)
+
+    def versions(self, user_oid):
+        """(taskVersion, settled_version) in one read, or (None, None) if there is no such user."""
+        user = self.users.find_one({"_id": user_oid}, {"taskVersion": 1, "taskWrites": 1})
+        if user is None:
+            return None, None
+        return user.get("taskVersion", 0), settled_version(user)
+
+    # ---------- writes ----------
+    def _reserve(self, user_oid) -> int:
+        """Next taskVersion, listed in users.taskWrites until _release."""
+        while True:
+            user = self.users.find_one({"_id": user_oid}, {"taskVersion": 1, "taskWrites": 1})
+            if user is None:
+                return 0
+            current = user.get("taskVersion")
+            version = (current or 0) + 1
+            # rewriting the whole list also drops reservations of dead writes;
+            # safe because every change to it moves taskVersion too
+            writes = _live_writes(user) + [{"v": version, "at": _utcnow()}]
+            res = self.users.update_one(
+                {"_id": user_oid, "taskVersion": current},
+                {"$set": {"taskVersion": version, "taskWrites": writes}},
+            )
+            if res.matched_count:
+                return version
+
+    def _release(self, user_oid, version: int):
+        self.users.update_one(
+            {"_id": user_oid},
+            {"$pull": {"taskWrites": {"v": version}}, "$inc": {"taskVersion": 1}},
+        )
+
+    def bump_many(self, user_oids):
+        self.users.update_many({"_id": {"$in": list(user_oids)}}, {"$inc": {"taskVersion": 1}})
+
+    def apply(self, user_oid, inserts=(), updates=(), deletes=(), ordered=False):
+        """
+        One bulk_write of one user's task changes, in this order:
+          inserts: task docs
+          updates: (task_oid, fields) pairs, $set
+          deletes: task oids
+        Returns the BulkWriteResult (None if there was nothing to write).
+        """
+        inserts, updates, deletes = list(inserts), list(updates), list(deletes)
+        if not (inserts or updates or deletes):
+            return None
+        version = self._reserve(user_oid)
+
+        ops = []
+        for task in inserts:
+            task["userId"] = user_oid
+            task["version"] = version
+            ops.append(InsertOne(task))
+        for task_oid, fields in updates:
+            ops.append(
+                UpdateOne(
+                    {"_id": task_oid, "userId": user_oid},
+                    {"$set": {**fields, "version": version}},
+                )
+            )
+        first_delete = len(ops)
+        ops.extend(DeleteOne({"_id": oid, "userId": user_oid}) for oid in deletes)
+
+        deleted = []  # deletes known to have landed
+        try:
+            res = self.col.bulk_write(ops, ordered=ordered)
+            if res.deleted_count:
+                deleted = deletes
+            return res
+        except BulkWriteError as e:
+            failed = {err["index"] - first_delete for err in e.details.get("writeErrors", [])}
+            if ordered:  # nothing after the first error ran
+                failed.update(range(min(failed, default=0), len(deletes)))
+            deleted = [oid for i, oid in enumerate(deletes) if i not in failed]
+            raise
+        finally:
+            # any other error (network, timeout) leaves it unknown which deletes
+            # landed: no tombstones, a full sync reconciles the client
+            self._tombstone(user_oid, deleted, version)
+            self._release(user_oid, version)  # part of the batch may have been applied
+
+    def _tombstone(self, user_oid, task_oids, version):
+        if not task_oids:
+            return
+        expires = datetime.now(timezone.utc) + timedelta(days=TOMBSTONE_TTL_DAYS)
+        self.tombstones.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": oid},
+                    {"$set": {"userId": user_oid, "version": version, "expiresAt": expires}},
+                    upsert=True,
+                )
+                for oid in task_oids
+            ],
+            ordered=False,
+        )
+
+    def insert(self, user_oid, task: dict):
+        return self.apply(user_oid, inserts=[task])
+
+    def update(self, user_oid, task_oid, fields: dict):
+        return self.apply(user_oid, updates=[(task_oid, fields)])
+
+    def delete(self, user_oid, task_oid):
+        return self.apply(user_oid, deletes=[task_oid])
+
+
+class AsyncTaskStore:
+    """
+    Read side of TaskStore on pymongo's AsyncMongoClient, for the ASGI app.
+    Writes stay on TaskStore.apply (run in a worker thread) so versioning and
+    tombstones have a single implementation.
+    """
+
+    def __init__(self, db):
+        self.col = db["tasks"]
+        self.users = db["users"]
+        self.tombstones = db["task_tombstones"]
+
+    async def find(self, user_oid, query=None, projection=None, sort=None, limit=0):
+        q = {"userId": user_oid}
+        if query:
+            q.update(query)
+        cursor = self.col.find(q, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list()
+
+    async def page(self, user_oid, query=None, projection=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        q = dict(query or {})
+        if after is not None:
+            q["_id"] = {"$gt": after}
+        docs = await self.find(user_oid, q, projection, sort=[("_id", ASCENDING)], limit=limit)
+        next_cursor = docs[-1]["_id"] if len(docs) == limit else None
+        return docs, next_cursor
+
+    async def removed_since(self, user_oid, since: int):
+        docs = await self.tombstones.find(
+            {"userId": user_oid, **delta_query(since)}, {"_id": 1}
+        ).to_list()
+        return [d["_id"] for d in docs]
+
+    async def version(self, user_oid):
+        user = await self.users.find_one({"_id": user_oid}, {"taskVersion": 1})
+        if user is None:
+            return None
+        return user.get("taskVersion", 0)
+
+    async def versions(self, user_oid):
+        user = await self.users.find_one({"_id": user_oid}, {"taskVersion": 1, "taskWrites": 1})
+        if user is None:
+            return None, None
+        return user.get("taskVersion", 0), settled_version(user)
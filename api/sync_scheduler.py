@@ -0,0 +1,325 @@
+"""
+Fleet-wide periodic Canvas / Google sync.
+
+Without this, a user's Canvas and Google data only refresh when they
+reconnect through /canvasToken or /calendarToken. SyncScheduler keeps one
+min-heap per provider of the users holding a stored token, ordered by when
+each is next due:
+
+    due = last sync + interval(activity) * (1 +- JITTER/2) [+ failure backoff]
+
+  interval: ACTIVE_MINUTES if the user was active in the last day,
+            RECENT_MINUTES in the last week, IDLE_MINUTES otherwise (and
+            always while the provider pushes changes, see live_field)
+  jitter:   a fixed per-user offset, so users synced together (a deploy, a
+            reconnect wave) drift apart instead of hitting Canvas as one
+  backoff:  interval * 2^failures after consecutive failures, capped
+
+The most overdue users are dispatched first, into a per-provider pool of
+CONCURRENCY[provider] threads. The cap limits how hard one process hits
+Canvas or Google, whatever the backlog. Before running, a sync claims
+users.sync.<provider>.leaseUntil with a conditional update, so several web
+processes can run the scheduler without syncing the same user twice. The
+jobs the token routes queue take the same lease (run_now), waiting for a
+scheduled sync of that user to finish first.
+
+users {
+  ...,
+  lastActiveAt: Date,          // touch()ed by /getTasks and /chat, at most every TOUCH_SECONDS
+  sync: {
+    canvas|google: {
+      at: Date,                // last successful sync (also set by the token routes' jobs)
+      attemptAt: Date,
+      failures: int,           // consecutive
+      error: string|null,
+      leaseUntil: Date|null
+    }
+  }
+}
+
+Providers reuse the stored credentials (canvas.access_token,
+google.refresh_token), see the handlers in api/backend.py. Metrics, by
+provider: horai_sync_queue_depth (overdue users, counted at each scan and
+decremented as they're dispatched), horai_sync_lag_seconds (how overdue the
+heap head is), horai_sync_in_flight, and
+horai_sync_dispatch_lag_seconds (due -> started). SYNC_SCHEDULER=1 starts
+the loop.
+"""
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache
+
+from api import metrics
+from api.logs import get_logger
+
+ENABLED = os.getenv("SYNC_SCHEDULER", "0") == "1"
+ACTIVE_MINUTES = int(os.getenv("SYNC_ACTIVE_MINUTES", "15"))
+RECENT_MINUTES = int(os.getenv("SYNC_RECENT_MINUTES", "60"))
+IDLE_MINUTES = int(os.getenv("SYNC_IDLE_MINUTES", "360"))
+CONCURRENCY = {
+    "canvas": int(os.getenv("SYNC_CANVAS_CONCURRENCY", "4")),
+    "google": int(os.getenv("SYNC_GOOGLE_CONCURRENCY", "8")),
+}
+JITTER = 0.2  # total spread, as a fraction of the interval
+MAX_BACKOFF_MINUTES = 24 * 60
+LEASE_SECONDS = 600
+LEASE_POLL_SECONDS = 1
+SCAN_SECONDS = 60
+TICK_SECONDS = 1
+TOUCH_SECONDS = 300
+
+log = get_logger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)  # pymongo returns naive UTC
+
+
+def _field(doc: dict, path: str):
+    for key in path.split("."):
+        doc = doc.get(key) if isinstance(doc, dict) else None
+    return doc
+
+
+def job_stage(name: str):
+    """Job.stage stand-in for scheduled syncs (metrics only, no job document)."""
+    return metrics.stage(f"job.{name}")
+
+
+def interval_for(last_active, now: datetime, pushed: bool = False) -> timedelta:
+    if pushed:
+        return timedelta(minutes=IDLE_MINUTES)  # polling is only the backstop
+    if last_active and now - last_active <= timedelta(days=1):
+        return timedelta(minutes=ACTIVE_MINUTES)
+    if last_active and now - last_active <= timedelta(days=7):
+        return timedelta(minutes=RECENT_MINUTES)
+    return timedelta(minutes=IDLE_MINUTES)
+
+
+def jitter_offset(user_oid, provider: str) -> float:
+    """Stable per-user, per-provider number in [-0.5, 0.5)."""
+    digest = hashlib.sha1(f"{user_oid}:{provider}".encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2**32 - 0.5
+
+
+def due_at(user_oid, provider: str, state: dict, last_active, now: datetime, pushed: bool = False) -> datetime:
+    """When this user's next sync for provider is due (see the module docstring)."""
+    interval = interval_for(last_active, now, pushed)
+    failures = state.get("failures") or 0
+    if failures:
+        base = state.get("attemptAt") or now
+        wait = min(interval * 2**failures, timedelta(minutes=MAX_BACKOFF_MINUTES))
+    else:
+        base = state.get("at") or now - interval  # never synced: due about now
+        wait = interval
+    return base + wait * (1 + JITTER * jitter_offset(user_oid, provider))
+
+
+class SyncScheduler:
+    def __init__(self, users_col):
+        self.users = users_col
+        self.providers = {}  # name -> (token field, live field, fn(user_oid))
+        self.heaps = {}  # name -> [(due, seq, user_oid, sync.at seen)]
+        self.pools = {}
+        self.in_flight = {}  # name -> {user_oid}
+        self.overdue = {}  # name -> overdue users at the last scan, minus those dispatched since
+        self.lock = threading.Lock()
+        self.seq = itertools.count()
+        self.touched = TTLCache(maxsize=100000, ttl=TOUCH_SECONDS)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync-touch")
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def provider(self, name: str, token_field: str, live_field: str = None):
+        """
+        Decorator: register fn(user_oid) -> result dict for users with
+        `token_field` set. live_field: a Date field that's in the future while
+        the provider pushes this user's changes (polled at the idle interval).
+        """
+
+        def register(fn):
+            self.providers[name] = (token_field, live_field, fn)
+            self.heaps[name] = []
+            self.in_flight[name] = set()
+            self.overdue[name] = 0
+            self.pools[name] = ThreadPoolExecutor(
+                max_workers=CONCURRENCY.get(name, 2), thread_name_prefix=f"sync-{name}"
+            )
+            return fn
+
+        return register
+
+    def ensure_indexes(self):
+        self.users.create_index("lastActiveAt")
+
+    # ---------- activity ----------
+    def touch(self, user_oid):
+        """Mark the user active (non-blocking, written at most every TOUCH_SECONDS)."""
+        with self.lock:
+            if user_oid in self.touched:
+                return
+            self.touched[user_oid] = True
+        self.writer.submit(self._touch, user_oid, _utcnow())
+
+    def _touch(self, user_oid, now):
+        try:
+            self.users.update_one({"_id": user_oid}, {"$set": {"lastActiveAt": now}})
+        except Exception:
+            log.exception("activity write failed")
+
+    # ---------- outcome ----------
+    def record(self, user_oid, provider: str, error: Exception = None):
+        """Store a sync's outcome and release its lease."""
+        now = _utcnow()
+        prefix = f"sync.{provider}"
+        if error is None:
+            update = {
+                "$set": {f"{prefix}.at": now, f"{prefix}.attemptAt": now, f"{prefix}.failures": 0,
+                         f"{prefix}.error": None, f"{prefix}.leaseUntil": None}
+            }
+        else:
+            update = {
+                "$set": {f"{prefix}.attemptAt": now, f"{prefix}.error": str(error)[:500],
+                         f"{prefix}.leaseUntil": None},
+                "$inc": {f"{prefix}.failures": 1},
+            }
+        self.users.update_one({"_id": user_oid}, update)
+
+    def synced(self, provider: str, user_oid, fn, *args):
+        """fn(user_oid, *args) with its outcome recorded (which releases the lease)."""
+        try:
+            result = fn(user_oid, *args)
+        except Exception as e:
+            self.record(user_oid, provider, e)
+            raise
+        self.record(user_oid, provider)
+        return result
+
+    # ---------- queue ----------
+    def scan(self, now: datetime = None):
+        """Rebuild every provider's heap from the users holding its token."""
+        now = now or _utcnow()
+        for name, (token_field, live_field, _) in self.providers.items():
+            entries = []
+            projection = {f"sync.{name}": 1, "lastActiveAt": 1}
+            if live_field:
+                projection[live_field] = 1
+            cursor = self.users.find({token_field: {"$nin": [None, ""]}}, projection)
+            for user in cursor:
+                state = (user.get("sync") or {}).get(name) or {}
+                live_until = _field(user, live_field) if live_field else None
+                pushed = live_until is not None and live_until > now
+                due = due_at(user["_id"], name, state, user.get("lastActiveAt"), now, pushed)
+                entries.append((due, next(self.seq), user["_id"], state.get("at")))
+            heapq.heapify(entries)
+            overdue = sum(1 for entry in entries if entry[0] <= now)
+            with self.lock:
+                self.heaps[name] = entries
+                self.overdue[name] = overdue
+
+    def _lease(self, user_oid, provider: str, now: datetime, query: dict = None) -> bool:
+        prefix = f"sync.{provider}"
+        claimed = self.users.find_one_and_update(
+            {
+                "_id": user_oid,
+                **(query or {}),
+                "$or": [{f"{prefix}.leaseUntil": None}, {f"{prefix}.leaseUntil": {"$lt": now}}],
+            },
+            {"$set": {f"{prefix}.leaseUntil": now + timedelta(seconds=LEASE_SECONDS)}},
+            projection={"_id": 1},
+        )
+        return claimed is not None
+
+    def claim(self, user_oid, provider: str, seen_at, now: datetime) -> bool:
+        """Take the user's lease unless another process holds it or synced since the scan."""
+        return self._lease(user_oid, provider, now, {f"sync.{provider}.at": seen_at})
+
+    def run_now(self, provider: str, user_oid, fn, *args):
+        """
+        synced() outside the heap, for the token routes' jobs: waits for the
+        user's lease (a scheduled sync of theirs may be running) and runs
+        under it, so the two never overlap.
+        """
+        deadline = time.monotonic() + LEASE_SECONDS + LEASE_POLL_SECONDS
+        while not self._lease(user_oid, provider, _utcnow()):
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"{provider} sync lease not available")
+            time.sleep(LEASE_POLL_SECONDS)
+        return self.synced(provider, user_oid, fn, *args)
+
+    def dispatch(self, now: datetime = None) -> int:
+        """Start the most overdue syncs each provider has room for; returns how many."""
+        now = now or _utcnow()
+        started = 0
+        for name, (_, _, fn) in self.providers.items():
+            heap = self.heaps[name]
+            while True:
+                with self.lock:
+                    if not heap or heap[0][0] > now or len(self.in_flight[name]) >= CONCURRENCY.get(name, 2):
+                        break
+                    due, _, user_oid, seen_at = heapq.heappop(heap)
+                    self.overdue[name] = max(0, self.overdue[name] - 1)
+                    if user_oid in self.in_flight[name]:
+                        continue
+                if not self.claim(user_oid, name, seen_at, now):
+                    continue
+                with self.lock:
+                    self.in_flight[name].add(user_oid)
+                self.pools[name].submit(self._run, name, fn, user_oid, due)
+                started += 1
+        return started
+
+    def _run(self, provider: str, fn, user_oid, due):
+        metrics.begin(f"sync:{provider}")
+        metrics.SYNC_DISPATCH_LAG.labels(provider).observe(max(0.0, (_utcnow() - due).total_seconds()))
+        try:
+            self.synced(provider, user_oid, fn)
+        except Exception:
+            log.exception("scheduled sync failed", extra={"provider": provider, "userId": str(user_oid)})
+        finally:
+            with self.lock:
+                self.in_flight[provider].discard(user_oid)
+
+    def observe(self, now: datetime = None):
+        """Update the queue gauges: overdue users, age of the oldest, running syncs."""
+        now = now or _utcnow()
+        for name in self.providers:
+            with self.lock:
+                heap = self.heaps[name]
+                oldest = heap[0][0] if heap else None
+                overdue = self.overdue[name]
+                running = len(self.in_flight[name])
+            metrics.SYNC_QUEUE_DEPTH.labels(name).set(overdue)
+            lag = (now - oldest).total_seconds() if oldest is not None and oldest <= now else 0
+            metrics.SYNC_LAG_SECONDS.labels(name).set(lag)
+            metrics.SYNC_IN_FLIGHT.labels(name).set(running)
+
+    # ---------- loop ----------
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="sync-scheduler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        next_scan = 0
+        while not self.stopped.is_set():
+            try:
+                now = _utcnow()
+                if time.monotonic() >= next_scan:
+                    self.scan(now)
+                    next_scan = time.monotonic() + SCAN_SECONDS
+                self.dispatch(now)
+                self.observe(now)
+            except Exception:
+                log.exception("sync scheduler tick failed")
+            self.stopped.wait(TICK_SECONDS)
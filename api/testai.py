@@ -14,14 +14,16 @@ from googleapiclient.discovery import build
 from pymongo import MongoClient, ASCENDING, errors, UpdateOne
 from bson import ObjectId
 from flask_cors import CORS
+from storage import TaskStore
+from context import build_context
 from functions import (
     now_iso,
     hashStr,
     as_object_id,
-    upsert_google_events_embedded,
+    merge_google_events,
     list_events_with_google_client,
     getAllCanvasTasks,
-    upsert_canvas_tasks_embedded,
+    merge_canvas_tasks,
     ask_gemini,
 )
 
@@ -34,23 +36,14 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
 mongo = MongoClient(MONGODB_URI)
 db = mongo[DB_NAME]
-users_col = db["users"]
-doc = users_col.find_one({"_id": as_object_id("68d88841c740ba7296bf10cd")}, {"tasks": 1})
+task_store = TaskStore(db)
 
-tasks = []
-for t in doc.get("tasks", []):
-    tasks.append(
-        {
-            "id": str(t["_id"]),
-            "title": t.get("title"),
-            # "desc": t.get("description"),
-            "startTime": t.get("startTime"),
-            "endTime": t.get("endTime"),
-            "dueDate": t.get("dueDate"),
-            "priority": t.get("priority", "med"),
-        }
-    )
-print(tasks)
-res = ask_gemini([{"role": 'user', "parts": ["add another hackathon to next week"]}], tasks)
-print(res)
+tasks = list(task_store.find(as_object_id("68d88841c740ba7296bf10cd")))
+convo = [{"role": 'user', "parts": ["add another hackathon to next week"]}]
+context, usage = build_context(tasks, convo)
+print(context)
+print(usage)
+text, actions = ask_gemini(convo, context)
+print(text)
+print(actions)
 
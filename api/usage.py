@@ -0,0 +1,193 @@
+"""
+Gemini token accounting and budgets.
+
+Every Gemini call made for a user goes through an LLMMeter (ask_gemini*,
+classify_tasks_batch take `meter=`), which collects the model, input/output
+token counts from the response's usage_metadata and the latency. Once the
+caller knows what the call was for (the parsed chat intent, "classify") it
+commits them into hourly buckets:
+
+llm_usage {
+  _id: ObjectId,
+  userId: ObjectId|null,   // null for calls not made for a user
+  intent: string,          // add|reschedule|remove|autoschedule|reply|classify|...
+  model: string,
+  hour: Date,              // UTC, start of the hour
+  calls, inputTokens, outputTokens, latencyMs: int,
+  expiresAt: Date          // TTL
+}
+
+Rolling windows are sums over the buckets of the last N hours. Budgets:
+
+  LLM_USER_TOKENS_PER_DAY     per user, last 24h   (0 = unlimited)
+  LLM_GLOBAL_TOKENS_PER_HOUR  everyone, last hour  (0 = unlimited)
+
+Pressure is the larger of the two used/budget ratios. Past LLM_SOFT_LIMIT the
+chat context shrinks linearly towards MIN_CONTEXT_TOKENS; at 1.0 background
+classification stops sending tasks to Gemini (rules and the shared cache still
+apply; the rest is retried on a later sync). Chat itself is never refused.
+
+Totals are cached for TOTALS_TTL seconds and bumped locally on every commit,
+and bucket writes go to a single background thread, so neither the budget
+check nor the accounting adds a Mongo round trip to the request.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache
+from pymongo import ASCENDING
+
+from api import metrics
+from api.context import estimate_tokens
+from api.logs import get_logger
+
+USER_TOKENS_PER_DAY = int(os.getenv("LLM_USER_TOKENS_PER_DAY", "300000"))
+GLOBAL_TOKENS_PER_HOUR = int(os.getenv("LLM_GLOBAL_TOKENS_PER_HOUR", "3000000"))
+SOFT_LIMIT = float(os.getenv("LLM_SOFT_LIMIT", "0.8"))
+MIN_CONTEXT_TOKENS = 600
+TOTALS_TTL = 30
+USAGE_TTL_DAYS = 35
+
+log = get_logger(__name__)
+
+
+def hour_of(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+class LLMMeter:
+    """Collects the Gemini calls of one request/job; thread-safe (classifier chunks)."""
+
+    def __init__(self, ledger, user_oid):
+        self.ledger = ledger
+        self.user_oid = user_oid
+        self.calls = []  # (model, input tokens, output tokens, seconds)
+        self.lock = threading.Lock()
+
+    def add(self, model: str, usage, seconds: float, prompt: str = "", reply: str = ""):
+        """usage: the response's usage_metadata; estimated from the text if missing."""
+        input_tokens = getattr(usage, "prompt_token_count", None)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if input_tokens is None:
+            input_tokens = estimate_tokens(prompt)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(reply)
+        with self.lock:
+            self.calls.append((model.removeprefix("models/"), input_tokens, output_tokens, seconds))
+
+    def commit(self, intent: str = None):
+        """intent defaults to the request's intent label (set once the reply is parsed)."""
+        intent = intent or metrics.labels()["intent"]
+        with self.lock:
+            calls, self.calls = self.calls, []
+        for model, input_tokens, output_tokens, seconds in calls:
+            self.ledger.record(self.user_oid, intent, model, input_tokens, output_tokens, seconds)
+
+
+class UsageLedger:
+    def __init__(self, db):
+        self.col = db["llm_usage"]
+        self.totals = TTLCache(maxsize=20000, ttl=TOTALS_TTL)
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-usage")
+
+    def ensure_indexes(self):
+        self.col.create_index(
+            [("userId", ASCENDING), ("hour", ASCENDING), ("intent", ASCENDING), ("model", ASCENDING)],
+            unique=True,
+        )
+        self.col.create_index([("hour", ASCENDING)])
+        self.col.create_index("expiresAt", expireAfterSeconds=0)
+
+    def meter(self, user_oid=None) -> LLMMeter:
+        return LLMMeter(self, user_oid)
+
+    # ---------- recording ----------
+    def record(self, user_oid, intent, model, input_tokens, output_tokens, seconds):
+        tokens = input_tokens + output_tokens
+        metrics.LLM_TOKENS.labels("input", intent, model).inc(input_tokens)
+        metrics.LLM_TOKENS.labels("output", intent, model).inc(output_tokens)
+        with self.lock:
+            for key in ((user_oid, 24), (None, 1)):
+                if key in self.totals:
+                    self.totals[key] += tokens
+        self.writer.submit(
+            self._write, user_oid, intent, model, input_tokens, output_tokens, seconds
+        )
+
+    def _write(self, user_oid, intent, model, input_tokens, output_tokens, seconds):
+        now = datetime.now(timezone.utc)
+        try:
+            self.col.update_one(
+                {"userId": user_oid, "hour": hour_of(now), "intent": intent, "model": model},
+                {
+                    "$inc": {
+                        "calls": 1,
+                        "inputTokens": input_tokens,
+                        "outputTokens": output_tokens,
+                        "latencyMs": round(seconds * 1000),
+                    },
+                    "$setOnInsert": {"expiresAt": now + timedelta(days=USAGE_TTL_DAYS)},
+                },
+                upsert=True,
+            )
+        except Exception:
+            log.exception("llm usage write failed")
+
+    # ---------- windows ----------
+    def used(self, user_oid=None, hours: int = 24) -> int:
+        """Tokens in the last `hours` hourly buckets for a user (None = everyone)."""
+        key = (user_oid, hours)
+        with self.lock:
+            cached = self.totals.get(key)
+        if cached is not None:
+            return cached
+        since = hour_of(datetime.now(timezone.utc)) - timedelta(hours=hours - 1)
+        match = {"hour": {"$gte": since}}
+        if user_oid is not None:
+            match["userId"] = user_oid
+        rows = list(
+            self.col.aggregate(
+                [
+                    {"$match": match},
+                    {"$group": {"_id": None, "tokens": {"$sum": {"$add": ["$inputTokens", "$outputTokens"]}}}},
+                ]
+            )
+        )
+        total = rows[0]["tokens"] if rows else 0
+        with self.lock:
+            self.totals[key] = total
+        return total
+
+    def pressure(self, user_oid) -> float:
+        """max(user used/budget over 24h, global used/budget over 1h); 0 without budgets."""
+        ratios = [0.0]
+        if USER_TOKENS_PER_DAY and user_oid is not None:
+            ratios.append(self.used(user_oid, 24) / USER_TOKENS_PER_DAY)
+        if GLOBAL_TOKENS_PER_HOUR:
+            ratios.append(self.used(None, 1) / GLOBAL_TOKENS_PER_HOUR)
+        return max(ratios)
+
+    # ---------- degradation ----------
+    def context_budget(self, user_oid, base: int) -> int:
+        """Chat context token budget: `base` until SOFT_LIMIT, then down to MIN_CONTEXT_TOKENS."""
+        try:
+            p = self.pressure(user_oid)
+        except Exception:
+            log.exception("llm usage lookup failed")
+            return base
+        if p <= SOFT_LIMIT:
+            return base
+        floor = min(MIN_CONTEXT_TOKENS, base)
+        scale = max(0.0, 1 - (p - SOFT_LIMIT) / ((1 - SOFT_LIMIT) or 1))
+        return int(floor + (base - floor) * scale)
+
+    def allow_background(self, user_oid) -> bool:
+        """False once the user or the fleet is out of budget (classification waits)."""
+        try:
+            return self.pressure(user_oid) < 1
+        except Exception:
+            log.exception("llm usage lookup failed")
+            return True
@@ -0,0 +1,312 @@
+"""
+Offline stand-ins used by the benchmarks (dev-only: pip install mongomock).
+
+- local_db(): an in-memory mongomock database. mongomock 4.x predates the
+  `sort` argument pymongo 4.15 passes to update ops inside bulk_write; the
+  shim drops it (none of our bulk updates sort).
+- CanvasStub: a local HTTP server speaking enough of the Canvas API
+  (courses, paginated assignments, Link headers, X-Rate-Limit-Remaining)
+  for api.canvas to fetch from.
+- GoogleStub: a local HTTP server standing in for the Calendar API
+  (events.list with sync tokens, events.watch, channels.stop) that POSTs
+  Google's push notifications to the watching channels' addresses, and
+  Webhook, a local receiver for them (see api/google_push.py).
+- stub_gemini(): replaces the Gemini classification call with a cheap
+  deterministic answer.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import mongomock
+from mongomock.collection import BulkOperationBuilder
+
+_add_update = BulkOperationBuilder.add_update
+
+
+def _add_update_compat(self, *args, sort=None, **kwargs):
+    return _add_update(self, *args, **kwargs)
+
+
+BulkOperationBuilder.add_update = _add_update_compat
+
+
+def local_db(name: str = "horai_bench"):
+    return mongomock.MongoClient()[name]
+
+
+def make_user(db, **fields):
+    return db["users"].insert_one({"email": f"bench{time.time_ns()}@local", **fields}).inserted_id
+
+
+class CanvasStub:
+    """
+    Serves /api/v1/courses and /api/v1/courses/<id>/assignments from
+    {course_id: [assignment]} with `per_page` items per page and an optional
+    per-request latency (seconds) to imitate the real round trip.
+    """
+
+    def __init__(self, assignments: dict, per_page: int = 100, latency: float = 0.0):
+        self.assignments = assignments
+        self.per_page = per_page
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                page = int(parse_qs(url.query).get("page", ["1"])[0])
+                parts = url.path.rstrip("/").split("/")
+                if parts[-1] == "courses":
+                    items = [
+                        {"id": cid, "name": f"Course {cid}", "term": {"name": "Fall 2025"}}
+                        for cid in stub.assignments
+                    ]
+                else:
+                    items = stub.assignments.get(int(parts[-2]), [])
+                last = max(1, -(-len(items) // stub.per_page))
+                body = items[(page - 1) * stub.per_page : page * stub.per_page]
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-Rate-Limit-Remaining", "650.0")
+                if last > 1:
+                    base = f"http://127.0.0.1:{self.server.server_port}{url.path}"
+                    links = [f'<{base}?page={last}&per_page={stub.per_page}>; rel="last"']
+                    if page < last:
+                        links.append(f'<{base}?page={page + 1}&per_page={stub.per_page}>; rel="next"')
+                    self.send_header("Link", ", ".join(links))
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode("utf-8"))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GoogleStub:
+    """
+    The slice of Calendar v3 the Google sync and push channels use, for one
+    user's primary calendar:
+
+      GET  calendars/primary/events       full list, or the changes since
+                                          syncToken (410 once expire_tokens())
+      POST calendars/primary/events/watch open a channel, then send "sync"
+      POST channels/stop
+
+    change() / cancel() edit an event as the user would in Google Calendar
+    and POST an "exists" notification to every open channel, with the
+    X-Goog-* headers Google sends; they return the webhook's status codes.
+    Point api.clients at api_endpoint (google_endpoint()) to sync from it.
+    """
+
+    RESOURCE_ID = "stub-primary-calendar"
+
+    def __init__(self, events=(), max_ttl_seconds: int = 7 * 24 * 3600):
+        self.events = {}  # id -> event
+        self.versions = {}  # id -> version of its last change
+        self.version = 0
+        self.oldest_token = 0
+        self.max_ttl = max_ttl_seconds
+        self.channels = {}  # id -> {"address", "token", "expiration", "messages"}
+        self.notifications = []  # (channel id, state, webhook status)
+        self.requests = 0
+        self.lock = threading.Lock()
+        for ev in events:
+            self._put(ev)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=None):
+                self.send_response(status)
+                if body is None:
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = json.dumps(body).encode("utf-8")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                stub.requests += 1
+                url = urlparse(self.path)
+                if not url.path.endswith("/calendars/primary/events"):
+                    return self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+                self._reply(*stub.list_events(parse_qs(url.query).get("syncToken", [None])[0]))
+
+            def do_POST(self):
+                stub.requests += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = urlparse(self.path).path
+                if path.endswith("/calendars/primary/events/watch"):
+                    self._reply(200, stub.open_channel(body))
+                elif path.endswith("/channels/stop"):
+                    with stub.lock:
+                        stub.channels.pop(body.get("id"), None)
+                    self._reply(204)
+                else:
+                    self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.api_endpoint = f"{self.base_url}/calendar/v3/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _put(self, event: dict):
+        with self.lock:
+            self.version += 1
+            self.events[event["id"]] = event
+            self.versions[event["id"]] = self.version
+
+    def list_events(self, sync_token):
+        with self.lock:
+            if sync_token is None:
+                items = [ev for ev in self.events.values() if ev.get("status") != "cancelled"]
+            elif int(sync_token) < self.oldest_token:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+            else:
+                since = int(sync_token)
+                items = [self.events[i] for i, v in self.versions.items() if v > since]
+            return 200, {"items": items, "nextSyncToken": str(self.version)}
+
+    def expire_tokens(self):
+        """Every sync token handed out so far answers 410 Gone."""
+        with self.lock:
+            self.oldest_token = self.version + 1
+
+    def open_channel(self, body: dict) -> dict:
+        ttl = min(int((body.get("params") or {}).get("ttl") or self.max_ttl), self.max_ttl)
+        expiration = int((time.time() + ttl) * 1000)
+        with self.lock:
+            self.channels[body["id"]] = {
+                "address": body["address"],
+                "token": body.get("token"),
+                "expiration": expiration,
+                "messages": 0,
+            }
+        # Google confirms a new channel with a "sync" message, right after answering
+        threading.Timer(0.01, self.notify, args=(body["id"], "sync")).start()
+        return {
+            "kind": "api#channel",
+            "id": body["id"],
+            "resourceId": self.RESOURCE_ID,
+            "resourceUri": f"{self.api_endpoint}calendars/primary/events",
+            "token": body.get("token"),
+            "expiration": str(expiration),
+        }
+
+    def notify(self, channel_id: str, state: str = "exists") -> int:
+        """POST one notification for channel_id; returns the webhook's status (0 if unreachable)."""
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                return 0
+            channel["messages"] += 1
+            headers = {
+                "X-Goog-Channel-ID": channel_id,
+                "X-Goog-Channel-Token": channel["token"] or "",
+                "X-Goog-Channel-Expiration": formatdate(channel["expiration"] / 1000, usegmt=True),
+                "X-Goog-Resource-ID": self.RESOURCE_ID,
+                "X-Goog-Resource-URI": f"{self.api_endpoint}calendars/primary/events",
+                "X-Goog-Resource-State": state,
+                "X-Goog-Message-Number": str(channel["messages"]),
+            }
+            address = channel["address"]
+        request = urllib.request.Request(address, data=b"", headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        self.notifications.append((channel_id, state, status))
+        return status
+
+    def change(self, event: dict) -> list:
+        """Create/update an event, then notify every open channel."""
+        self._put(event)
+        return [self.notify(cid) for cid in list(self.channels)]
+
+    def cancel(self, event_id: str) -> list:
+        return self.change({**self.events[event_id], "status": "cancelled"})
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Webhook:
+    """Local receiver for GoogleStub's POSTs: handle(headers) -> HTTP status, run inline."""
+
+    def __init__(self, handle):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.send_response(handle(self.headers))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/googleNotify"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@contextmanager
+def google_endpoint(stub: GoogleStub):
+    """Calendar clients built inside (any thread) talk to stub instead of Google."""
+    import api.clients
+
+    saved = api.clients.GOOGLE_API_ENDPOINT
+    api.clients.GOOGLE_API_ENDPOINT = stub.api_endpoint
+    try:
+        yield
+    finally:
+        api.clients.GOOGLE_API_ENDPOINT = saved
+
+
+@contextmanager
+def stub_gemini():
+    """Gemini classification -> isFlexible = even title length."""
+    import api.classifier
+    import api.functions
+
+    def classify(tasks, meter=None):
+        return {str(t["_id"]): len(t.get("title") or "") % 2 == 0 for t in tasks}
+
+    saved = api.classifier.classify_tasks_batch, api.functions.classify_tasks_batch
+    api.classifier.classify_tasks_batch = api.functions.classify_tasks_batch = classify
+    try:
+        yield
+    finally:
+        api.classifier.classify_tasks_batch, api.functions.classify_tasks_batch = saved
@@ -0,0 +1,107 @@
+"""
+/getTasks payload benchmark: serializer x shape x encoding for one user.
+
+Builds synthetic task documents (Canvas-sized HTML descriptions on a third of
+them), converts them with task_to_client, and times each JSON provider and
+compression on the result. Offline, no Mongo.
+
+    python -m bench.payload [--tasks 10000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+
+from api.serialize import PROVIDERS, brotli, compress
+from api.storage import task_to_client, tasks_to_columns
+
+
+def synthetic_tasks(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    start = datetime(2025, 9, 1, 8)
+    docs = []
+    for i in range(n):
+        begin = start + timedelta(hours=rnd.randrange(0, 24 * 120))
+        timed = rnd.random() < 0.6
+        desc = ""
+        if rnd.random() < 0.33:
+            desc = "<p>" + " ".join(rnd.choice(("read", "chapter", "submit", "lab", "proof", "essay")) for _ in range(60)) + "</p>"
+        docs.append(
+            {
+                "_id": ObjectId(),
+                "title": f"Task {i} " + rnd.choice(("HW", "Lecture", "Reading", "Project", "Exam")),
+                "description": desc,
+                "startTime": begin.strftime("%Y-%m-%dT%H:%M") if timed else None,
+                "endTime": (begin + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M") if timed else None,
+                "dueDate": begin.strftime("%Y-%m-%dT%H:%M"),
+                "priority": rnd.choice(("low", "med", "high")),
+            }
+        )
+    return docs
+
+
+def best_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(min(times) * 1000, 2)
+
+
+def run(n_tasks: int = 10000, repeat: int = 5) -> list:
+    app = Flask(__name__)
+    docs = synthetic_tasks(n_tasks)
+    rows = [task_to_client(t) for t in docs]
+    shapes = {"rows": rows, "columns": tasks_to_columns(rows)}
+    encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+
+    results = []
+    for provider_name, provider_cls in PROVIDERS.items():
+        try:
+            provider = provider_cls(app)
+            provider.dumps({})
+        except Exception as e:  # orjson not installed
+            print(f"skip {provider_name}: {e}")
+            continue
+        for shape, tasks in shapes.items():
+            payload = {"status": "SUCCES", "tasks": tasks, "nextCursor": None}
+            body = provider.dumps(payload).encode("utf-8")
+            ms = best_ms(lambda: provider.dumps(payload), repeat)
+            for enc in encodings:
+                out = body if enc == "identity" else compress(body, enc)
+                enc_ms = 0.0 if enc == "identity" else best_ms(lambda: compress(body, enc), repeat)
+                results.append(
+                    {
+                        "provider": provider_name,
+                        "shape": shape,
+                        "encoding": enc,
+                        "serialize_ms": ms,
+                        "compress_ms": enc_ms,
+                        "bytes": len(out),
+                    }
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.tasks, args.repeat)
+    print(f"{args.tasks} tasks (best of {args.repeat})")
+    print(f"{'provider':8} {'shape':8} {'encoding':9} {'dumps ms':>9} {'compress ms':>12} {'bytes':>10}")
+    for r in results:
+        print(
+            f"{r['provider']:8} {r['shape']:8} {r['encoding']:9} "
+            f"{r['serialize_ms']:>9} {r['compress_ms']:>12} {r['bytes']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Offline benchmark suite for the ingestion, conversion and chat hot paths.
+
+Runs against an in-memory Mongo stand-in (mongomock) with Canvas served by a
+local stub and Gemini stubbed out, so numbers only move when our code does.
+
+    python -m bench.suite                         # quick profile, print table
+    python -m bench.suite --profile full --save   # -> bench/baselines/full.json
+    python -m bench.suite --compare               # vs bench/baselines/<profile>.json
+    python -m bench.suite --only merge_ --repeat 7
+
+--compare exits 1 if any case's median is more than --threshold (default 25%)
+slower than the baseline. Results are JSON:
+  {"meta": {...}, "results": {"<case>[<size>]": {"n", "best_ms", "median_ms", "us_per_item"}}}
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from bench import synthetic
+from bench.local import CanvasStub, GoogleStub, Webhook, google_endpoint, local_db, make_user, stub_gemini
+
+from api.actions import action_from_call
+from api.canvas import assignments_to_tasks, fetch_assignments
+from api.classifier import FlexibilityClassifier
+from api.context import build_context
+from api.functions import (
+    gcal_event_to_task,
+    merge_canvas_tasks,
+    merge_google_events,
+    normalize_canvas_task,
+    sync_google_calendar,
+)
+from api.google_push import PushChannels
+from api.intervals import FixedIndex, find_conflicts
+from api.recurrence import occurrences
+from api.scheduler import plan_autoschedule
+from api.serialize import make_json_provider
+from api.storage import CLIENT_PROJECTION, TaskStore, task_to_client, tasks_to_columns
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+PROFILES = {
+    "quick": {"tasks": [100, 2000], "events": [100, 500], "courses": [1, 5]},
+    "full": {"tasks": [100, 2000, 10000, 50000], "events": [100, 2500], "courses": [1, 20]},
+}
+
+# name -> (size axis, fn(size) -> (n_items, prepare)); prepare() sets up a
+# fresh state (untimed) and returns the zero-arg callable that is timed.
+CASES = {}
+
+
+def case(name: str, axis: str):
+    def register(fn):
+        CASES[name] = (axis, fn)
+        return fn
+
+    return register
+
+
+def _user_with_tasks(n_tasks: int):
+    """A user with n unrelated (manual/ai) tasks next to whatever the case syncs."""
+    db = local_db()
+    store = TaskStore(db)
+    oid = make_user(db)
+    docs = synthetic.tasks(n_tasks, sources=("manual", "ai"))
+    if docs:
+        store.apply(oid, inserts=docs)
+    return db, store, oid
+
+
+# ---------- conversion ----------
+@case("gcal_event_to_task", "events")
+def bench_gcal_event_to_task(n):
+    events = synthetic.google_events(n)
+    oid = ObjectId()
+    return n, lambda: lambda: [gcal_event_to_task(ev, oid) for ev in events]
+
+
+@case("canvas_to_tasks", "courses")
+def bench_canvas_to_tasks(n):
+    by_course = synthetic.canvas_assignments(n)
+    items = sum(len(a) for a in by_course.values())
+
+    def run():
+        for assignments in by_course.values():
+            for raw in assignments_to_tasks(assignments):
+                normalize_canvas_task(raw)
+
+    return items, lambda: run
+
+
+@case("action_from_call", "fixed")
+def bench_action_from_call(_):
+    calls = synthetic.ai_calls(1000)
+    return len(calls), lambda: lambda: [action_from_call(name, args) for name, args in calls]
+
+
+@case("gettasks_convert", "tasks")
+def bench_gettasks_convert(n):
+    """The /getTasks loop: task_to_client over a page + JSON body."""
+    from flask import Flask
+
+    provider = make_json_provider(Flask(__name__))
+    docs = [{k: t.get(k) for k in ("_id", *CLIENT_PROJECTION)} for t in synthetic.tasks(n)]
+
+    def run():
+        provider.dumps({"tasks": [task_to_client(t) for t in docs]})
+
+    return n, lambda: run
+
+
+@case("gettasks_columns", "tasks")
+def bench_gettasks_columns(n):
+    from flask import Flask
+
+    provider = make_json_provider(Flask(__name__))
+    docs = [{k: t.get(k) for k in ("_id", *CLIENT_PROJECTION)} for t in synthetic.tasks(n)]
+
+    def run():
+        provider.dumps({"tasks": tasks_to_columns([task_to_client(t) for t in docs])})
+
+    return n, lambda: run
+
+
+# ---------- ingestion (mongomock) ----------
+@case("merge_google_initial", "events")
+def bench_merge_google_initial(n):
+    events = synthetic.google_events(n)
+
+    def prepare():
+        db, store, oid = _user_with_tasks(0)
+        return lambda: merge_google_events(store, oid, [dict(ev) for ev in events])
+
+    return n, prepare
+
+
+@case("merge_google_resync", "events")
+def bench_merge_google_resync(n):
+    """Full resync where 10% of the events changed; user also has 2k other tasks."""
+    events = synthetic.google_events(n)
+    moved = synthetic.changed(events, 0.1)
+
+    def prepare():
+        db, store, oid = _user_with_tasks(2000)
+        merge_google_events(store, oid, [dict(ev) for ev in events])
+        return lambda: merge_google_events(store, oid, moved, prune_after="2025-01-01T00:00")
+
+    return n, prepare
+
+
+@case("merge_canvas_resync", "courses")
+def bench_merge_canvas_resync(n):
+    by_course = synthetic.canvas_assignments(n)
+    raw = [t for a in by_course.values() for t in assignments_to_tasks(a)]
+    now = datetime.utcnow()
+    window = ((now).strftime("%Y-%m-%dT%H:%M"), (now + timedelta(weeks=2)).strftime("%Y-%m-%dT%H:%M"))
+
+    def prepare():
+        db, store, oid = _user_with_tasks(2000)
+        merge_canvas_tasks(store, oid, [dict(t) for t in raw], window)
+        return lambda: merge_canvas_tasks(store, oid, [dict(t) for t in raw], window)
+
+    return len(raw), prepare
+
+
+@case("canvas_fetch", "courses")
+def bench_canvas_fetch(n):
+    """fetch_assignments against the local stub (5 ms per request, 3 pages per course)."""
+    by_course = synthetic.canvas_assignments(n, per_course=60)
+    stub = CanvasStub(by_course, per_page=20, latency=0.005)  # daemon thread, lives for the run
+    return n, lambda: lambda: fetch_assignments("token", stub.base_url, list(by_course))
+
+
+@case("classify", "tasks")
+def bench_classify(n):
+    """Cold classifier (rules, Mongo cache, stubbed Gemini) over a user's tasks."""
+    docs = synthetic.tasks(n)
+
+    def prepare():
+        classifier = FlexibilityClassifier(local_db())
+
+        def run():
+            with stub_gemini():
+                classifier.classify(docs)
+
+        return run
+
+    return n, prepare
+
+
+@case("google_push_sync", "events")
+def bench_google_push_sync(n):
+    """
+    One event edited in (stub) Google Calendar -> notification -> /googleNotify
+    handling -> incremental sync, for a user with n events. The webhook waits
+    for the sync, which runs on a worker thread like the job pool's.
+    """
+    events = synthetic.google_events(n, start=datetime.utcnow())
+    stub = GoogleStub(events)  # daemon threads, live for the run
+    worker = ThreadPoolExecutor(max_workers=1)
+    db, store, oid = _user_with_tasks(0)
+    users = db["users"]
+    users.update_one({"_id": oid}, {"$set": {"google": {"access_token": "a", "refresh_token": "r"}}})
+    tokens_for = lambda google: {"access_token": google["access_token"], "refresh_token": google.get("refresh_token")}
+
+    def sync(user_oid):
+        push.started(user_oid)
+        google = users.find_one({"_id": user_oid}, {"google": 1})["google"]
+        with google_endpoint(stub):
+            return sync_google_calendar(store, users, user_oid, tokens_for(google))
+
+    def handle(headers):
+        status, user_oid = push.notify(headers)
+        if user_oid is not None:
+            worker.submit(sync, user_oid).result()
+        return status
+
+    push = PushChannels(users, tokens_for, address=Webhook(handle).url)
+    with google_endpoint(stub):
+        worker.submit(sync, oid).result()
+        push.ensure(oid, users.find_one({"_id": oid})["google"])
+    seq = iter(range(10**9))
+
+    def prepare():
+        ev = events[next(seq) % n]
+        edited = {**ev, "summary": f"{ev['summary']} (edited {next(seq)})"}
+        return lambda: stub.change(edited)
+
+    return 1, prepare
+
+
+# ---------- chat ----------
+@case("build_context", "tasks")
+def bench_build_context(n):
+    docs = synthetic.tasks(n, start=datetime(2025, 9, 20, 8))
+    convo = [{"role": "user", "parts": ["move my Reading 12 and the Project to friday"]}]
+    now = datetime(2025, 10, 1, 9)
+    return n, lambda: lambda: build_context(docs, convo, now=now)
+
+
+@case("autoschedule", "tasks")
+def bench_autoschedule(n):
+    docs = synthetic.tasks(n, start=datetime(2025, 10, 1, 8), days=30)
+    now = datetime(2025, 10, 1, 8)
+    return n, lambda: lambda: plan_autoschedule(docs, now=now)
+
+
+@case("overlap_check", "tasks")
+def bench_overlap_check(n):
+    """find_conflicts for 200 proposed timed tasks against n stored ones."""
+    index = FixedIndex(synthetic.tasks(n, start=datetime(2025, 10, 1, 8), days=30))
+    proposed = {
+        t["_id"]: t
+        for t in synthetic.tasks(200, seed=7, start=datetime(2025, 10, 1, 8), days=30)
+        if t["startTime"]
+    }
+    return len(proposed), lambda: lambda: find_conflicts(index, proposed)
+
+
+@case("expand_series", "events")
+def bench_expand_series(n):
+    """/getTasks occurrences of n weekly series over a 4-week window."""
+    docs = synthetic.recurring_tasks(n)
+    return n, lambda: lambda: occurrences(docs, datetime(2025, 10, 1), datetime(2025, 10, 29))
+
+
+# ---------- runner ----------
+def measure(prepare, repeat: int):
+    times = []
+    for _ in range(repeat):
+        fn = prepare()
+        with contextlib.redirect_stdout(io.StringIO()):  # the code under test prints
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+    return min(times) * 1000, statistics.median(times) * 1000
+
+
+def run(profile: str = "quick", repeat: int = 5, only: str = None, out=sys.stdout):
+    sizes = PROFILES[profile]
+    results = {}
+    for name, (axis, fn) in CASES.items():
+        if only and only not in name:
+            continue
+        for size in sizes.get(axis, [None]):
+            key = name if size is None else f"{name}[{axis}={size}]"
+            n, prepare = fn(size)
+            best, median = measure(prepare, repeat)
+            results[key] = {
+                "n": n,
+                "best_ms": round(best, 3),
+                "median_ms": round(median, 3),
+                "us_per_item": round(median * 1000 / max(n, 1), 3),
+            }
+            print(f"{key:42} n={n:<6} best {best:9.2f} ms  median {median:9.2f} ms", file=out)
+    return results
+
+
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """-> list of (case, baseline ms, current ms, ratio) slower than the threshold."""
+    regressions = []
+    print(f"\n{'case':42} {'base ms':>10} {'now ms':>10} {'ratio':>7}")
+    for key, cur in results.items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        ratio = cur["median_ms"] / max(base["median_ms"], 1e-6)
+        flag = "  <-- slower" if ratio > 1 + threshold else ""
+        print(f"{key:42} {base['median_ms']:>10.2f} {cur['median_ms']:>10.2f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append((key, base["median_ms"], cur["median_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run cases whose name contains this")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--save", action="store_true", help="write bench/baselines/<profile>.json")
+    parser.add_argument(
+        "--compare", nargs="?", const="", help="baseline JSON (default bench/baselines/<profile>.json)"
+    )
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+    logging.getLogger("api").setLevel(logging.WARNING)  # the code under test logs at INFO
+
+    results = run(args.profile, args.repeat, args.only)
+    report = {
+        "meta": {
+            "profile": args.profile,
+            "repeat": args.repeat,
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+    default_baseline = os.path.join(BASELINE_DIR, f"{args.profile}.json")
+    regressions = []
+    if args.compare is not None:
+        with open(args.compare or default_baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    paths = [args.out] if args.out else []
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        paths.append(default_baseline)
+    for path in paths:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"wrote {path}")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) more than {args.threshold:.0%} slower than baseline")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
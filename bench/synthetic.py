@@ -0,0 +1,173 @@
+"""
+Deterministic synthetic data for the benchmarks: stored tasks, raw Canvas
+assignments and raw Google Calendar events shaped like the real APIs.
+"""
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+T0 = datetime(2025, 9, 1, 8)
+WORDS = ("read", "chapter", "submit", "lab", "proof", "essay", "review", "notes", "quiz", "draft")
+TITLES = ("HW", "Lecture", "Reading", "Project", "Exam", "Lab", "Meeting", "Study group")
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M")
+
+
+def _html(rnd, words: int) -> str:
+    return "<p>" + " ".join(rnd.choice(WORDS) for _ in range(words)) + "</p>"
+
+
+def tasks(n: int, seed: int = 1, start: datetime = T0, days: int = 120,
+          sources=("manual", "google", "canvas", "ai")):
+    """Stored task documents (no userId) spread over `days`, ~60% timed."""
+    rnd = random.Random(seed)
+    docs = []
+    for i in range(n):
+        begin = start + timedelta(minutes=30 * rnd.randrange(0, days * 48))
+        timed = rnd.random() < 0.6
+        source = rnd.choice(sources)
+        docs.append(
+            {
+                "_id": ObjectId(),
+                "source": source,
+                "externalId": f"{source}-{i}" if source in ("google", "canvas") else None,
+                "title": f"{rnd.choice(TITLES)} {i}",
+                "description": _html(rnd, 40) if rnd.random() < 0.33 else "",
+                "startTime": _fmt(begin) if timed else None,
+                "endTime": _fmt(begin + timedelta(minutes=30 * rnd.randint(1, 4))) if timed else None,
+                "dueDate": _fmt(begin + timedelta(days=rnd.randint(0, 5))),
+                "estimatedMinutes": 30 * rnd.randint(1, 6),
+                "minutesTaken": 0,
+                "isFlexible": not timed,
+                "status": "todo",
+                "priority": rnd.choice(("low", "med", "high")),
+                "createdAt": "2025-09-01T00:00:00+00:00",
+                "updatedAt": "2025-09-01T00:00:00+00:00",
+            }
+        )
+    return docs
+
+
+def recurring_tasks(n: int, seed: int = 6, start: datetime = T0):
+    """Stored recurring-series masters (weekly, some bounded by COUNT) with a few exdates."""
+    rnd = random.Random(seed)
+    docs = []
+    for i in range(n):
+        begin = start + timedelta(days=rnd.randrange(0, 7), hours=rnd.randrange(0, 10))
+        days = ",".join(sorted(rnd.sample(("MO", "TU", "WE", "TH", "FR"), rnd.randint(1, 3))))
+        rule = f"RRULE:FREQ=WEEKLY;BYDAY={days}" + (f";COUNT={rnd.randint(10, 40)}" if rnd.random() < 0.3 else "")
+        docs.append(
+            {
+                "_id": ObjectId(),
+                "source": "google",
+                "externalId": f"series{i:05d}",
+                "title": f"{rnd.choice(TITLES)} {i}",
+                "description": "",
+                "startTime": _fmt(begin),
+                "endTime": _fmt(begin + timedelta(minutes=30 * rnd.randint(1, 4))),
+                "dueDate": None,
+                "priority": "med",
+                "recurrence": [rule],
+                "exdates": [_fmt(begin + timedelta(weeks=rnd.randint(1, 8)))],
+                "seriesEnd": None,
+            }
+        )
+    return docs
+
+
+def canvas_assignments(courses: int, per_course: int = 40, seed: int = 2, now: datetime = None):
+    """{course_id: [raw Canvas assignment]}; about half are due in the next two weeks."""
+    rnd = random.Random(seed)
+    now = now or datetime.utcnow()
+    out = {}
+    for c in range(courses):
+        cid = 1000 + c
+        items = []
+        for j in range(per_course):
+            due = now + timedelta(hours=rnd.randint(-24 * 14, 24 * 28))
+            items.append(
+                {
+                    "id": cid * 1000 + j,
+                    "course_id": cid,
+                    "name": f"{rnd.choice(TITLES)} {c}.{j}",
+                    "description": _html(rnd, 120),
+                    "due_at": due.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "points_possible": rnd.choice((10, 20, 100)),
+                }
+            )
+        out[cid] = items
+    return out
+
+
+def google_events(n: int, seed: int = 3, start: datetime = T0):
+    """Raw events.list items: timed (with offsets / Z) and all-day."""
+    rnd = random.Random(seed)
+    events = []
+    for i in range(n):
+        begin = start + timedelta(minutes=30 * rnd.randrange(0, 120 * 48))
+        if rnd.random() < 0.15:
+            day = begin.date()
+            span = {
+                "start": {"date": day.isoformat()},
+                "end": {"date": (day + timedelta(days=1)).isoformat()},
+            }
+        else:
+            end = begin + timedelta(minutes=30 * rnd.randint(1, 4))
+            tz = rnd.choice(("Z", "-04:00", "+00:00"))
+            span = {
+                "start": {"dateTime": begin.strftime("%Y-%m-%dT%H:%M:%S") + tz},
+                "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%S") + tz},
+            }
+        events.append(
+            {
+                "id": f"evt{i:06d}",
+                "status": "confirmed",
+                "summary": f"{rnd.choice(TITLES)} {i}",
+                "description": " ".join(rnd.choice(WORDS) for _ in range(15)),
+                **span,
+            }
+        )
+    return events
+
+
+def changed(events, fraction: float, seed: int = 4):
+    """Copy of events with `fraction` of them retitled (what a resync would see)."""
+    rnd = random.Random(seed)
+    out = []
+    for ev in events:
+        if rnd.random() < fraction:
+            ev = {**ev, "summary": ev["summary"] + " (moved)"}
+        out.append(ev)
+    return out
+
+
+def ai_calls(n: int, seed: int = 5):
+    """(name, args) function calls as Gemini returns them for the chat intents."""
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        day = f"2025-10-0{i % 9 + 1}"
+        out.append(
+            rnd.choice(
+                (
+                    ("reschedule", {"id": str(ObjectId()), "startTime": f"{day}T10:00", "endTime": f"{day}T11:00"}),
+                    (
+                        "add",
+                        {
+                            "title": "Study for quiz",
+                            "description": "ch 4",
+                            "startTime": f"{day}T15:00",
+                            "endTime": f"{day}T16:00",
+                            "estimatedMinutes": 60.0,
+                            "priority": "high",
+                        },
+                    ),
+                    ("remove", {"id": str(ObjectId())}),
+                    ("autoschedule", {"summary": "Scheduling your flexible tasks"}),
+                )
+            )
+        )
+    return out
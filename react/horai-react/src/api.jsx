@@ -10,4 +10,5 @@ export const endpoints = {
   calendarToken: () => `${BACKEND.base}/calendarToken`,
   eventsUnified: () => `${BACKEND.base}/getTasks`,
   canvasToken: () => `${BACKEND.base}/canvasToken`,
+  jobStatus: () => `${BACKEND.base}/jobStatus`,
 }
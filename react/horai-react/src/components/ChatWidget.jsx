@@ -37,7 +37,8 @@ const userID = localStorage.getItem('userID')
     setInput('')
 
     try {
-      const res = await fetch(`${backendBase}/chat`, {
+      // streamed over SSE so the reply shows up as Gemini writes it
+      const res = await fetch(`${backendBase}/chatStream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         // backend expects: { convo: [{ role, parts: ['...'] }, ...] }
@@ -45,23 +46,29 @@ const userID = localStorage.getItem('userID')
         credentials: 'include', // keep cookies if your backend uses them
       })
 
-      if (!res.ok) {
+      if (!res.ok || !res.body) {
         const txt = await safeText(res)
         throw new Error(`Chat failed (${res.status}): ${txt}`)
       }
 
-      const data = await res.json().catch(() => ({}))
-
-      // Expect backend returns something like { reply: "..." }
-      // If your backend returns the full updated convo, adopt it instead.
-      const botText =
-        data.chatMessage ||
-        'Done'
-
-      setConversation(cur => [
-        ...cur,
-        { role: 'model', parts: [String(botText)] },
-      ])
+      // placeholder bot bubble that chunks are appended to
+      let botText = ''
+      setConversation(cur => [...cur, { role: 'model', parts: [''] }])
+      const setBotText = text =>
+        setConversation(cur => [...cur.slice(0, -1), { role: 'model', parts: [text] }])
+
+      for await (const { event, data } of readSSE(res.body)) {
+        if (event === 'chunk') {
+          botText += data.text
+          setBotText(botText)
+        } else if (event === 'done') {
+          setBotText(data.chatMessage || botText || 'Done')
+        } else if (event === 'action') {
+          setBotText(data.chatMessage || (data.status === 'SUCCESS' ? 'Done' : data.message || 'Something went wrong'))
+        } else if (event === 'error') {
+          throw new Error(data.message || 'Chat failed')
+        }
+      }
 
     } catch (e) {
       console.error('Chat error:', e)
@@ -139,6 +146,30 @@ const userID = localStorage.getItem('userID')
   )
 }
 
+// Parse a text/event-stream body into { event, data } objects
+async function* readSSE(body) {
+  const reader = body.getReader()
+  const decoder = new TextDecoder()
+  let buf = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buf += decoder.decode(value, { stream: true })
+    let idx
+    while ((idx = buf.indexOf('\n\n')) !== -1) {
+      const raw = buf.slice(0, idx)
+      buf = buf.slice(idx + 2)
+      let event = 'message'
+      let data = ''
+      for (const line of raw.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+      yield { event, data: data ? JSON.parse(data) : {} }
+    }
+  }
+}
+
 async function safeText(res) {
   try { return await res.text() } catch { return '' }
 }
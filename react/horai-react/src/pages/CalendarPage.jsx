@@ -3,30 +3,53 @@ import { endpoints } from '../api'
 import BigCalendar from '../components/BigCalendar'
 import ToastCalendar from '../components/ToastCalendar'
 
+// request body -> { etag, data } of the last /getTasks response, so an
+// unchanged page comes back as an empty 304 instead of the full task list
+const pageCache = new Map()
+// `${userID}|${from}|${to}` -> { syncCursor, byId }: the week as last seen,
+// patched with deltas (changed tasks + removed ids) on every later load
+const weekCache = new Map()
+
 export default function CalendarPage() {
   const [events, setEvents] = useState([])
   const [date, setDate] = useState(new Date())
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const userID = localStorage.getItem('userID')
+  // strings, so re-renders that hand us a new Date for the same week don't refetch
+  const { from, to } = weekWindow(date)
   const load = useCallback(async (signal) => {
     if (!userID) return
     setLoading(true)
     setError('')
     try {
-      const res = await fetch(endpoints.eventsUnified(), {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ userID }),
-        signal,
-      })
-      if (!res.ok) {
-        const msg = await safeText(res)
-        throw new Error(`Failed to fetch unified schedule (${res.status}): ${msg}`)
+      const key = `${userID}|${from}|${to}`
+      let week = weekCache.get(key)
+      let delta = null
+      if (week) {
+        try {
+          delta = await fetchPages({ userID, since: week.syncCursor }, signal)
+        } catch (e) {
+          if (e.status !== 410) throw e // 410: cursor too old, start over
+        }
+      }
+      if (delta) {
+        // occurrences of recurring series are keyed `${seriesId}_${stamp}`: a
+        // re-sent series replaces all of its old ones, a removed one drops them
+        dropSeries(week.byId, [...(delta.series || []), ...(delta.removed || [])])
+        for (const t of delta.tasks) {
+          if (inWindow(t, from, to)) week.byId.set(t.id, t)
+          else week.byId.delete(t.id)
+        }
+        for (const id of delta.removed || []) week.byId.delete(id)
+        week.syncCursor = delta.syncCursor
+      } else {
+        // only ask for the visible week
+        const full = await fetchPages({ userID, from, to }, signal)
+        week = { syncCursor: full.syncCursor, byId: new Map(full.tasks.map(t => [t.id, t])) }
+        weekCache.set(key, week)
       }
-      const data = await res.json()
-      console.log(data)
-      setEvents(data.tasks || [])
+      setEvents([...week.byId.values()])
     } catch (e) {
       if (e.name !== 'AbortError') {
         console.error('Fetch /getTasks error:', e)
@@ -35,7 +58,7 @@ export default function CalendarPage() {
     } finally {
       setLoading(false)
     }
-  }, [userID])
+  }, [userID, from, to])
 
   useEffect(() => {
     const ac = new AbortController()
@@ -69,6 +92,70 @@ export default function CalendarPage() {
   )
 }
 
+function dropSeries(byId, seriesIds) {
+  if (!seriesIds.length) return
+  const prefixes = seriesIds.map(id => `${id}_`)
+  for (const key of [...byId.keys()]) {
+    if (prefixes.some(p => key.startsWith(p))) byId.delete(key)
+  }
+}
+
+// All pages of one /getTasks query (following nextCursor); syncCursor,
+// removed and series come with the first page.
+async function fetchPages(params, signal) {
+  const tasks = []
+  let first = null
+  let cursor = null
+  do {
+    const body = JSON.stringify({ ...params, cursor })
+    const cached = pageCache.get(body)
+    const headers = { 'Content-Type': 'application/json' }
+    if (cached) headers['If-None-Match'] = cached.etag
+    const res = await fetch(endpoints.eventsUnified(), {
+      method: 'POST',
+      headers,
+      body,
+      signal,
+    })
+    let data
+    if (res.status === 304 && cached) {
+      data = cached.data
+    } else if (!res.ok) {
+      const msg = await safeText(res)
+      const err = new Error(`Failed to fetch unified schedule (${res.status}): ${msg}`)
+      err.status = res.status
+      throw err
+    } else {
+      data = await res.json()
+      const etag = res.headers.get('ETag')
+      if (etag) pageCache.set(body, { etag, data })
+    }
+    first = first || data
+    tasks.push(...(data.tasks || []))
+    cursor = data.nextCursor
+  } while (cursor)
+  return { tasks, syncCursor: first.syncCursor, removed: first.removed, series: first.series }
+}
+
+// same rule as the server's window query: timed tasks overlapping the week,
+// untimed ones due inside it (times are 'YYYY-MM-DDTHH:MM', so strings compare)
+function inWindow(t, from, to) {
+  if (t.startTime) return t.startTime < to && !!t.endTime && t.endTime > from
+  return !!t.dueDate && t.dueDate >= from && t.dueDate < to
+}
+
+// Toast UI's week view starts on Sunday (startDayOfWeek: 0)
+function weekWindow(date) {
+  const start = new Date(date.getFullYear(), date.getMonth(), date.getDate() - date.getDay())
+  const end = new Date(start); end.setDate(end.getDate() + 7)
+  const iso = d => `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}T00:00`
+  return { from: iso(start), to: iso(end) }
+}
+
+function pad(n) {
+  return String(n).padStart(2, '0')
+}
+
 function formatHeaderRange(date) {
   const start = new Date(date)
   const end = new Date(date); end.setDate(end.getDate() + 6)
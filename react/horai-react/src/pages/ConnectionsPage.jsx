@@ -1,6 +1,31 @@
 import React, { useCallback, useEffect, useState } from 'react'
 import { endpoints } from '../api' // uses your endpoints.calendarToken() and endpoints.login()
 
+const JOB_POLL_MS = 1000
+const JOB_TIMEOUT_MS = 2 * 60 * 1000
+
+// /canvasToken and /calendarToken answer 202 with a jobID and sync in the
+// background; poll /jobStatus until that job is done or failed
+async function waitForJob(userID, jobID, onStatus) {
+  const deadline = Date.now() + JOB_TIMEOUT_MS
+  while (Date.now() < deadline) {
+    const r = await fetch(endpoints.jobStatus(), {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ userID, jobID }),
+      credentials: 'include',
+    })
+    const data = await r.json().catch(() => ({}))
+    if (!r.ok) throw new Error(data.message || r.statusText)
+    const { status, error } = data.job
+    if (status === 'done') return data.job
+    if (status === 'failed') throw new Error(error || 'sync failed')
+    onStatus(status)
+    await new Promise((resolve) => window.setTimeout(resolve, JOB_POLL_MS))
+  }
+  throw new Error('timed out waiting for the sync')
+}
+
 export default function Connections() {
   const userID = localStorage.getItem('userID')
   const [gisReady, setGisReady] = useState(false)
@@ -45,7 +70,14 @@ export default function Connections() {
             })
             const data = await r.json().catch(() => ({}))
             if (r.ok) {
-              setGoogleStatus('Google Calendar connected ✔')
+              setGoogleStatus('Tokens saved, syncing your calendar...')
+              try {
+                await waitForJob(userID, data.jobID, (status) =>
+                  setGoogleStatus(`Tokens saved, sync ${status}...`))
+                setGoogleStatus('Google Calendar connected ✔')
+              } catch (err) {
+                setGoogleStatus(`Connected, but the sync failed: ${err.message}`)
+              }
             } else {
               setGoogleStatus(`Failed: ${data.error || r.statusText}`)
             }
@@ -81,8 +113,15 @@ export default function Connections() {
       })
       const data = await resp.json().catch(()=> ({}))
       if (resp.ok) {
-        setCanvasStatus('Canvas token saved ✔')
         setCanvasToken('')
+        setCanvasStatus('Token saved, importing assignments...')
+        try {
+          await waitForJob(userID, data.jobID, (status) =>
+            setCanvasStatus(`Token saved, import ${status}...`))
+          setCanvasStatus('Canvas token saved ✔')
+        } catch (err) {
+          setCanvasStatus(`Token saved, but the import failed: ${err.message}`)
+        }
       } else {
         setCanvasStatus(`Error saving token: ${data.error || resp.statusText}`)
       }
@@ -91,7 +130,7 @@ export default function Connections() {
     } finally {
       setBusy(false)
     }
-  }, [canvasToken])
+  }, [canvasToken, userID])
 
   return (
     <section className="integrations-card">
@@ -0,0 +1,52 @@
+"""
+Offline fixtures: Mongo is mongomock and Google is bench.local.GoogleStub
+(pip install -r bench/requirements.txt).
+"""
+import time
+
+import mongomock
+import pymongo
+import pytest
+
+from bench.local import local_db, make_user  # also installs the mongomock bulk_write shim
+
+
+@pytest.fixture
+def db():
+    return local_db(f"horai_test_{time.time_ns()}")
+
+
+@pytest.fixture
+def user_oid(db):
+    return make_user(db)
+
+
+@pytest.fixture(scope="session")
+def backend():
+    """api.backend (the Flask app) on an in-memory Mongo."""
+    # api.backend binds MongoClient at import; the driver is only patched
+    # for that import, so nothing else gets mongomock by accident
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("MONGODB_DB", "horai_test")
+        mp.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+        import api.backend
+
+    return api.backend
+
+
+@pytest.fixture
+def wait_for_jobs(backend):
+    """wait_for_jobs(user_oid): block until none of the user's jobs is queued or running."""
+
+    def wait(user_oid, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = backend.job_runner.col.count_documents(
+                {"userId": user_oid, "status": {"$in": ["queued", "running"]}}
+            )
+            if not pending:
+                return
+            time.sleep(0.02)
+        raise AssertionError("background jobs did not finish")
+
+    return wait
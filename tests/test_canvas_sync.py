@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+import api.functions
+from api.functions import getAllCanvasTasks
+from bench.local import CanvasStub
+
+
+@pytest.fixture
+def canvas(monkeypatch):
+    stub = CanvasStub({})
+    monkeypatch.setattr(api.functions, "CANVAS_URL", stub.base_url)
+    yield stub
+    stub.close()
+
+
+def test_account_without_courses_is_empty_not_failed(canvas):
+    assert getAllCanvasTasks("token") == []
+
+
+def test_unreachable_canvas_is_a_failure(canvas):
+    canvas.close()
+    assert getAllCanvasTasks("token") is None
+
+
+def test_canvas_sync_of_an_empty_account_succeeds(backend, canvas, monkeypatch, wait_for_jobs):
+    monkeypatch.setattr(backend, "run_batch_classification", lambda *a, **k: None)
+    user_oid = backend.users_col.insert_one(
+        {"email": f"canvas{time.time_ns()}@local", "canvas": {"access_token": "token"}}
+    ).inserted_id
+    job_id = backend.job_runner.enqueue("canvas_sync", user_oid, {"userID": str(user_oid)})
+    wait_for_jobs(user_oid)
+    job = backend.job_runner.col.find_one({"_id": job_id})
+    assert job["status"] == "done", job
+    assert job["result"]["canvasTasks"] == 0
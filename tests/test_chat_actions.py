@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+
+from api.context import context_window
+from api.recurrence import expand
+from api.scheduler import format_time, local_now
+
+
+@pytest.fixture
+def user_oid(backend):
+    return backend.users_col.insert_one({"email": f"chat{time.time_ns()}@local"}).inserted_id
+
+
+def task(**fields):
+    return {
+        "_id": ObjectId(),
+        "source": "ai",
+        "externalId": None,
+        "estimatedMinutes": 60,
+        "minutesTaken": 0,
+        "status": "todo",
+        "priority": "med",
+        **fields,
+    }
+
+
+def run(backend, user_oid, actions):
+    raw_tasks = expand(backend.task_store.find(user_oid), *context_window())
+    with backend.app.app_context():
+        resp, status = backend.apply_ai_actions(user_oid, actions, raw_tasks)
+        return resp.get_json(), status
+
+
+def test_autoschedule_past_the_chat_window_avoids_series_occurrences(backend, user_oid):
+    today = local_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    free_day = today + timedelta(days=20)
+    store = backend.task_store
+    # busy every day until free_day, so the plan lands well past context_window()
+    store.insert(user_oid, task(title="Trip", isFlexible=False, startTime=format_time(today), endTime=format_time(free_day)))
+    store.insert(
+        user_oid,
+        task(
+            source="google",
+            externalId="lab",
+            title="Lab",
+            startTime=format_time(free_day - timedelta(weeks=4) + timedelta(hours=8)),
+            endTime=format_time(free_day - timedelta(weeks=4) + timedelta(hours=12)),
+            recurrence=["RRULE:FREQ=WEEKLY"],
+            exdates=[],
+            seriesEnd=None,
+        ),
+    )
+    essay = task(title="Essay", isFlexible=True, estimatedMinutes=120, dueDate=format_time(free_day + timedelta(days=2)))
+    store.insert(user_oid, essay)
+
+    body, status = run(backend, user_oid, [{"intent": "autoschedule"}])
+    assert status == 200, body
+    assert body["scheduled"] == 1 and body["unscheduled"] == []
+    [changed] = body["changed"]
+    assert (changed["startTime"], changed["endTime"]) == (
+        format_time(free_day + timedelta(hours=12)),
+        format_time(free_day + timedelta(hours=14)),
+    )
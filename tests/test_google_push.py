@@ -0,0 +1,173 @@
+"""
+Google push end to end: GoogleStub -> Webhook -> /googleNotify (Flask test
+client) -> google_sync job -> events.list on the stub -> tasks.
+"""
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from bench.local import GoogleStub, Webhook, google_endpoint
+
+
+def event(id, summary, day=3):
+    start = (datetime.utcnow() + timedelta(days=day)).replace(hour=15, minute=0, second=0, microsecond=0)
+    return {
+        "id": id,
+        "status": "confirmed",
+        "summary": summary,
+        "start": {"dateTime": f"{start:%Y-%m-%dT%H:%M:%S}Z"},
+        "end": {"dateTime": f"{start + timedelta(hours=1):%Y-%m-%dT%H:%M:%S}Z"},
+    }
+
+
+def post_notify(backend, headers):
+    return backend.app.test_client().post("/googleNotify", headers=dict(headers.items())).status_code
+
+
+@pytest.fixture
+def google(backend, monkeypatch, wait_for_jobs):
+    """A Google-connected user, synced once, with a watch channel on the stub."""
+    stub = GoogleStub([event("seminar", "Seminar"), event("standup", "Standup", day=4)])
+    webhook = Webhook(lambda headers: post_notify(backend, headers))
+    monkeypatch.setattr(backend.push_channels, "address", webhook.url)
+    monkeypatch.setattr(backend, "run_batch_classification", lambda *a, **k: None)
+    user_oid = backend.users_col.insert_one(
+        {"email": f"push{time.time_ns()}@local", "google": {"access_token": "a", "refresh_token": "r"}}
+    ).inserted_id
+
+    with google_endpoint(stub):
+        backend.job_runner.enqueue("google_sync", user_oid, {"userID": str(user_oid)})
+        wait_for_jobs(user_oid)
+        channel = backend.users_col.find_one({"_id": user_oid})["google"]["channel"]
+        yield SimpleNamespace(stub=stub, user_oid=user_oid, channel=channel)
+    webhook.close()
+    stub.close()
+
+
+def titles(backend, user_oid):
+    return sorted(t["title"] for t in backend.task_store.find(user_oid, {"source": "google"}))
+
+
+def headers_for(channel, **overrides):
+    return {
+        "X-Goog-Channel-ID": channel["id"],
+        "X-Goog-Channel-Token": channel["token"],
+        "X-Goog-Resource-ID": channel["resourceId"],
+        "X-Goog-Resource-State": "exists",
+        **overrides,
+    }
+
+
+def test_edit_in_google_reaches_tasks(backend, google, wait_for_jobs):
+    assert titles(backend, google.user_oid) == ["Seminar", "Standup"]
+    assert list(google.stub.channels) == [google.channel["id"]]
+
+    assert google.stub.change(event("seminar", "Seminar (moved online)")) == [200]
+    wait_for_jobs(google.user_oid)
+    assert titles(backend, google.user_oid) == ["Seminar (moved online)", "Standup"]
+
+    assert google.stub.cancel("standup") == [200]
+    wait_for_jobs(google.user_oid)
+    assert titles(backend, google.user_oid) == ["Seminar (moved online)"]
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"X-Goog-Channel-Token": "not-the-token"},
+        {"X-Goog-Channel-Token": ""},
+        {"X-Goog-Resource-ID": "someone-elses-calendar"},
+        {"X-Goog-Channel-ID": "unknown-channel"},
+    ],
+)
+def test_notification_that_does_not_match_the_channel_is_rejected(backend, google, monkeypatch, overrides):
+    queued = []
+    monkeypatch.setattr(backend.job_runner, "enqueue", lambda *args: queued.append(args))
+    assert post_notify(backend, headers_for(google.channel, **overrides)) == 404
+    assert queued == []
+    assert post_notify(backend, headers_for(google.channel)) == 200
+    assert len(queued) == 1
+
+
+def test_burst_of_notifications_queues_one_sync(backend, google, monkeypatch):
+    queued = []
+    monkeypatch.setattr(backend.job_runner, "enqueue", lambda *args: queued.append(args))
+
+    statuses = [google.stub.notify(google.channel["id"]) for _ in range(5)]
+    assert statuses == [200] * 5
+    assert [(kind, oid) for kind, oid, _ in queued] == [("google_sync", google.user_oid)]
+
+    # a "sync" confirmation never queues anything
+    assert google.stub.notify(google.channel["id"], "sync") == 200
+    assert len(queued) == 1
+
+    # once the queued sync starts, the next change queues another one
+    backend.push_channels.started(google.user_oid)
+    assert google.stub.notify(google.channel["id"]) == 200
+    assert len(queued) == 2
+
+
+def test_renew_replaces_an_expiring_channel(backend, google, wait_for_jobs):
+    old = google.channel
+    backend.users_col.update_one(
+        {"_id": google.user_oid}, {"$set": {"google.channel.expiresAt": datetime.utcnow() + timedelta(hours=1)}}
+    )
+    assert backend.push_channels.renew() == 1
+
+    new = backend.users_col.find_one({"_id": google.user_oid})["google"]["channel"]
+    assert new["id"] != old["id"] and new["token"] != old["token"]
+    assert new["expiresAt"] > datetime.utcnow() + timedelta(days=6)
+    assert list(google.stub.channels) == [new["id"]]  # the old one was stopped
+    assert post_notify(backend, headers_for(old)) == 404
+
+    assert google.stub.change(event("seminar", "Seminar (renewed)")) == [200]
+    wait_for_jobs(google.user_oid)
+    assert "Seminar (renewed)" in titles(backend, google.user_oid)
+
+    # a fresh channel is left alone
+    assert backend.push_channels.renew() == 0
+
+
+def test_failing_watches_back_off_and_do_not_block_renewals(db, monkeypatch):
+    from api import google_push
+    from api.google_push import PushChannels
+
+    now = datetime(2026, 10, 19, 12, 0)
+    watched = []
+
+    def watch(tokens, channel_id, address, token, ttl):
+        if tokens["refresh_token"] == "revoked":
+            raise RuntimeError("invalid_grant")
+        watched.append(tokens["refresh_token"])
+        return {"resourceId": "primary", "expiration": str(int((time.time() + ttl) * 1000))}
+
+    monkeypatch.setattr(google_push, "watch_google_calendar", watch)
+    monkeypatch.setattr(google_push, "stop_google_channel", lambda *args: None)
+    monkeypatch.setattr(google_push, "RENEW_BATCH", 1)
+    channels = PushChannels(db["users"], lambda google: dict(google), address="https://example.test/googleNotify")
+    revoked = db["users"].insert_one({"google": {"access_token": "a", "refresh_token": "revoked"}}).inserted_id
+    db["users"].insert_one(
+        {
+            "google": {
+                "access_token": "a",
+                "refresh_token": "healthy",
+                "channel": {"id": "c1", "resourceId": "primary", "token": "t", "expiresAt": now + timedelta(hours=1)},
+            }
+        }
+    )
+
+    assert channels.renew(now) == 0  # no channel sorts first: the revoked user
+    google = db["users"].find_one({"_id": revoked})["google"]
+    assert google["channelFailures"] == 1
+    assert google["channelRetryAt"] == now + timedelta(seconds=google_push.RETRY_SECONDS)
+
+    assert channels.renew(now) == 1  # backing off, so the healthy user gets the batch
+    assert watched == ["healthy"]
+
+    later = now + timedelta(seconds=google_push.RETRY_SECONDS)
+    assert channels.renew(later) == 0
+    google = db["users"].find_one({"_id": revoked})["google"]
+    assert google["channelFailures"] == 2
+    assert google["channelRetryAt"] == later + timedelta(seconds=2 * google_push.RETRY_SECONDS)
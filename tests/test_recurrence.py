@@ -0,0 +1,227 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from api.functions import merge_google_events
+from api.recurrence import expand, occurrences, parse_occurrence_id, series_fields
+from api.storage import TaskStore
+
+TZ = "America/New_York"
+
+
+def master(**fields):
+    return {
+        "_id": ObjectId(),
+        "source": "google",
+        "externalId": "lec",
+        "title": "Lecture",
+        "startTime": "2026-10-05T09:00",
+        "endTime": "2026-10-05T10:00",
+        "recurrence": ["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=6"],
+        "exdates": [],
+        **fields,
+    }
+
+
+def starts(docs):
+    return [t["startTime"] for t in docs]
+
+
+# ---------- series_fields ----------
+def test_until_is_converted_to_the_event_wall_time():
+    ev = {
+        "start": {"dateTime": "2026-12-01T10:00:00-05:00", "timeZone": TZ},
+        "recurrence": ["RRULE:FREQ=DAILY;UNTIL=20261203T150000Z", "EXDATE;TZID=America/New_York:20261202T100000"],
+    }
+    fields = series_fields(ev, "2026-12-01T10:00", "2026-12-01T11:00")
+    assert fields["recurrence"] == [
+        "RRULE:FREQ=DAILY;UNTIL=20261203T100000",
+        "EXDATE;TZID=America/New_York:20261202T100000",
+    ]
+    assert fields["seriesEnd"] == "2026-12-03T11:00"
+
+
+def test_until_without_a_known_time_zone_is_read_as_wall_time():
+    for start in ({"dateTime": "2026-12-01T10:00:00Z"}, {"dateTime": "2026-12-01T10:00:00Z", "timeZone": "Nowhere/City"}):
+        ev = {"start": start, "recurrence": ["RRULE:FREQ=DAILY;UNTIL=20261203T100000Z"]}
+        fields = series_fields(ev, "2026-12-01T10:00", "2026-12-01T11:00")
+        assert fields["recurrence"] == ["RRULE:FREQ=DAILY;UNTIL=20261203T100000"]
+
+
+def test_series_end_only_for_bounded_rules():
+    ev = {"start": {"timeZone": TZ}, "recurrence": ["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=6"]}
+    assert series_fields(ev, "2026-10-05T09:00", "2026-10-05T10:00")["seriesEnd"] == "2026-10-21T10:00"
+    ev["recurrence"] = ["RRULE:FREQ=WEEKLY;BYDAY=MO"]
+    assert series_fields(ev, "2026-10-05T09:00", "2026-10-05T10:00")["seriesEnd"] is None
+
+
+# ---------- occurrences ----------
+def test_occurrences_in_window_skip_exdates_and_overrides():
+    m = master(exdates=["2026-10-07T09:00"])
+    override = {
+        "_id": ObjectId(),
+        "source": "google",
+        "externalId": "lec_20261012T130000Z",
+        "title": "Lecture (room change)",
+        "recurringEventId": "lec",
+        "originalStartTime": "2026-10-12T09:00",
+        "startTime": "2026-10-12T11:00",
+        "endTime": "2026-10-12T12:00",
+    }
+    out = occurrences([m, override], "2026-10-05T09:30", "2026-10-20T00:00")
+    # 10-05 still running at the window start; 10-07 exdated; 10-12 overridden
+    assert starts(out) == ["2026-10-05T09:00", "2026-10-14T09:00", "2026-10-19T09:00"]
+    first = out[0]
+    assert first["_id"] == f"{m['_id']}_20261005T0900"
+    assert first["seriesId"] == m["_id"]
+    assert (first["endTime"], first["dueDate"], first["title"]) == ("2026-10-05T10:00", "2026-10-05T10:00", "Lecture")
+    assert "recurrence" not in first and "exdates" not in first
+
+    tasks = expand([m, override, {"_id": ObjectId(), "title": "Essay"}], datetime(2026, 10, 1), datetime(2026, 11, 1))
+    assert sorted(t["title"] for t in tasks).count("Lecture") == 4  # 6 minus the exdate, the override is kept as is
+    assert len(tasks) == 6
+
+
+def test_parse_occurrence_id():
+    oid = ObjectId()
+    assert parse_occurrence_id(f"{oid}_20261005T0900") == (oid, "2026-10-05T09:00")
+    assert parse_occurrence_id(str(oid)) is None
+    assert parse_occurrence_id(f"{oid}_20261345T0900") is None
+    assert parse_occurrence_id(None) is None
+
+
+# ---------- merge_google_events ----------
+def event(id, start, end, **fields):
+    return {
+        "id": id,
+        "status": "confirmed",
+        "start": {"dateTime": f"{start}:00-04:00", "timeZone": TZ},
+        "end": {"dateTime": f"{end}:00-04:00", "timeZone": TZ},
+        **fields,
+    }
+
+
+LECTURE = event(
+    "lec", "2026-10-05T09:00", "2026-10-05T10:00",
+    summary="Lecture", recurrence=["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=6"],
+)
+
+
+def cancelled(stamp):
+    return {
+        "id": f"lec_{stamp}",
+        "status": "cancelled",
+        "recurringEventId": "lec",
+        "originalStartTime": {"dateTime": f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}T09:00:00-04:00", "timeZone": TZ},
+    }
+
+
+ROOM_CHANGE = event(
+    "lec_20261012T130000Z", "2026-10-12T11:00", "2026-10-12T12:00",
+    summary="Lecture (room change)",
+    recurringEventId="lec",
+    originalStartTime={"dateTime": "2026-10-12T09:00:00-04:00", "timeZone": TZ},
+)
+FULL = "2026-10-01T00:00"
+
+
+def calendar(store, user_oid):
+    return [(t["startTime"], t["title"]) for t in sorted(expand(store.find(user_oid), FULL, "2026-11-01T00:00"), key=lambda t: t["startTime"])]
+
+
+def stored_exdates(store, user_oid):
+    return store.find(user_oid, {"externalId": "lec"})[0]["exdates"]
+
+
+def test_full_sync_stores_cancellations_and_overrides(db, user_oid):
+    store = TaskStore(db)
+    merge_google_events(store, user_oid, [LECTURE, cancelled("20261007"), ROOM_CHANGE], prune_after=FULL)
+    assert stored_exdates(store, user_oid) == ["2026-10-07T09:00"]
+    assert calendar(store, user_oid) == [
+        ("2026-10-05T09:00", "Lecture"),
+        ("2026-10-12T11:00", "Lecture (room change)"),
+        ("2026-10-14T09:00", "Lecture"),
+        ("2026-10-19T09:00", "Lecture"),
+        ("2026-10-21T09:00", "Lecture"),
+    ]
+
+
+def test_incremental_sync_adds_exdates_full_resync_replaces_them(db, user_oid):
+    store = TaskStore(db)
+    merge_google_events(store, user_oid, [LECTURE, cancelled("20261007")], prune_after=FULL)
+
+    # only the new cancellation comes back
+    merge_google_events(store, user_oid, [cancelled("20261014")])
+    assert stored_exdates(store, user_oid) == ["2026-10-07T09:00", "2026-10-14T09:00"]
+
+    # an edited master comes back with its new cancellation only; the old ones stay
+    merge_google_events(store, user_oid, [{**LECTURE, "summary": "Lecture 2"}, cancelled("20261019")])
+    assert stored_exdates(store, user_oid) == ["2026-10-07T09:00", "2026-10-14T09:00", "2026-10-19T09:00"]
+
+    # a full resync returns every cancellation: 10-07 and 10-14 were restored
+    merge_google_events(store, user_oid, [LECTURE, cancelled("20261019")], prune_after=FULL)
+    assert stored_exdates(store, user_oid) == ["2026-10-19T09:00"]
+    assert [s for s, _ in calendar(store, user_oid)] == [
+        "2026-10-05T09:00", "2026-10-07T09:00", "2026-10-12T09:00", "2026-10-14T09:00", "2026-10-21T09:00",
+    ]
+
+
+def test_override_is_updated_in_place(db, user_oid):
+    store = TaskStore(db)
+    merge_google_events(store, user_oid, [LECTURE, ROOM_CHANGE], prune_after=FULL)
+    moved = event(
+        ROOM_CHANGE["id"], "2026-10-13T09:00", "2026-10-13T10:00",
+        summary="Lecture (moved)", recurringEventId="lec", originalStartTime=ROOM_CHANGE["originalStartTime"],
+    )
+    counts = merge_google_events(store, user_oid, [moved])
+    assert counts["changed"] == 1 and counts["added"] == 0
+    assert list(store.find(user_oid, {"recurringEventId": "lec"}, {"_id": 0, "startTime": 1, "title": 1})) == [
+        {"startTime": "2026-10-13T09:00", "title": "Lecture (moved)"}
+    ]
+    assert ("2026-10-12T09:00", "Lecture") not in calendar(store, user_oid)
+
+
+def test_cancelled_series_takes_its_overrides(db, user_oid):
+    store = TaskStore(db)
+    other = event("gym", "2026-10-06T18:00", "2026-10-06T19:00", summary="Gym")
+    merge_google_events(store, user_oid, [LECTURE, ROOM_CHANGE, other], prune_after=FULL)
+
+    counts = merge_google_events(store, user_oid, [{"id": "lec", "status": "cancelled"}])
+    assert counts["removed"] == 2
+    assert calendar(store, user_oid) == [("2026-10-06T18:00", "Gym")]
+
+
+def test_full_resync_prunes_series_google_no_longer_returns(db, user_oid):
+    store = TaskStore(db)
+    open_ended = event("club", "2026-09-01T17:00", "2026-09-01T18:00", summary="Club", recurrence=["RRULE:FREQ=WEEKLY"])
+    ended = event("old", "2026-09-01T08:00", "2026-09-01T09:00", summary="Old", recurrence=["RRULE:FREQ=DAILY;COUNT=3"])
+    merge_google_events(store, user_oid, [LECTURE, open_ended, ended], prune_after=FULL)
+
+    merge_google_events(store, user_oid, [], prune_after=FULL)
+    # series running past the sync start are gone; one that ended before it is left alone
+    assert [t["externalId"] for t in store.find(user_oid)] == ["old"]
+
+
+def test_full_resync_keeps_local_overrides(db, user_oid):
+    store = TaskStore(db)
+    merge_google_events(store, user_oid, [LECTURE], prune_after=FULL)
+    local = {
+        "_id": ObjectId(),
+        "source": "google",
+        "externalId": None,  # a chat reschedule of the 10-12 occurrence
+        "title": "Lecture",
+        "recurringEventId": "lec",
+        "originalStartTime": "2026-10-12T09:00",
+        "startTime": "2026-10-12T13:00",
+        "endTime": "2026-10-12T14:00",
+        "dueDate": "2026-10-12T14:00",
+    }
+    store.insert(user_oid, local)
+    # a new one-off event with the same title and dueDate must not take the override over
+    same = event("makeup", "2026-10-12T13:00", "2026-10-12T14:00", summary="Lecture")
+
+    counts = merge_google_events(store, user_oid, [LECTURE, same], prune_after=FULL)
+    assert counts["added"] == 1
+    kept = store.find_one(user_oid, local["_id"])
+    assert (kept["externalId"], kept["recurringEventId"]) == (None, "lec")
+    assert ("2026-10-12T09:00", "Lecture") not in calendar(store, user_oid)
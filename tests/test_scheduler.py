@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from api import scheduler
+from api.scheduler import local_now, plan_autoschedule
+
+NOW = datetime(2026, 10, 19, 9, 5)  # a Monday, wall time
+
+
+def flexible(title, due, minutes=60, **fields):
+    return {
+        "_id": ObjectId(),
+        "title": title,
+        "dueDate": due,
+        "estimatedMinutes": minutes,
+        "minutesTaken": 0,
+        "isFlexible": True,
+        "status": "todo",
+        "priority": "med",
+        **fields,
+    }
+
+
+def fixed(title, start, end, **fields):
+    return {"_id": ObjectId(), "title": title, "startTime": start, "endTime": end, "isFlexible": False, **fields}
+
+
+def placed(plan, tasks):
+    by_id = {str(t["_id"]): t["title"] for t in tasks}
+    return {by_id[c["id"]]: (c["startTime"], c["endTime"]) for c in plan["changes"]}
+
+
+def test_earliest_deadline_goes_first_then_priority():
+    tasks = [
+        flexible("essay", "2026-10-23T23:59", 120),
+        flexible("lab", "2026-10-20T12:00", 60),
+        flexible("reading", "2026-10-23T23:59", 60, priority="high"),
+    ]
+    plan = plan_autoschedule(tasks, now=NOW)
+    assert plan["unscheduled"] == []
+    # starts at the next quarter hour after now
+    assert placed(plan, tasks) == {
+        "lab": ("2026-10-19T09:15", "2026-10-19T10:15"),
+        "reading": ("2026-10-19T10:15", "2026-10-19T11:15"),
+        "essay": ("2026-10-19T11:15", "2026-10-19T13:15"),
+    }
+
+
+def test_blocks_avoid_fixed_tasks_and_stay_in_the_day():
+    tasks = [
+        fixed("lecture", "2026-10-19T09:30", "2026-10-19T11:00"),
+        fixed("dinner", "2026-10-19T18:00", "2026-10-19T19:00", source="google", isFlexible=True),
+        flexible("problem set", "2026-10-21T12:00", 90),
+        flexible("review", "2026-10-21T12:00", 240),
+        flexible("late", "2026-10-21T12:00", 180),
+    ]
+    plan = placed(plan_autoschedule(tasks, now=NOW), tasks)
+    # 09:15-09:30 is too short for anything; Google events are fixed even if flagged flexible
+    assert plan == {
+        "review": ("2026-10-19T11:00", "2026-10-19T15:00"),
+        "late": ("2026-10-19T15:00", "2026-10-19T18:00"),
+        "problem set": ("2026-10-19T19:00", "2026-10-19T20:30"),
+    }
+    assert plan_autoschedule(tasks, now=NOW, day_end=20)["changes"][-1]["startTime"] == "2026-10-20T08:00"
+
+
+def test_tasks_that_cannot_meet_their_deadline_are_reported():
+    tasks = [
+        fixed("exam", "2026-10-19T10:00", "2026-10-19T22:00"),
+        flexible("too big", "2026-10-19T21:00", 90),
+        flexible("fits", "2026-10-19T21:00", 30),
+        flexible("overdue", "2026-10-18T12:00", 30),
+        flexible("done", "2026-10-25T12:00", 30, status="done"),
+        flexible("finished", "2026-10-25T12:00", 30, minutesTaken=30),
+    ]
+    plan = plan_autoschedule(tasks, now=NOW)
+    assert placed(plan, tasks) == {"fits": ("2026-10-19T09:15", "2026-10-19T09:45")}
+    assert [(u["title"], u["reason"]) for u in plan["unscheduled"]] == [
+        ("overdue", "past_due"),
+        ("too big", "no_free_slot"),
+    ]
+
+
+def test_unchanged_placements_are_not_reported():
+    task = flexible("lab", "2026-10-20T12:00", startTime="2026-10-19T09:15", endTime="2026-10-19T10:15")
+    assert plan_autoschedule([task], now=NOW)["changes"] == []
+
+
+def test_now_defaults_to_wall_time_in_the_calendar_zone(monkeypatch):
+    utc = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert abs(local_now("UTC") - utc) < timedelta(seconds=5)
+    assert timedelta(hours=-5, seconds=-5) < local_now("America/New_York") - utc < timedelta(hours=-4, seconds=5)
+
+    monkeypatch.setattr(scheduler, "local_now", lambda: NOW)
+    task = flexible("lab", "2026-10-20T12:00")
+    assert plan_autoschedule([task])["changes"][0]["startTime"] == "2026-10-19T09:15"
@@ -0,0 +1,53 @@
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from api.storage import TaskStore
+
+
+@pytest.fixture
+def store(db):
+    return TaskStore(db)
+
+
+def seed(store, user_oid, n):
+    tasks = [{"_id": ObjectId(), "title": f"task {i}"} for i in range(n)]
+    store.apply(user_oid, inserts=tasks)
+    return [t["_id"] for t in tasks]
+
+
+def tombstoned(store, user_oid):
+    return {t["_id"] for t in store.tombstones.find({"userId": user_oid})}
+
+
+def test_deletes_leave_tombstones_and_settle_the_version(store, user_oid):
+    ids = seed(store, user_oid, 3)
+    store.apply(user_oid, deletes=ids[:2])
+    assert tombstoned(store, user_oid) == set(ids[:2])
+    version, settled = store.versions(user_oid)
+    assert version == settled
+    assert sorted(store.removed_since(user_oid, 2)) == sorted(ids[:2])
+
+
+def test_failed_batch_only_tombstones_deletes_that_ran(store, user_oid):
+    ids = seed(store, user_oid, 2)
+    duplicate = {"_id": ids[0], "title": "again"}
+    with pytest.raises(BulkWriteError):
+        store.apply(user_oid, inserts=[duplicate], deletes=ids, ordered=True)
+    assert tombstoned(store, user_oid) == set()
+    assert store.col.count_documents({"userId": user_oid}) == 2
+
+
+@pytest.mark.parametrize("error", [AutoReconnect("connection reset"), TimeoutError("timed out")])
+def test_unknown_outcome_leaves_no_tombstones(store, user_oid, monkeypatch, error):
+    ids = seed(store, user_oid, 2)
+
+    def fail(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(store.col, "bulk_write", fail)
+    with pytest.raises(type(error)):
+        store.apply(user_oid, deletes=ids)
+    assert tombstoned(store, user_oid) == set()
+    version, settled = store.versions(user_oid)
+    assert version == settled  # the reservation was released
@@ -0,0 +1,64 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from api import metrics, sync_scheduler
+from api.sync_scheduler import SyncScheduler
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture
+def scheduler(db):
+    s = SyncScheduler(db["users"])
+    s.release = threading.Event()  # scheduled syncs run until this is set
+    s.provider("canvas", "canvas.access_token")(lambda oid: s.release.wait(5) and {})
+    yield s
+    s.release.set()
+
+
+def add_user(db, last_sync, **fields):
+    return db["users"].insert_one(
+        {"canvas": {"access_token": "t"}, "sync": {"canvas": {"at": last_sync, "failures": 0}}, **fields}
+    ).inserted_id
+
+
+def gauge(metric):
+    return metric.labels("canvas")._value.get()
+
+
+def test_observe_reads_the_heap_head_and_the_scanned_count(db, scheduler, monkeypatch):
+    monkeypatch.setitem(sync_scheduler.CONCURRENCY, "canvas", 1)
+    idle = timedelta(minutes=sync_scheduler.IDLE_MINUTES)
+    for days in (5, 3, 1):
+        add_user(db, NOW - idle - timedelta(days=days))
+    add_user(db, NOW)  # not due
+
+    scheduler.scan(NOW)
+    scheduler.observe(NOW)
+    assert gauge(metrics.SYNC_QUEUE_DEPTH) == 3
+    assert gauge(metrics.SYNC_LAG_SECONDS) > timedelta(days=4).total_seconds()
+
+    assert scheduler.dispatch(NOW) == 1  # the most overdue one
+    scheduler.observe(NOW)
+    assert gauge(metrics.SYNC_QUEUE_DEPTH) == 2
+    assert timedelta(days=2).total_seconds() < gauge(metrics.SYNC_LAG_SECONDS) < timedelta(days=4).total_seconds()
+
+
+def test_token_route_sync_waits_for_a_scheduled_one(db, scheduler, monkeypatch):
+    monkeypatch.setattr(sync_scheduler, "LEASE_POLL_SECONDS", 0.01)
+    user_oid = add_user(db, None)
+    # a scheduled sync of this user is running
+    assert scheduler.claim(user_oid, "canvas", None, sync_scheduler._utcnow())
+
+    ran = threading.Event()
+    job = threading.Thread(target=scheduler.run_now, args=("canvas", user_oid, lambda oid: ran.set()))
+    job.start()
+    assert not ran.wait(0.2)
+
+    scheduler.record(user_oid, "canvas")  # the scheduled sync finishes
+    job.join(5)
+    assert ran.is_set()
+    state = db["users"].find_one({"_id": user_oid})["sync"]["canvas"]
+    assert state["leaseUntil"] is None and state["failures"] == 0